@@ -6,32 +6,48 @@ import cv2
 import numpy as np
 import threading
 
+from lib.metrics_handler import CAMERA_FPS, CAMERA_FRAMES, DETECTION_DURATION, DETECTION_FPS, JPEG_ENCODE_DURATION, RateGauge
+
 module_logger = logging.getLogger('vector_playground.camera_feed_handler')
 
 class CameraStream:
-    def __init__(self, robot, object_detector, enable_high_resolution=True, interval_seconds=1):
+    def __init__(self, robot, object_detector, enable_high_resolution=True, interval_seconds=1, runtime=None):
         """
         Initializes the CameraStream for a robot.
         :param robot: The robot object.
         :param object_detector: The object detection instance to process the frames.
         :param enable_high_resolution: Whether to capture images in high resolution.
+        :param runtime: SharedRuntime to capture frames on instead of a thread of its own.
         """
         self.robot = robot
+        self.runtime = runtime
+        self.capture_job = None
         self.object_detector = object_detector
         self.interval_seconds = interval_seconds
         self.enable_high_resolution = enable_high_resolution
         self.running = False
-        self.camera_thread = threading.Thread(target=self._stream_camera, daemon=True)
+        self.camera_thread = None if runtime else threading.Thread(target=self._stream_camera, daemon=True)
         self.stream_image = None
         self.latest_image = None
 
+        # Metrics
+        self.frames_metric = CAMERA_FRAMES.labels(robot.serial)
+        self.detection_metric = DETECTION_DURATION.labels(robot.serial)
+        self.jpeg_encode_metric = JPEG_ENCODE_DURATION.labels(robot.serial)
+        self.capture_rate = RateGauge(CAMERA_FPS.labels(robot.serial))
+        self.detection_rate = RateGauge(DETECTION_FPS.labels(robot.serial))
+
     def start(self):
         """
         Starts the camera stream in a separate thread.
         """
         self.running = True
         module_logger.info(f'[{self.robot.name}-{self.robot.serial}] Starting the camera stream...')
-        self.camera_thread.start()
+        if self.runtime:
+            self.robot.camera.init_camera_feed()
+            self.capture_job = self.runtime.run_periodic(f'camera-{self.robot.serial}', self._capture_frame, .1)
+        else:
+            self.camera_thread.start()
 
     def stop(self):
         """
@@ -39,7 +55,10 @@ class CameraStream:
         """
         module_logger.info(f'[{self.robot.name}-{self.robot.serial}] Stopping the camera stream...')
         self.running = False
-        if self.camera_thread.is_alive():
+        if self.capture_job is not None:
+            self.capture_job.cancel()
+            self.capture_job = None
+        if self.camera_thread is not None and self.camera_thread.is_alive():
             try:
                 self.camera_thread.join()
             except Exception as e:
@@ -53,35 +72,42 @@ class CameraStream:
         self.robot.camera.init_camera_feed()
 
         while self.running:
+            self._capture_frame()
 
-            try:
-                latest_image = self.robot.camera._latest_image
-            except Exception as e:
-                latest_image = None
-                pass
+            # Small sleep to reduce CPU usage
+            time.sleep(.1)
 
-            if latest_image:
-                # Convert the PIL image to a NumPy array
-                frame = np.array(latest_image.raw_image)
+        #cv2.destroyAllWindows()
+        #self.robot.camera.close_camera_feed()
 
-                # Convert the image color space from RGBA to RGB
-                frame_rgb = cv2.cvtColor(frame, cv2.COLOR_RGBA2RGB)
+    def _capture_frame(self):
+        """
+        Runs the robot's latest camera image, if any, through the object detector.
+        """
+        try:
+            latest_image = self.robot.camera._latest_image
+        except Exception as e:
+            latest_image = None
+            pass
 
-                # Pass the frame to the object detector for processing
-                annotated_frame = self.object_detector.process_frame(frame_rgb)
+        if latest_image:
+            self.frames_metric.inc()
+            self.capture_rate.tick(time.perf_counter())
 
-                self.latest_image = annotated_frame
+            # Convert the PIL image to a NumPy array
+            frame = np.array(latest_image.raw_image)
 
-                # Display the annotated frame
-                #cv2.imshow(f'Robot {self.robot.serial} Camera Stream', annotated_frame)
+            # Convert the image color space from RGBA to RGB
+            frame_rgb = cv2.cvtColor(frame, cv2.COLOR_RGBA2RGB)
 
-                # Check if 'q' key is pressed
-                #if cv2.waitKey(1) & 0xFF == ord('q'):
-                #    self.running = False
-                #    break
+            # Pass the frame to the object detector for processing
+            detection_start = time.perf_counter()
+            annotated_frame = self.object_detector.process_frame(frame_rgb)
+            detection_end = time.perf_counter()
+            self.detection_metric.observe(detection_end - detection_start)
+            self.detection_rate.tick(detection_end)
 
-            # Small sleep to reduce CPU usage
-            time.sleep(.1)
+            self.latest_image = annotated_frame
 
-        #cv2.destroyAllWindows()
-        #self.robot.camera.close_camera_feed()
\ No newline at end of file
+            # Display the annotated frame
+            #cv2.imshow(f'Robot {self.robot.serial} Camera Stream', annotated_frame)
\ No newline at end of file
@@ -0,0 +1,208 @@
+import glob
+import os
+import re
+import sys
+import textwrap
+
+try:
+    from fontTools import subset
+    from fontTools.ttLib import TTFont
+except ImportError:
+    subset = None
+    TTFont = None
+
+SOURCE_CSS = 'font_awesome/css/free.css'
+OUTPUT_CSS = 'font_awesome/css/icons.css'
+OUTPUT_FONT_PREFIX = 'icons-'
+
+# Classes every icon relies on, kept whether or not they appear in the templates
+CORE_CLASSES = {'fa', 'fa-classic', 'fa-sharp', 'fas', 'fa-solid', 'far', 'fa-regular', 'fab', 'fa-brands'}
+
+CLASS_TOKEN_PATTERN = re.compile(r'(?<![\w-])(fa[srb]?|fa-[a-z0-9]+(?:-[a-z0-9]+)*)(?![\w-])')
+SELECTOR_CLASS_PATTERN = re.compile(r'\.(-?[_a-zA-Z][\w-]*)')
+ICON_SELECTOR_PATTERN = re.compile(r'^\.(fa-[a-z0-9-]+)::?before$')
+CONTENT_PATTERN = re.compile(r'content:\s*"\\([0-9a-fA-F]+)"')
+# Subsetting starts from the TrueType files; the output is always WOFF2
+FONT_URL_PATTERN = re.compile(r'url\("([^"]+\.ttf)"\)')
+KEYFRAMES_PATTERN = re.compile(r'^@(?:-webkit-)?keyframes\s+([\w-]+)')
+
+
+def find_used_classes(root_path):
+    """
+    Collects every Font Awesome class name that appears in the templates and non-minified scripts.
+    Class names built at runtime (e.g. 'fa-' + name) cannot be found this way.
+    :param root_path: The application root.
+    :return: Set of class names.
+    """
+    paths = glob.glob(os.path.join(root_path, 'templates', '**', '*.html'), recursive=True)
+    paths += [path for path in glob.glob(os.path.join(root_path, 'static', 'js', '**', '*.js'), recursive=True)
+              if not path.endswith('.min.js')]
+
+    used = set()
+    for path in paths:
+        with open(path, 'r', encoding='utf-8') as f:
+            used.update(CLASS_TOKEN_PATTERN.findall(f.read()))
+    return used
+
+
+def parse_blocks(css):
+    """
+    Splits a stylesheet into top level (prelude, body) pairs, keeping nested at-rules intact.
+    """
+    blocks = []
+    css = re.sub(r'/\*.*?\*/', '', css, flags=re.S)
+    position = 0
+    while True:
+        start = css.find('{', position)
+        if start == -1:
+            break
+        depth = 1
+        end = start + 1
+        while depth and end < len(css):
+            if css[end] == '{':
+                depth += 1
+            elif css[end] == '}':
+                depth -= 1
+            end += 1
+        blocks.append((css[position:start].strip(), textwrap.dedent(css[start + 1:end - 1]).strip()))
+        position = end
+    return blocks
+
+
+def _filter_blocks(blocks, used, allowed, icons, font_faces):
+    """
+    Keeps the rules needed for the used icons and collects the icon code points and @font-face rules.
+    """
+    kept = []
+    for prelude, body in blocks:
+        if prelude.startswith('@font-face'):
+            font_faces.append(body)
+            continue
+
+        if prelude.startswith('@media') or prelude.startswith('@supports'):
+            inner = _filter_blocks(parse_blocks(body), used, allowed, icons, font_faces)
+            if inner:
+                kept.append((prelude, render_blocks(inner).strip()))
+            continue
+
+        keyframes = KEYFRAMES_PATTERN.match(prelude)
+        if keyframes:
+            if keyframes.group(1) in used:
+                kept.append((prelude, body))
+            continue
+
+        selectors = [selector.strip() for selector in prelude.split(',')]
+        content = CONTENT_PATTERN.search(body)
+        if content and all(ICON_SELECTOR_PATTERN.match(selector) for selector in selectors):
+            names = [ICON_SELECTOR_PATTERN.match(selector).group(1) for selector in selectors]
+            used_names = [name for name in names if name in used]
+            if used_names:
+                icons[int(content.group(1), 16)] = used_names
+                kept.append((',\n'.join(f'.{name}::before' for name in used_names), body))
+            continue
+
+        matching = [selector for selector in selectors
+                    if set(SELECTOR_CLASS_PATTERN.findall(selector)) <= allowed]
+        if matching:
+            kept.append((',\n'.join(matching), body))
+    return kept
+
+
+def render_blocks(blocks):
+    return '\n\n'.join(f'{prelude} {{\n{textwrap.indent(body, "  ")}\n}}' for prelude, body in blocks) + '\n'
+
+
+def subset_font(source_path, output_path, codepoints):
+    """
+    Writes a WOFF2 font containing only the given code points.
+    :return: True if the source font covers any of the code points.
+    """
+    font = TTFont(source_path)
+    covered = set(font.getBestCmap() or {}) & codepoints
+    if not covered:
+        return False
+
+    options = subset.Options()
+    options.flavor = 'woff2'
+    options.layout_features = ['*']
+    subsetter = subset.Subsetter(options)
+    subsetter.populate(unicodes=covered)
+    subsetter.subset(font)
+    font.flavor = 'woff2'
+    font.save(output_path)
+    return True
+
+
+def build_icon_subset(root_path):
+    """
+    Generates static/font_awesome/css/icons.css and subset WOFF2 fonts holding only the icons the UI uses.
+    :param root_path: The application root.
+    :return: Dictionary with the used icons and the sizes before and after in bytes.
+    """
+    if subset is None:
+        raise RuntimeError('fontTools is required to subset icon fonts: pip install fonttools brotli')
+
+    static_folder = os.path.join(root_path, 'static')
+    css_path = os.path.join(static_folder, SOURCE_CSS)
+    css_dir = os.path.dirname(css_path)
+    with open(css_path, 'r', encoding='utf-8') as f:
+        source_css = f.read()
+
+    used = find_used_classes(root_path)
+    icons = {}
+    font_faces = []
+    kept = _filter_blocks(parse_blocks(source_css), used, CORE_CLASSES | used, icons, font_faces)
+    codepoints = set(icons)
+
+    # Each source font is subset once even if several @font-face rules share it
+    subset_fonts = {}
+    face_blocks = []
+    source_size = len(source_css.encode('utf-8'))
+    for body in font_faces:
+        url = FONT_URL_PATTERN.search(body)
+        if url is None:
+            continue
+        source_font = os.path.normpath(os.path.join(css_dir, url.group(1)))
+        if source_font not in subset_fonts:
+            source_size += os.path.getsize(source_font)
+            output_name = OUTPUT_FONT_PREFIX + os.path.splitext(os.path.basename(source_font))[0] + '.woff2'
+            output_font = os.path.join(os.path.dirname(source_font), output_name)
+            if codepoints and subset_font(source_font, output_font, codepoints):
+                subset_fonts[source_font] = output_font
+            else:
+                subset_fonts[source_font] = None
+                if os.path.exists(output_font):
+                    os.remove(output_font)
+        output_font = subset_fonts[source_font]
+        if output_font is None:
+            continue
+
+        properties = [line.strip() for line in body.split(';') if line.strip() and not line.strip().startswith('src')]
+        relative_url = os.path.relpath(output_font, css_dir).replace(os.sep, '/')
+        properties.append(f'src: url("{relative_url}") format("woff2")')
+        face_blocks.append(('@font-face', ';\n'.join(properties) + ';'))
+
+    header = (f'/* Generated by lib/icon_subset.py from {SOURCE_CSS}. Do not edit. */\n'
+              f'/* Font Awesome Free 6.2.0 - https://fontawesome.com/license/free */\n\n')
+    output_css = header + render_blocks(kept + face_blocks)
+    with open(os.path.join(static_folder, OUTPUT_CSS), 'w', encoding='utf-8') as f:
+        f.write(output_css)
+
+    output_size = len(output_css.encode('utf-8'))
+    output_size += sum(os.path.getsize(path) for path in subset_fonts.values() if path)
+    return {
+        'icons': sorted(name for names in icons.values() for name in names),
+        'source_size': source_size,
+        'output_size': output_size,
+    }
+
+
+def main():
+    root_path = sys.argv[1] if len(sys.argv) > 1 else os.getcwd()
+    result = build_icon_subset(root_path)
+    print(f"Icons used: {', '.join(result['icons']) or 'none'}")
+    print(f"Icon CSS and fonts: {result['source_size'] / 1024:.1f} KiB -> {result['output_size'] / 1024:.1f} KiB")
+
+
+if __name__ == '__main__':
+    main()
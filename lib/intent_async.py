@@ -0,0 +1,82 @@
+"""
+Support for intents whose main is a coroutine:
+
+    async def main(robot, user_query):
+        await robot.behavior.say_text('Starting')
+        while True:
+            if robot.lift_height_mm > 60:
+                await robot.behavior.say_text('Lift is up')
+            await asyncio.sleep(0.5)
+
+Such intents run as tasks on the robot's TaskManager event loop instead of holding a thread each. The robot
+they get is an AsyncRobot: methods of the SDK components and of the controllers attached to the robot
+(robot.audio_controller, ...) become awaitables that run the blocking call on the loop's executor, while
+properties and other attributes (robot.lift_height_mm, robot.intent_data, ...) are returned as they are.
+Cancelling the intent, or its timeout, raises asyncio.CancelledError at its next await.
+"""
+
+import functools
+import inspect
+import logging
+
+try:
+    from anki_vector.util import Component
+except ImportError:
+    Component = None
+
+module_logger = logging.getLogger('vector_playground.intent_async')
+
+
+def is_async_intent(module):
+    return inspect.iscoroutinefunction(getattr(module, 'main', None))
+
+
+class AsyncRobot:
+    def __init__(self, target, loop, run_in_executor=None):
+        """
+        Wraps the robot or one of its SDK components for use from a coroutine.
+        :param target: The robot or component.
+        :param loop: The event loop whose executor runs the blocking SDK calls.
+        :param run_in_executor: Called as run_in_executor(func, *args) to start a blocking call, in place of
+            the loop's own, e.g. so the TaskManager can tell which task the call belongs to.
+        """
+        self._target = target
+        self._loop = loop
+        self._run_in_executor = run_in_executor or functools.partial(loop.run_in_executor, None)
+
+    @property
+    def sync(self):
+        """
+        The wrapped robot or component, for calls that must not go through the executor.
+        """
+        return self._target
+
+    def __getattr__(self, name):
+        value = getattr(self._target, name)
+        if Component is not None and isinstance(value, Component) or type(value).__module__.startswith('lib.'):
+            # SDK components and the controllers Vector Playground attaches to the robot
+            wrapped = AsyncRobot(value, self._loop, self._run_in_executor)
+        elif inspect.ismethod(value) or inspect.isbuiltin(value):
+            wrapped = self._awaitable(value)
+        else:
+            return value
+        # Components and methods do not change, so later lookups skip __getattr__
+        setattr(self, name, wrapped)
+        return wrapped
+
+    def _awaitable(self, method):
+        @functools.wraps(method)
+        def call(*args, **kwargs):
+            return self.run(method, *args, **kwargs)
+        return call
+
+    def run(self, func, *args, **kwargs):
+        """
+        Runs a blocking callable on the loop's executor and returns an awaitable for its result.
+        """
+        if kwargs:
+            return self._run_in_executor(functools.partial(func, *args, **kwargs))
+        return self._run_in_executor(func, *args)
+
+    def __repr__(self):
+        return f'<AsyncRobot {self._target!r}>'
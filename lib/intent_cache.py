@@ -0,0 +1,284 @@
+"""
+Result caches for intents. An intent decorates the functions whose results can be reused:
+
+    from lib.intent_cache import cached
+
+    @cached(ttl=3600)
+    def calculate_moon_phase():
+        ...
+
+or asks for a cache by name with get_cache(name), or for one robot with cache_for(robot, name).
+Entries expire after their TTL, and the least recently used entries are evicted once a cache is full.
+Caches created with persist=True are saved under the configured cache directory and loaded again after a
+restart. Hit and miss counts are listed by GET /admin/intents/cache and exported as metrics.
+"""
+
+import collections
+import functools
+import logging
+import os
+import pickle
+import re
+import tempfile
+import threading
+import time
+
+from lib.metrics_handler import INTENT_CACHE_REQUESTS
+
+module_logger = logging.getLogger('vector_playground.intent_cache')
+
+_MISSING = object()
+
+_caches = {}  # cache name -> IntentCache
+_decorated = set()  # names of caches created by @cached in this process
+_lock = threading.Lock()
+_cache_dir = None
+
+
+class IntentCache:
+    def __init__(self, name, max_entries=128, ttl=60, persist_path=None, save_interval=5, clock=time.time):
+        """
+        A TTL cache with least recently used eviction.
+        :param name: Name reported in stats and metrics.
+        :param max_entries: Entries kept before the least recently used one is evicted.
+        :param ttl: Seconds an entry is valid when set without its own TTL. None keeps entries until evicted.
+        :param persist_path: File the entries are saved to and loaded from, or None to keep them in memory.
+        :param save_interval: Minimum seconds between saves after a change. flush() saves right away.
+        :param clock: Wall clock function; expiry times are wall clock times so they survive a restart.
+        """
+        self.name = name
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.persist_path = persist_path
+        self.save_interval = save_interval
+        self.clock = clock
+        self.entries = collections.OrderedDict()  # key -> (expires at or None, value), least recently used first
+        self.computing = {}  # key -> lock held while the value is computed
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.hit_metric = INTENT_CACHE_REQUESTS.labels(name, 'hit')
+        self.miss_metric = INTENT_CACHE_REQUESTS.labels(name, 'miss')
+        self.dirty = False
+        self.last_save = 0
+        if persist_path:
+            self._load()
+
+    def _lookup(self, key, now):
+        """
+        Returns the value for key or _MISSING. Called with the lock held.
+        """
+        entry = self.entries.get(key)
+        if entry is None:
+            return _MISSING
+        expires, value = entry
+        if expires is not None and expires <= now:
+            del self.entries[key]
+            self.expirations += 1
+            self.dirty = True
+            return _MISSING
+        self.entries.move_to_end(key)
+        return value
+
+    def _count(self, hit):
+        if hit:
+            self.hits += 1
+            self.hit_metric.inc()
+        else:
+            self.misses += 1
+            self.miss_metric.inc()
+
+    def get(self, key, default=None):
+        with self.lock:
+            value = self._lookup(key, self.clock())
+            self._count(value is not _MISSING)
+        return default if value is _MISSING else value
+
+    def set(self, key, value, ttl=_MISSING):
+        """
+        Stores a value.
+        :param ttl: Seconds the value is valid, None for no expiry, or left out for the cache's TTL.
+        """
+        ttl = self.ttl if ttl is _MISSING else ttl
+        with self.lock:
+            now = self.clock()
+            self.entries[key] = (now + ttl if ttl is not None else None, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+            self.dirty = True
+        self._maybe_save()
+
+    def get_or_compute(self, key, compute, ttl=_MISSING):
+        """
+        Returns the cached value for key, or calls compute() and caches its result. Concurrent misses for
+        the same key compute it once; the other callers wait for that result.
+        """
+        with self.lock:
+            value = self._lookup(key, self.clock())
+            if value is not _MISSING:
+                self._count(True)
+                return value
+            compute_lock = self.computing.setdefault(key, threading.Lock())
+
+        with compute_lock:
+            with self.lock:
+                value = self._lookup(key, self.clock())
+                self._count(value is not _MISSING)
+            if value is not _MISSING:
+                return value
+            try:
+                value = compute()
+                self.set(key, value, ttl)
+                return value
+            finally:
+                with self.lock:
+                    if self.computing.get(key) is compute_lock:
+                        del self.computing[key]
+
+    def invalidate(self, key):
+        with self.lock:
+            if self.entries.pop(key, None) is not None:
+                self.dirty = True
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.dirty = True
+        self._maybe_save()
+
+    def stats(self):
+        with self.lock:
+            requests = self.hits + self.misses
+            return {
+                'name': self.name,
+                'entries': len(self.entries),
+                'max_entries': self.max_entries,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / requests, 4) if requests else None,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'persistent': self.persist_path is not None,
+            }
+
+    def _maybe_save(self):
+        if self.persist_path and self.clock() - self.last_save >= self.save_interval:
+            self.flush()
+
+    def flush(self):
+        """
+        Saves the entries to persist_path if they changed since the last save.
+        """
+        if not self.persist_path:
+            return
+        with self.lock:
+            if not self.dirty:
+                return
+            now = self.clock()
+            entries = [(key, expires, value) for key, (expires, value) in self.entries.items()
+                       if expires is None or expires > now]
+            self.dirty = False
+            self.last_save = now
+        try:
+            os.makedirs(os.path.dirname(self.persist_path), exist_ok=True)
+            with tempfile.NamedTemporaryFile('wb', dir=os.path.dirname(self.persist_path), delete=False) as f:
+                pickle.dump(entries, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(f.name, self.persist_path)
+        except Exception as e:
+            module_logger.warning(f"Could not save intent cache '{self.name}': {e}")
+
+    def _load(self):
+        try:
+            with open(self.persist_path, 'rb') as f:
+                entries = pickle.load(f)
+        except FileNotFoundError:
+            return
+        except Exception as e:
+            module_logger.warning(f"Ignoring unreadable intent cache file {self.persist_path}: {e}")
+            return
+        now = self.clock()
+        for key, expires, value in entries[-self.max_entries:]:
+            if expires is None or expires > now:
+                self.entries[key] = (expires, value)
+        module_logger.debug(f"Loaded {len(self.entries)} entries into intent cache '{self.name}'")
+
+
+def configure(cache_dir):
+    """
+    Sets the directory persistent caches are saved in.
+    """
+    global _cache_dir
+    _cache_dir = cache_dir
+
+
+def _persist_path(name):
+    if _cache_dir is None:
+        module_logger.warning(f"No cache directory configured, intent cache '{name}' is kept in memory")
+        return None
+    return os.path.join(_cache_dir, re.sub(r'[^A-Za-z0-9_.-]', '_', name) + '.pickle')
+
+
+def get_cache(name, max_entries=128, ttl=60, persist=False):
+    """
+    Returns the cache with this name, creating it with the given options if it does not exist yet.
+    """
+    with _lock:
+        cache = _caches.get(name)
+        if cache is None:
+            cache = IntentCache(name, max_entries, ttl, _persist_path(name) if persist else None)
+            _caches[name] = cache
+        return cache
+
+
+def cache_for(robot, name, **options):
+    """
+    Returns a cache of its own for each robot, e.g. for answers that depend on what the robot sees.
+    """
+    return get_cache(f'{getattr(robot, "serial", "robot")}/{name}', **options)
+
+
+def cached(ttl=60, max_entries=128, persist=False, key=None):
+    """
+    Caches a function's results by its arguments, which must be hashable unless key is given.
+    The cache is reachable as the function's .cache attribute. When an intent is reloaded its decorated
+    functions start with an empty cache, since the new code may compute different results.
+    :param ttl: Seconds a result is valid, or None to keep it until it is evicted.
+    :param key: Called with the function's arguments to build the cache key.
+    """
+    def decorator(func):
+        name = f'{func.__module__}.{func.__qualname__}'
+        cache = get_cache(name, max_entries, ttl, persist)
+        with _lock:
+            if name in _decorated:
+                cache.clear()
+            _decorated.add(name)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            cache_key = key(*args, **kwargs) if key else (args, tuple(sorted(kwargs.items())))
+            return cache.get_or_compute(cache_key, lambda: func(*args, **kwargs))
+
+        wrapper.cache = cache
+        return wrapper
+    return decorator
+
+
+def cache_stats():
+    with _lock:
+        caches = list(_caches.values())
+    return [cache.stats() for cache in sorted(caches, key=lambda cache: cache.name)]
+
+
+def flush_all():
+    """
+    Saves every persistent cache that changed, e.g. on shutdown.
+    """
+    with _lock:
+        caches = list(_caches.values())
+    for cache in caches:
+        cache.flush()
@@ -1,9 +1,17 @@
-import importlib
+import importlib.util
 import json
 import logging
 import os
-import subprocess
-import sys
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from lib.intent_async import is_async_intent
+from lib.intent_executor import current_execution
+from lib.intent_matcher import IntentMatcher
+from lib.intent_telemetry import TELEMETRY
+from lib.metrics_handler import INTENT_DURATION, INTENT_ERRORS
+from lib.requirements_installer import RequirementsInstaller
 
 module_logger = logging.getLogger('vector_playground.intent_controller')
 
@@ -23,34 +31,276 @@ class RequirementInstallationError(Exception):
     pass
 
 
+class IntentUnavailableError(Exception):
+    """Raised when an intent is run before its requirements are installed."""
+    pass
+
+
+class LazyIntentModule:
+    def __init__(self, loader, intent_name, module_path):
+        """
+        Stands in for an intent's module and imports it on first attribute access, so an intent's
+        dependencies are only imported once it is matched or warmed up.
+        :param loader: The IntentLoader, which does the import and records its time.
+        :param intent_name: The intent's directory name.
+        :param module_path: Path of the intent's Python file.
+        """
+        self._loader = loader
+        self._intent_name = intent_name
+        self._module_path = module_path
+        self._module = None
+        self._lock = threading.Lock()
+
+    @property
+    def is_loaded(self):
+        return self._module is not None
+
+    @property
+    def module_path(self):
+        return self._module_path
+
+    def load(self):
+        """
+        Imports the module if it has not been imported yet and returns it.
+        :raises ModuleLoadingError: If the import fails. The next access tries again.
+        """
+        if self._module is None:
+            with self._lock:
+                if self._module is None:
+                    start = time.perf_counter()
+                    module = self._loader.load_module(self._intent_name, self._module_path)
+                    self._loader.record_load_time(self._intent_name, 'import_ms', time.perf_counter() - start)
+                    self._module = module
+        return self._module
+
+    def __getattr__(self, name):
+        return getattr(self.load(), name)
+
+    def __repr__(self):
+        state = 'loaded' if self.is_loaded else 'not loaded'
+        return f'<LazyIntentModule {self._intent_name} ({state})>'
+
+
+class IntentSet:
+    def __init__(self, intents, matcher):
+        """
+        The loaded intents and the matcher compiled from them. IntentLoader replaces the whole set in one
+        assignment on reload, so a query that reads it once sees either the old or the new intents.
+        """
+        self.intents = tuple(intents)
+        self.matcher = matcher
+
+
 class IntentLoader:
-    def __init__(self, intents_path='var/intents'):
+    def __init__(self, intents_path='var/intents', fuzzy_threshold=None, cache_dir=None, workers=4, sandbox=None):
+        """
+        Loads the intents under intents_path and compiles their utterances into an IntentMatcher.
+        Intent configurations are loaded on a thread pool; each intent's Python module is imported on first
+        use (see LazyIntentModule) or by warm_up(). Missing requirements are installed in the background,
+        and the intents waiting for them are left out of matching until the install finishes.
+        :param intents_path: Directory with one subdirectory per intent.
+        :param fuzzy_threshold: Minimum score for fuzzy matches, or None to match utterances exactly only.
+        :param cache_dir: Directory the fuzzy match index is cached in.
+        :param workers: Number of intents loaded at once.
+        :param sandbox: IntentSandbox that runs intents marked "sandbox": true, or None to run every intent in-process.
+        """
         self.intents_path = intents_path
-        self.user_intents = []
+        self.fuzzy_threshold = fuzzy_threshold
+        self.cache_dir = cache_dir
+        self.workers = workers
+        self.sandbox = sandbox
+        self.intent_set = IntentSet((), None)
+        self.loaded = {}  # intent directory name -> intent configuration
+        self.fingerprints = {}  # intent directory name -> fingerprint of its files when last loaded
+        self.load_times = {}  # intent directory name -> {step: milliseconds}
+        self.reload_lock = threading.Lock()
+        self.installer = RequirementsInstaller(on_finished=self._on_requirements_installed)
+        self.warm_up_thread = None
+        self.keep_warm = False
+        self.watching = False
+        self.watch_thread = None
         self.load_all_intents()
 
+    @property
+    def user_intents(self):
+        return self.intent_set.intents
+
+    @property
+    def matcher(self):
+        return self.intent_set.matcher
 
     def load_all_intents(self):
-        # List all directories in intents_path
         module_logger.info('Loading all intents...')
-        for intent_name in os.listdir(self.intents_path):
-            module_logger.debug(f'Loading intent {intent_name}')
-            intent_dir = os.path.join(self.intents_path, intent_name)
-            if os.path.isdir(intent_dir):
+        start = time.perf_counter()
+        self.reload_changed()
+        module_logger.info(f'Loaded {len(self.user_intents)} intents in {(time.perf_counter() - start) * 1000:.1f} ms')
+        for intent_name, times in sorted(self.load_times.items()):
+            module_logger.info(f"  {intent_name}: {', '.join(f'{step} {ms:.1f}' for step, ms in times.items())}")
+        module_logger.debug(f"Loaded Intents: {"\n".join(intent.get('name') for intent in self.user_intents)}")
+
+    def is_available(self, intent):
+        """
+        Returns False while the intent's requirements are waiting to be installed or failed to install.
+        """
+        return not self.installer.is_pending(intent.get('directory'))
+
+    def _build_matcher(self, intents, previous):
+        available = [intent for intent in intents if self.is_available(intent)]
+        return IntentMatcher(available, self.fuzzy_threshold, self.cache_dir, previous=previous)
+
+    def _on_requirements_installed(self, intent_names):
+        with self.reload_lock:
+            intents = self.intent_set.intents
+            self.intent_set = IntentSet(intents, self._build_matcher(intents, self.intent_set.matcher))
+        available = [name for name in intent_names if not self.installer.is_pending(name)]
+        module_logger.info(f"Intents available after requirements install: {', '.join(available) or 'none'}")
+
+    def record_load_time(self, intent_name, step, seconds):
+        self.load_times.setdefault(intent_name, {})[step] = round(seconds * 1000, 2)
+
+    def warm_up(self, background=True):
+        """
+        Imports every intent module that has not been imported yet, so the first match does not pay for it.
+        Once called, intents reloaded later are warmed up too.
+        :param background: Import on a daemon thread instead of the caller's.
+        """
+        self.keep_warm = True
+        if background:
+            self.warm_up_thread = threading.Thread(target=self.warm_up, args=(False,), daemon=True)
+            self.warm_up_thread.start()
+            return
+
+        start = time.perf_counter()
+        for intent in self.user_intents:
+            module = intent.get('module')
+            if isinstance(module, LazyIntentModule) and not module.is_loaded:
                 try:
-                    self.load_intent(intent_name, intent_dir)
+                    module.load()
                 except Exception as e:
-                    module_logger.error(f"Error loading intent '{intent_name}': {e}")
+                    module_logger.error(f"Error importing intent '{intent.get('name')}': {e}")
+        module_logger.info(f'Warmed up intent modules in {(time.perf_counter() - start) * 1000:.1f} ms')
 
-        module_logger.debug(f"Loaded Intents: {"\n".join(intent.get('name') for intent in self.user_intents)}")
+    def preload_sandbox(self):
+        """
+        Has the sandbox workers import the sandboxed intents, so their first run does not pay for it.
+        """
+        if self.sandbox is None:
+            return
+        self.sandbox.preload([(intent['directory'], intent['module'].module_path)
+                              for intent in self.user_intents if intent.get('sandbox') and self.is_available(intent)])
+
+    def _fingerprint(self, intent_dir):
+        """
+        Returns the path, size and modification time of the files an intent is loaded from, including those
+        in its subdirectories. Dotfiles, dot directories and __pycache__ are skipped.
+        """
+        fingerprint = []
+        for root, dirs, files in os.walk(intent_dir):
+            dirs[:] = [name for name in dirs if name != '__pycache__' and not name.startswith('.')]
+            for name in files:
+                if not name.startswith('.'):
+                    path = os.path.join(root, name)
+                    stat = os.stat(path)
+                    fingerprint.append((os.path.relpath(path, intent_dir), stat.st_size, stat.st_mtime_ns))
+        return tuple(sorted(fingerprint))
+
+    def reload_changed(self, retry_failed=False):
+        """
+        Loads intents that were added or whose files changed since they were loaded, drops intents that were
+        removed, and swaps in the new intent set with a rebuilt matcher. If an intent fails to reload, its
+        previous version is kept. Failed requirements installs are retried once their backoff has passed.
+        :param retry_failed: Retry failed requirements installs now, regardless of backoff.
+        :return: A dictionary with the added, updated and removed intent directory names.
+        """
+        self.installer.retry_failed(force=retry_failed)
+        with self.reload_lock:
+            first_load = self.intent_set.matcher is None
+            fingerprints = {}
+            for intent_name in os.listdir(self.intents_path):
+                intent_dir = os.path.join(self.intents_path, intent_name)
+                if os.path.isdir(intent_dir) and not intent_name.startswith(('.', '__')):
+                    fingerprints[intent_name] = self._fingerprint(intent_dir)
+
+            changes = {
+                'added': sorted(name for name in fingerprints if name not in self.fingerprints),
+                'updated': sorted(name for name in fingerprints if name in self.fingerprints and fingerprints[name] != self.fingerprints[name]),
+                'removed': sorted(name for name in self.fingerprints if name not in fingerprints),
+            }
+            if not first_load and not any(changes.values()):
+                self.installer.start()
+                return changes
+
+            loaded = dict(self.loaded)
+            for intent_name in changes['removed']:
+                loaded.pop(intent_name, None)
+                self.load_times.pop(intent_name, None)
+                self.installer.discard(intent_name)
+
+            to_load = changes['added'] + changes['updated']
+            with ThreadPoolExecutor(max_workers=max(1, min(self.workers, len(to_load) or 1)), thread_name_prefix='intent-loader') as executor:
+                configs = list(executor.map(self._load_intent_safely, to_load))
+
+            for intent_name, config in zip(to_load, configs):
+                if config is not None:
+                    loaded[intent_name] = config
+                elif intent_name in loaded:
+                    module_logger.warning(f"Keeping the previous version of intent '{intent_name}'")
+
+            intents = [loaded[name] for name in sorted(loaded)]
+            matcher = self._build_matcher(intents, self.intent_set.matcher)
+            self.loaded = loaded
+            self.fingerprints = fingerprints
+            self.intent_set = IntentSet(intents, matcher)
+
+        self.installer.start()
+        self.preload_sandbox()
+        if not first_load:
+            module_logger.info(f"Reloaded intents: {', '.join(f'{key} {names}' for key, names in changes.items() if names)}")
+            if self.keep_warm:
+                self.warm_up()
+        return changes
+
+    def start_watching(self, interval=2):
+        """
+        Checks the intents directory for changes every interval seconds and reloads what changed.
+        """
+        self.watching = True
+        self.watch_thread = threading.Thread(target=self._watch, args=(interval,), daemon=True)
+        self.watch_thread.start()
+        module_logger.info(f'Watching {self.intents_path} for intent changes')
+
+    def stop_watching(self):
+        self.watching = False
+        if self.watch_thread is not None and self.watch_thread.is_alive():
+            self.watch_thread.join()
+
+    def _watch(self, interval):
+        while self.watching:
+            time.sleep(interval)
+            try:
+                self.reload_changed()
+            except Exception as e:
+                module_logger.error(f'Error reloading intents: {e}')
+
+    def _load_intent_safely(self, intent_name):
+        module_logger.debug(f'Loading intent {intent_name}')
+        try:
+            return self.load_intent(intent_name, os.path.join(self.intents_path, intent_name))
+        except Exception as e:
+            module_logger.error(f"Error loading intent '{intent_name}': {e}")
+            return None
 
     def load_intent(self, intent_name, intent_dir):
+        self.load_times[intent_name] = {}
+
         # Load the JSON configuration
         json_path = os.path.join(intent_dir, f"{intent_name}.json")
 
         try:
+            start = time.perf_counter()
             with open(json_path, 'r') as f:
                 config = json.load(f)
+            self.record_load_time(intent_name, 'json_ms', time.perf_counter() - start)
         except FileNotFoundError:
             module_logger.warning(f"Failed Loading Intent '{intent_name}': File not found")
             return None
@@ -61,83 +311,32 @@ class IntentLoader:
             module_logger.error(f"Error loading intent '{intent_name}': {e}")
             return None
 
-        # Install requirements if requirements.txt exists
+        # Queue requirements.txt for installation if it changed since it was last installed
         try:
+            start = time.perf_counter()
             requirements_path = os.path.join(intent_dir, 'requirements.txt')
-            self.install_requirements(requirements_path)
-            module_logger.info(f"Requirements satisfied for {intent_name}")
+            if self.installer.check(intent_name, requirements_path):
+                module_logger.info(f"Requirements satisfied for {intent_name}")
+            else:
+                module_logger.info(f"Requirements for {intent_name} will be installed in the background")
+            self.record_load_time(intent_name, 'requirements_ms', time.perf_counter() - start)
         except Exception as e:
             module_logger.error(f"Error loading intent '{intent_name}': {e}")
             return None
 
-        # Load the main.py module
-        try:
-            main_py_path = os.path.join(intent_dir, f"{intent_name}.py")
-            module = self.load_module(intent_name, main_py_path)
-            module_logger.info(f"Loaded Intent '{intent_name}'")
-        except FileNotFoundError as e:
+        # The main.py module is imported on first use
+        main_py_path = os.path.join(intent_dir, f"{intent_name}.py")
+        if not os.path.isfile(main_py_path):
             module_logger.error(f"Error loading intent '{intent_name}': File Not Found")
             return None
 
-        except SyntaxError as e:
-            module_logger.error(e)
-            return None
-        except ImportError as e:
-            module_logger.error(e)
-            return None
-
-        except Exception as e:
-            # Catch any other unexpected errors
-            module_logger.error(e)
-            return None
-
         # Store the intent's module and configuration
-        config["module"] = module
-        self.user_intents.append(config)
-
-    def install_requirements(self, requirements_path):
-        """
-        Install the Python dependencies specified in the requirements file, but only if
-        they haven't been installed before (tracked using a marker file).
-
-        :param requirements_path: Path to the requirements.txt file
-        :raises FileNotFoundError: If the requirements.txt file is not found
-        :raises RuntimeError: If pip is not found in the virtual environment
-        :raises RequirementInstallationError: If there's an issue during installation
-        """
-        # Marker file to track installation
-        marker_file = os.path.join(os.path.dirname(requirements_path), '.requirements_installed')
-
-        # Check if the marker file exists, meaning requirements have already been installed
-        if os.path.exists(marker_file):
-            return
-
-        # Check if requirements.txt exists
-        if not os.path.exists(requirements_path):
-            return
-
-        # Locate the pip executable inside the virtual environment
-        venv_pip = os.path.join(os.path.dirname(sys.executable), 'pip')
-
-        # Check if the pip executable exists
-        if not os.path.exists(venv_pip):
-            raise RuntimeError(f"pip not found in the virtual environment: {venv_pip}")
-
-        try:
-            # Run pip install using the virtual environment's pip
-            subprocess.run([venv_pip, 'install', '-r', requirements_path], check=True)
-
-            # Write marker file to indicate installation is done
-            with open(marker_file, 'w') as f:
-                f.write('Requirements installed.')
-
-        except subprocess.CalledProcessError as e:
-            # Capture and raise errors if pip install fails
-            raise RequirementInstallationError(f"Failed to install requirements from '{requirements_path}': {e}")
-
-        except OSError as e:
-            # Capture other OS-related errors (e.g., permission issues, executable not found)
-            raise RequirementInstallationError(f"An OS error occurred while running pip: {e}")
+        config["directory"] = intent_name
+        config["module"] = LazyIntentModule(self, intent_name, main_py_path)
+        config["error_metric"] = INTENT_ERRORS.labels(config.get("name"))
+        config["duration_metric"] = INTENT_DURATION.labels(config.get("name"))
+        module_logger.info(f"Loaded Intent '{intent_name}'")
+        return config
 
     def load_module(self, intent_name, module_path):
         try:
@@ -163,54 +362,115 @@ class IntentLoader:
 
 
 class IntentController:
-    def __init__(self, robot, intent_loader):
+    def __init__(self, robot, intent_loader, task_manager=None):
+        """
+        Matches queries to intents and runs them on a robot.
+        :param task_manager: The robot's TaskManager, whose event loop runs intents with an async main.
+        """
         self.robot = robot
-        self.user_intents = intent_loader.user_intents
-
-    def match_intent(self, user_query):
-        matched_intent = None
-        user_query_lower = user_query.lower()
+        self.intent_loader = intent_loader
+        self.task_manager = task_manager
 
-        sorted_intents = sorted(self.user_intents, key=lambda x: x["priority"])
+    @property
+    def user_intents(self):
+        return self.intent_loader.user_intents
 
-        for intent in sorted_intents:
-            intent_utterances = intent.get("utterances", [])
-            if not intent_utterances:
-                continue
-
-            # Match user query with any of the intent utterances
-            for utterance in intent_utterances:
-                if utterance.lower() in user_query_lower:
-                    # Simple substring match
-                    matched_intent = intent
-                    break
-
-                if matched_intent:
-                    break  # Exit
+    def match_intent(self, user_query):
+        """
+        Returns the intent with an utterance contained in the query, trying intents by priority then name.
+        Intents with a "*" utterance only match when no other intent does.
+        """
+        return self.intent_loader.matcher.match(user_query)
 
-        return matched_intent
+    def match_intent_scored(self, user_query):
+        """
+        Returns (intent, score, method), see IntentMatcher.match_scored. The match time is recorded in TELEMETRY.
+        """
+        start = time.perf_counter()
+        intent, score, method = self.intent_loader.matcher.match_scored(user_query)
+        TELEMETRY.record_match(intent.get('name') if intent else None, method, time.perf_counter() - start)
+        return intent, score, method
 
     def process_intent(self, user_query):
         module_logger.info("Processing Intent")
 
-        matched_intent = self.match_intent(user_query)
+        matched_intent, score, method = self.match_intent_scored(user_query)
 
         if matched_intent is None:
             module_logger.info(f"No intent matched.")
             module_logger.debug(f"User Query: {user_query}")
             return None
 
-        module_logger.info(f"Matched intent: {matched_intent.get("name")}")
+        module_logger.info(f"Matched intent: {matched_intent.get("name")} ({method}, score {score:.2f})")
         module_logger.debug(f"User Query: {user_query}")
 
         result = self.run_user_intent(matched_intent, user_query)
         return result
 
     def run_user_intent(self, intent_data, user_query):
+        result = self.start_user_intent(intent_data, user_query)
+        if isinstance(result, Future):
+            return result.result()
+        return result
+
+    def start_user_intent(self, intent_data, user_query):
+        """
+        Like run_user_intent, except that an intent with an async main is only started on the robot's
+        event loop. Its concurrent.futures.Future is returned right away; cancelling it cancels the intent.
+        """
+        if not self.intent_loader.is_available(intent_data):
+            raise IntentUnavailableError(f"The intent '{intent_data.get('name')}' is waiting for its requirements to install.")
+
         module = intent_data['module']
+        sandbox = self.intent_loader.sandbox
+
+        if intent_data.get('sandbox') and sandbox is not None:
+            return self.run_sandboxed_intent(sandbox, intent_data, user_query)
+
+        if is_async_intent(module):
+            return self.start_async_intent(module, intent_data, user_query)
 
         if hasattr(module, 'main'):
-            return module.main(self.robot, user_query)
+            start = time.perf_counter()
+            try:
+                return module.main(self.robot, user_query)
+            except Exception:
+                intent_data['error_metric'].inc()
+                raise
+            finally:
+                intent_data['duration_metric'].observe(time.perf_counter() - start)
         else:
             raise AttributeError(f"The intent '{intent_data.get('intent_name')}' does not have a 'main' function.")
 
+    def start_async_intent(self, module, intent_data, user_query):
+        if self.task_manager is None:
+            raise RuntimeError(f"The intent '{intent_data.get('name')}' is async but the robot has no event loop to run it on.")
+
+        error_metric = intent_data['error_metric']
+        duration_metric = intent_data['duration_metric']
+        start = time.perf_counter()
+
+        def record(future):
+            if not future.cancelled() and future.exception() is not None:
+                error_metric.inc()
+            duration_metric.observe(time.perf_counter() - start)
+
+        future = self.task_manager.run_intent(module.main, user_query, intent_data.get('name'), resources=intent_data.get('resources', ()))
+        future.add_done_callback(record)
+        return future
+
+    def run_sandboxed_intent(self, sandbox, intent_data, user_query):
+        """
+        Runs the intent in a sandbox worker process. If the intent's execution is cancelled or times out,
+        the worker is killed, which stops the intent for real.
+        """
+        execution = current_execution()
+        start = time.perf_counter()
+        try:
+            return sandbox.run(self.robot, intent_data['directory'], intent_data['module'].module_path, user_query,
+                               should_cancel=execution.cancelled if execution is not None else None)
+        except Exception:
+            intent_data['error_metric'].inc()
+            raise
+        finally:
+            intent_data['duration_metric'].observe(time.perf_counter() - start)
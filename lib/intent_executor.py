@@ -0,0 +1,436 @@
+import collections
+import heapq
+import itertools
+import logging
+import threading
+import time
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from lib.metrics_handler import INTENT_QUEUE_DEPTH, INTENT_QUEUE_WAIT, INTENT_REQUESTS_DEDUPLICATED
+
+module_logger = logging.getLogger('vector_playground.intent_executor')
+
+EXECUTION_QUEUED = 'queued'
+EXECUTION_RUNNING = 'running'
+EXECUTION_SUCCEEDED = 'succeeded'
+EXECUTION_FAILED = 'failed'
+EXECUTION_TIMED_OUT = 'timed_out'
+EXECUTION_CANCELLED = 'cancelled'
+
+FINISHED_STATES = (EXECUTION_SUCCEEDED, EXECUTION_FAILED, EXECUTION_TIMED_OUT, EXECUTION_CANCELLED)
+
+_current = threading.local()
+
+
+def current_execution():
+    """
+    Returns the IntentExecution running on the calling thread, or None. Long-running intents can poll
+    current_execution().cancelled() to stop early after a timeout or cancellation.
+    """
+    return getattr(_current, 'execution', None)
+
+
+def _json_safe(value):
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    if isinstance(value, (list, tuple)):
+        return [_json_safe(item) for item in value]
+    if isinstance(value, dict):
+        return {str(key): _json_safe(item) for key, item in value.items()}
+    return repr(value)
+
+
+class QueueFullError(RuntimeError):
+    """Raised when a robot already has the maximum number of intents waiting."""
+    pass
+
+
+class _QueueMetrics:
+    def __init__(self, serial):
+        self.depth = INTENT_QUEUE_DEPTH.labels(serial)
+        self.deduplicated = INTENT_REQUESTS_DEDUPLICATED.labels(serial)
+        self.wait = INTENT_QUEUE_WAIT.labels(serial)
+
+
+class IntentExecution:
+    def __init__(self, serial, intent_name, query, func, args, timeout, on_abort, priority=0, dedup_key=None):
+        self.id = uuid.uuid4().hex
+        self.serial = serial
+        self.intent_name = intent_name
+        self.query = query
+        self.func = func
+        self.args = args
+        self.timeout = timeout
+        self.on_abort = on_abort
+        self.priority = priority
+        self.dedup_key = dedup_key
+        self.duplicates = 0
+        self.state = EXECUTION_QUEUED
+        self.submitted = time.time()
+        self.started = None
+        self.finished = None
+        self.result = None
+        self.error = None
+        self.version = 0
+        self.cancel_event = threading.Event()
+        self.future = None  # set when func started an async intent
+        self.thread_ident = None  # worker thread while func runs
+
+    def cancelled(self):
+        """
+        True once the execution timed out or was cancelled.
+        """
+        return self.cancel_event.is_set()
+
+    @property
+    def done(self):
+        return self.state in FINISHED_STATES
+
+    def to_dict(self):
+        now = time.time()
+        return {
+            'id': self.id,
+            'serial': self.serial,
+            'intent': self.intent_name,
+            'query': self.query,
+            'state': self.state,
+            'submitted': self.submitted,
+            'started': self.started,
+            'finished': self.finished,
+            'queue_wait': round((self.started or self.finished or now) - self.submitted, 4),
+            'duration': round((self.finished or now) - self.started, 4) if self.started else None,
+            'timeout': self.timeout,
+            'priority': self.priority,
+            'duplicates': self.duplicates,
+            'result': self.result,
+            'error': self.error,
+            'version': self.version,
+        }
+
+
+class IntentExecutor:
+    def __init__(self, max_workers=8, per_robot_limit=1, default_timeout=60, max_history=200, max_queued=50, dedup_window=2.0,
+                 slow_threshold=None, on_slow=None, on_finished=None):
+        """
+        Runs intents on a worker pool instead of the request thread, at most per_robot_limit at a time per robot.
+        Further executions for a busy robot wait in a queue, highest priority first and in submission order
+        within a priority.
+
+        Python threads cannot be killed, so a timeout or cancellation of a running intent marks it finished,
+        sets its cancel event and calls its on_abort callback (e.g. to stop the motors). The robot's slot is
+        only freed once the intent actually returns, so a runaway intent never overlaps the next one.
+
+        If func returns a concurrent.futures.Future (an async intent started on the robot's event loop), the
+        worker is freed right away and the execution finishes with the future; aborting it cancels the future.
+        :param max_workers: Maximum number of intents running across all robots.
+        :param per_robot_limit: Maximum number of intents running on one robot.
+        :param default_timeout: Seconds an intent may run when it does not set its own timeout.
+        :param max_history: Number of finished executions kept for polling.
+        :param max_queued: Maximum number of executions waiting per robot.
+        :param dedup_window: Seconds within which a submission with the same dedup key joins the earlier execution.
+        :param slow_threshold: Seconds after which on_slow is called with an execution that is still running.
+        :param on_slow: Called from the deadline thread with a slow execution, e.g. to sample its stack.
+        :param on_finished: Called with each execution once it finished, in any state.
+        """
+        self.max_workers = max_workers
+        self.per_robot_limit = per_robot_limit
+        self.default_timeout = default_timeout
+        self.max_history = max_history
+        self.max_queued = max_queued
+        self.dedup_window = dedup_window
+        self.slow_threshold = slow_threshold
+        self.on_slow = on_slow
+        self.on_finished = on_finished
+        self.executions = collections.OrderedDict()  # id -> IntentExecution, oldest first
+        self.waiting = {}  # serial -> heap of (-priority, sequence, execution)
+        self.metrics = {}  # serial -> _QueueMetrics, created with the robot's queue
+        self.recent = {}  # (serial, dedup key) -> latest execution submitted with that key
+        self.running = collections.Counter()  # serial -> executions holding a slot
+        self.deadlines = []  # heap of (deadline, sequence, execution id, kind), kind is 'timeout' or 'slow'
+        self.sequence = itertools.count()
+        self.condition = threading.Condition()
+        self.stopped = False
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='intent')
+        self.deadline_thread = threading.Thread(target=self._enforce_deadlines, daemon=True)
+
+    def start(self):
+        module_logger.info(f'Starting Intent Executor with {self.max_workers} workers, {self.per_robot_limit} per robot')
+        self.deadline_thread.start()
+
+    def stop(self):
+        """
+        Cancels queued executions and stops accepting new ones. Running intents are left to finish.
+        """
+        with self.condition:
+            self.stopped = True
+            for serial, queue in self.waiting.items():
+                for _, _, execution in queue:
+                    if not execution.done:
+                        self._finish(execution, EXECUTION_CANCELLED, error='Executor stopped')
+                queue.clear()
+                self.metrics[serial].depth.set(0)
+            self.condition.notify_all()
+        if self.deadline_thread.is_alive():
+            self.deadline_thread.join()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def submit(self, serial, intent_name, query, func, args=(), timeout=None, on_abort=None, priority=0):
+        """
+        Queues an intent for a robot.
+        :param serial: The robot the intent drives.
+        :param intent_name: Name reported in status.
+        :param query: The user query, reported in status.
+        :param func: Called as func(*args) on a worker.
+        :param timeout: Seconds the intent may run, or None for the default.
+        :param on_abort: Called with the execution when a running intent times out or is cancelled.
+        :param priority: Executions with a higher priority leave the robot's queue first.
+        :return: The IntentExecution.
+        :raises QueueFullError: If max_queued executions are already waiting for the robot.
+        """
+        execution, _ = self.submit_request(serial, intent_name, query, func, args, timeout, on_abort, priority)
+        return execution
+
+    def submit_request(self, serial, intent_name, query, func, args=(), timeout=None, on_abort=None, priority=0, dedup_key=None):
+        """
+        Like submit, but a submission whose dedup_key matches one made for the same robot within dedup_window
+        seconds returns the earlier execution instead of queueing the intent again.
+        :return: (IntentExecution, True if it is an earlier execution)
+        """
+        with self.condition:
+            if self.stopped:
+                raise RuntimeError('Intent executor is stopped')
+
+            now = time.time()
+            if dedup_key is not None:
+                previous = self.recent.get((serial, dedup_key))
+                if previous is not None and now - previous.submitted <= self.dedup_window and previous.state != EXECUTION_CANCELLED:
+                    previous.duplicates += 1
+                    previous.version += 1
+                    self.metrics[serial].deduplicated.inc()
+                    self.condition.notify_all()
+                    return previous, True
+
+            if self._queued(serial) >= self.max_queued:
+                raise QueueFullError(f'{self.max_queued} intents are already waiting for robot {serial}')
+
+            execution = IntentExecution(serial, intent_name, query, func, args, timeout or self.default_timeout, on_abort, priority, dedup_key)
+            self.executions[execution.id] = execution
+            if dedup_key is not None:
+                self.recent[(serial, dedup_key)] = execution
+            if serial not in self.waiting:
+                self.waiting[serial] = []
+                self.metrics[serial] = _QueueMetrics(serial)
+            heapq.heappush(self.waiting[serial], (-priority, next(self.sequence), execution))
+            self._dispatch(serial)
+            self._prune()
+        return execution, False
+
+    def _queued(self, serial):
+        return sum(1 for _, _, execution in self.waiting.get(serial, ()) if not execution.done)
+
+    def _dispatch(self, serial):
+        queue = self.waiting[serial]
+        while queue and self.running[serial] < self.per_robot_limit:
+            _, _, execution = heapq.heappop(queue)
+            if execution.done:
+                continue  # cancelled while queued
+            self.running[serial] += 1
+            self.executor.submit(self._run, execution)
+        self.metrics[serial].depth.set(self._queued(serial))
+
+    def _run(self, execution):
+        with self.condition:
+            if execution.done:
+                # Cancelled between dispatch and start
+                self._release(execution.serial)
+                return
+            execution.state = EXECUTION_RUNNING
+            execution.started = time.time()
+            execution.version += 1
+            self.metrics[execution.serial].wait.observe(execution.started - execution.submitted)
+            heapq.heappush(self.deadlines, (time.monotonic() + execution.timeout, next(self.sequence), execution.id, 'timeout'))
+            if self.slow_threshold and self.on_slow and self.slow_threshold < execution.timeout:
+                heapq.heappush(self.deadlines, (time.monotonic() + self.slow_threshold, next(self.sequence), execution.id, 'slow'))
+            self.condition.notify_all()
+
+        _current.execution = execution
+        execution.thread_ident = threading.get_ident()
+        result, error = None, None
+        try:
+            result = execution.func(*execution.args)
+        except Exception as e:
+            error = f'{type(e).__name__}: {e}'
+            module_logger.error(f'[{execution.serial}] Intent {execution.intent_name} failed: {error}')
+        finally:
+            _current.execution = None
+            execution.thread_ident = None
+
+        if isinstance(result, Future):
+            with self.condition:
+                execution.future = result
+                if execution.done:
+                    result.cancel()  # aborted while func was starting it
+            result.add_done_callback(lambda future: self._future_done(execution, future))
+            return
+
+        self._complete(execution, result, error)
+
+    def _future_done(self, execution, future):
+        result, error = None, None
+        if future.cancelled():
+            error = 'Cancelled'
+        elif future.exception() is not None:
+            exception = future.exception()
+            error = f'{type(exception).__name__}: {exception}'
+            module_logger.error(f'[{execution.serial}] Intent {execution.intent_name} failed: {error}')
+        else:
+            result = future.result()
+        self._complete(execution, result, error)
+
+    def _complete(self, execution, result, error):
+        with self.condition:
+            if not execution.done:
+                if error is None:
+                    execution.result = _json_safe(result)
+                    self._finish(execution, EXECUTION_SUCCEEDED)
+                else:
+                    self._finish(execution, EXECUTION_FAILED, error=error)
+            self._release(execution.serial)
+
+    def _release(self, serial):
+        self.running[serial] -= 1
+        if self.running[serial] <= 0:
+            del self.running[serial]
+        if not self.stopped:
+            self._dispatch(serial)
+
+    def _finish(self, execution, state, error=None):
+        execution.state = state
+        execution.error = error
+        execution.finished = time.time()
+        execution.version += 1
+        self.condition.notify_all()
+        if self.on_finished:
+            try:
+                self.on_finished(execution)
+            except Exception as e:
+                module_logger.error(f'[{execution.serial}] Error recording intent {execution.intent_name}: {e}')
+
+    def _abort(self, execution, state, error):
+        """
+        Marks a running execution finished and asks it to stop. Called with the condition held.
+        """
+        self._finish(execution, state, error)
+        execution.cancel_event.set()
+        if execution.future is not None:
+            execution.future.cancel()
+        if execution.on_abort:
+            threading.Thread(target=self._call_on_abort, args=(execution,), daemon=True).start()
+
+    @staticmethod
+    def _call_on_abort(execution):
+        try:
+            execution.on_abort(execution)
+        except Exception as e:
+            module_logger.error(f'[{execution.serial}] Error aborting intent {execution.intent_name}: {e}')
+
+    def cancel(self, execution_id):
+        """
+        Cancels a queued or running execution.
+        :return: True if the execution was cancelled, False if it was unknown or already finished.
+        """
+        with self.condition:
+            execution = self.executions.get(execution_id)
+            if execution is None or execution.done:
+                return False
+            if execution.state == EXECUTION_QUEUED:
+                # Left in the queue's heap and skipped by _dispatch, or seen as done by the worker it was handed to
+                self._finish(execution, EXECUTION_CANCELLED, error='Cancelled')
+                self.metrics[execution.serial].depth.set(self._queued(execution.serial))
+            else:
+                self._abort(execution, EXECUTION_CANCELLED, 'Cancelled')
+            module_logger.info(f'[{execution.serial}] Cancelled intent {execution.intent_name}')
+            return True
+
+    def _enforce_deadlines(self):
+        while True:
+            with self.condition:
+                if self.stopped:
+                    break
+                now = time.monotonic()
+                if not self.deadlines or self.deadlines[0][0] > now:
+                    timeout = self.deadlines[0][0] - now if self.deadlines else None
+                    self.condition.wait(timeout)
+                    continue
+                _, _, execution_id, kind = heapq.heappop(self.deadlines)
+                execution = self.executions.get(execution_id)
+                if execution is None or execution.state != EXECUTION_RUNNING:
+                    continue
+                if kind == 'timeout':
+                    module_logger.warning(f'[{execution.serial}] Intent {execution.intent_name} timed out after {execution.timeout}s')
+                    self._abort(execution, EXECUTION_TIMED_OUT, f'Timed out after {execution.timeout}s')
+                    continue
+
+            # Sampling a slow execution does not need the lock
+            try:
+                self.on_slow(execution)
+            except Exception as e:
+                module_logger.error(f'[{execution.serial}] Error sampling slow intent {execution.intent_name}: {e}')
+
+    def _prune(self):
+        excess = len(self.executions) - self.max_history
+        if excess <= 0:
+            return
+        for execution_id in [execution_id for execution_id, execution in self.executions.items() if execution.done][:excess]:
+            execution = self.executions.pop(execution_id)
+            if self.recent.get((execution.serial, execution.dedup_key)) is execution:
+                del self.recent[(execution.serial, execution.dedup_key)]
+
+    def get(self, execution_id):
+        with self.condition:
+            execution = self.executions.get(execution_id)
+            return execution.to_dict() if execution else None
+
+    def list(self, serial=None):
+        """
+        Returns the known executions, newest first, optionally for one robot.
+        """
+        with self.condition:
+            return [execution.to_dict() for execution in reversed(self.executions.values())
+                    if serial is None or execution.serial == serial]
+
+    def wait(self, execution_id, version=-1, timeout=30):
+        """
+        Blocks until an execution changes past the given version, finishes, or the timeout passes.
+        :return: The execution's status, or None if it is unknown.
+        """
+        deadline = time.monotonic() + timeout
+        with self.condition:
+            while True:
+                execution = self.executions.get(execution_id)
+                if execution is None or execution.version > version or execution.done:
+                    return execution.to_dict() if execution else None
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return execution.to_dict()
+                self.condition.wait(remaining)
+
+    def queue_depth(self, serial):
+        with self.condition:
+            return self._queued(serial)
+
+    def queue_stats(self, serial):
+        """
+        Returns the robot's queue depth, how long its oldest waiting execution has waited, and how many
+        of its executions are running.
+        """
+        with self.condition:
+            queued = [execution for _, _, execution in self.waiting.get(serial, ()) if not execution.done]
+            now = time.time()
+            return {
+                'depth': len(queued),
+                'oldest_wait': round(now - min(execution.submitted for execution in queued), 4) if queued else 0,
+                'running': self.running.get(serial, 0),
+                'max_queued': self.max_queued,
+            }
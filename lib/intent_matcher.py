@@ -0,0 +1,334 @@
+import argparse
+import glob
+import hashlib
+import json
+import logging
+import math
+import os
+import random
+import re
+import time
+from collections import Counter, deque
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+module_logger = logging.getLogger('vector_playground.intent_matcher')
+
+WILDCARD = '*'
+MATCH_EXACT = 'exact'
+MATCH_FUZZY = 'fuzzy'
+MATCH_WILDCARD = 'wildcard'
+
+FUZZY_INDEX_VERSION = 1
+_non_word = re.compile(r"[^a-z0-9]+")
+
+
+def intent_sort_key(intent, index):
+    """
+    The order intents are tried in: lowest priority value first, then by name, then by load order.
+    """
+    return intent.get('priority', 0), intent.get('name') or '', index
+
+
+def _features(text):
+    """
+    Splits text into the terms the fuzzy index is built on: whole words plus the character trigrams
+    of each word padded with spaces, so "moons" still shares most of its terms with "moon".
+    """
+    features = Counter()
+    for word in _non_word.sub(' ', text.lower()).split():
+        features[f'w:{word}'] += 1
+        padded = f' {word} '
+        for index in range(len(padded) - 2):
+            features[padded[index:index + 3]] += 1
+    return features
+
+
+class FuzzyIntentIndex:
+    def __init__(self, intents, cache_dir=None, previous=None):
+        """
+        A TF-IDF index over word and character trigram terms of every utterance, for queries that paraphrase
+        an utterance instead of containing it. A query is scored against all utterances with one matrix-vector
+        product over the columns of the terms it contains.
+
+        When cache_dir is set the index is stored there, named by a hash of the utterances, and loaded
+        instead of rebuilt while the intents are unchanged.
+        :param intents: Intents in match order, as ordered by IntentMatcher.
+        :param cache_dir: Directory for cached indexes, or None to always build.
+        :param previous: The index this one replaces. Terms of utterances it already split are reused.
+        """
+        if np is None:
+            raise RuntimeError('The fuzzy intent index requires numpy')
+
+        self.intents = intents
+        self.features = {}  # utterance -> terms, kept for the next rebuild
+        utterances = [(rank, utterance) for rank, intent in enumerate(intents)
+                      for utterance in intent.get('utterances') or [] if utterance and utterance != WILDCARD]
+        self.digest = self._digest(utterances)
+
+        cache_path = os.path.join(cache_dir, f'intent_index_{self.digest}.npz') if cache_dir else None
+        if cache_path and os.path.exists(cache_path):
+            try:
+                self._load(cache_path)
+                module_logger.info(f'Loaded fuzzy intent index from {cache_path}')
+                return
+            except (OSError, ValueError, KeyError) as e:
+                module_logger.warning(f'Rebuilding fuzzy intent index, could not read {cache_path}: {e}')
+
+        start = time.perf_counter()
+        self._build(utterances, previous.features if previous is not None else {})
+        module_logger.info(f'Built fuzzy intent index: {len(utterances)} utterances, {len(self.terms)} terms '
+                           f'in {(time.perf_counter() - start) * 1000:.1f} ms')
+        if cache_path:
+            self._save(cache_path)
+
+    @staticmethod
+    def _digest(utterances):
+        payload = json.dumps([FUZZY_INDEX_VERSION, utterances], separators=(',', ':'))
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:16]
+
+    def _build(self, utterances, known_features):
+        for _, utterance in utterances:
+            if utterance not in self.features:
+                self.features[utterance] = known_features.get(utterance) or _features(utterance)
+        documents = [self.features[utterance] for _, utterance in utterances]
+        document_frequency = Counter(term for document in documents for term in document)
+        self.terms = {term: column for column, term in enumerate(sorted(document_frequency))}
+        count = len(documents)
+        self.idf = np.array([math.log((1 + count) / (1 + document_frequency[term])) + 1 for term in sorted(document_frequency)],
+                            dtype=np.float32)
+
+        self.matrix = np.zeros((count, len(self.terms)), dtype=np.float32)
+        for row, document in enumerate(documents):
+            for term, frequency in document.items():
+                self.matrix[row, self.terms[term]] = 1 + math.log(frequency)
+        self.matrix *= self.idf
+        norms = np.linalg.norm(self.matrix, axis=1, keepdims=True)
+        self.matrix /= np.where(norms > 0, norms, 1)
+        self.utterance_ranks = np.array([rank for rank, _ in utterances], dtype=np.int32)
+
+    def _save(self, path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f'{path}.{os.getpid()}.tmp'
+        with open(temp_path, 'wb') as f:
+            np.savez(f, terms=np.array(sorted(self.terms, key=self.terms.get)), idf=self.idf,
+                     matrix=self.matrix, utterance_ranks=self.utterance_ranks)
+        os.replace(temp_path, path)
+
+        # Indexes for other utterance sets are never read again once this one replaces them
+        for stale_path in glob.glob(os.path.join(os.path.dirname(path), 'intent_index_*.npz')):
+            if stale_path != path:
+                try:
+                    os.remove(stale_path)
+                except OSError as e:
+                    module_logger.debug(f'Could not remove stale fuzzy intent index {stale_path}: {e}')
+
+    def _load(self, path):
+        with np.load(path, allow_pickle=False) as data:
+            self.terms = {str(term): column for column, term in enumerate(data['terms'])}
+            self.idf = data['idf']
+            self.matrix = data['matrix']
+            self.utterance_ranks = data['utterance_ranks']
+        if self.matrix.shape != (len(self.utterance_ranks), len(self.terms)):
+            raise ValueError('index shape does not match its terms')
+
+    def search(self, query):
+        """
+        Returns (intent, score) for the utterance most similar to the query, by cosine similarity from 0 to 1.
+        Terms the index has never seen still count towards the query's length, so a long query that shares one
+        word with an utterance scores low. Ties go to the intent that comes first in match order.
+        """
+        features = _features(query)
+        if not features or not len(self.utterance_ranks):
+            return None, 0.0
+
+        # A term no utterance contains gets the idf it would have with a document frequency of zero
+        unknown_idf = math.log(1 + len(self.utterance_ranks)) + 1
+        columns, weights, unknown = [], [], 0.0
+        for term, frequency in features.items():
+            column = self.terms.get(term)
+            if column is None:
+                unknown += ((1 + math.log(frequency)) * unknown_idf) ** 2
+            else:
+                columns.append(column)
+                weights.append((1 + math.log(frequency)) * self.idf[column])
+        if not columns:
+            return None, 0.0
+
+        weights = np.array(weights, dtype=np.float32)
+        scores = self.matrix[:, columns] @ weights / math.sqrt(float(weights @ weights) + unknown)
+        best = float(scores.max())
+        rank = int(self.utterance_ranks[scores >= best - 1e-6].min())
+        return self.intents[rank], best
+
+
+class IntentMatcher:
+    def __init__(self, intents, fuzzy_threshold=None, cache_dir=None, previous=None):
+        """
+        Matches queries against the utterances of every intent in one pass over the query.
+
+        All lowercased utterances are compiled into an Aho-Corasick automaton. Every node stores the best
+        rank of any utterance that ends there or at one of its suffix nodes, so a query costs one dictionary
+        lookup per character however many utterances there are.
+
+        An intent whose utterances contain "*" matches any query, but only when no intent matched one of its
+        utterances. When several intents match, the first in intent_sort_key order wins.
+
+        With fuzzy_threshold set, a query that contains no utterance is scored against a FuzzyIntentIndex
+        and matches the most similar intent if its score reaches the threshold, before falling back to "*".
+        :param intents: Intent configurations with 'utterances', 'priority' and 'name'.
+        :param fuzzy_threshold: Minimum fuzzy score (0-1), or None to match utterances exactly only.
+        :param cache_dir: Directory the fuzzy index is cached in.
+        :param previous: The matcher this one replaces on reload, whose fuzzy index work is reused.
+        """
+        order = sorted(range(len(intents)), key=lambda index: intent_sort_key(intents[index], index))
+        self.intents = [intents[index] for index in order]
+        self.wildcard = None
+        self.utterance_count = 0
+
+        # Node 0 is the root; goto[node] maps a character to the next node
+        self.goto = [{}]
+        self.fail = [0]
+        self.best = [None]  # lowest intent rank matched at each node, or None
+
+        for rank, intent in enumerate(self.intents):
+            for utterance in intent.get('utterances') or []:
+                if utterance == WILDCARD:
+                    if self.wildcard is None:
+                        self.wildcard = intent
+                    continue
+                if utterance:
+                    self._add(utterance.lower(), rank)
+                    self.utterance_count += 1
+        self._link()
+
+        self.fuzzy_threshold = fuzzy_threshold
+        self.fuzzy_index = None
+        if fuzzy_threshold is not None:
+            if np is None:
+                module_logger.warning('Fuzzy intent matching is disabled because numpy is not installed')
+            else:
+                previous_index = previous.fuzzy_index if previous is not None else None
+                self.fuzzy_index = FuzzyIntentIndex(self.intents, cache_dir, previous_index)
+
+    def _add(self, utterance, rank):
+        node = 0
+        for char in utterance:
+            next_node = self.goto[node].get(char)
+            if next_node is None:
+                next_node = len(self.goto)
+                self.goto[node][char] = next_node
+                self.goto.append({})
+                self.fail.append(0)
+                self.best.append(None)
+            node = next_node
+        if self.best[node] is None or rank < self.best[node]:
+            self.best[node] = rank
+
+    def _link(self):
+        """
+        Sets the failure links breadth first and folds each node's failure chain into its best rank.
+        """
+        queue = deque(self.goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in self.goto[node].items():
+                queue.append(child)
+                fallback = self.fail[node]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[child] = self.goto[fallback].get(char, 0)
+                inherited = self.best[self.fail[child]]
+                if inherited is not None and (self.best[child] is None or inherited < self.best[child]):
+                    self.best[child] = inherited
+
+    def match(self, query):
+        """
+        Returns the intent for a query, or None.
+        """
+        return self.match_scored(query)[0]
+
+    def match_scored(self, query):
+        """
+        Returns (intent, score, method) for a query. Exact matches score 1, wildcard matches 0 and
+        fuzzy matches their similarity. intent and method are None when nothing matched.
+        """
+        rank = self._match_exact(query)
+        if rank is not None:
+            return self.intents[rank], 1.0, MATCH_EXACT
+        if self.fuzzy_index is not None:
+            intent, score = self.fuzzy_index.search(query)
+            if intent is not None and score >= self.fuzzy_threshold:
+                return intent, score, MATCH_FUZZY
+        if self.wildcard is not None:
+            return self.wildcard, 0.0, MATCH_WILDCARD
+        return None, 0.0, None
+
+    def _match_exact(self, query):
+        goto, fail, best = self.goto, self.fail, self.best
+        node = 0
+        matched = None
+        for char in query.lower():
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            rank = best[node]
+            if rank is not None and (matched is None or rank < matched):
+                matched = rank
+                if matched == 0:
+                    break
+        return matched
+
+
+def _scan_match(intents, query):
+    """
+    Reference matcher with the same rules as IntentMatcher, scanning every utterance.
+    """
+    query = query.lower()
+    ordered = [intent for _, intent in sorted(enumerate(intents), key=lambda item: intent_sort_key(item[1], item[0]))]
+    for intent in ordered:
+        if any(utterance != WILDCARD and utterance and utterance.lower() in query for utterance in intent.get('utterances') or []):
+            return intent
+    return next((intent for intent in ordered if WILDCARD in (intent.get('utterances') or [])), None)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the intent matcher against a linear utterance scan.')
+    parser.add_argument('--intents', type=int, default=500, help='Number of synthetic intents')
+    parser.add_argument('--utterances', type=int, default=10, help='Utterances per intent')
+    parser.add_argument('--queries', type=int, default=2000, help='Number of queries to time')
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    words = [''.join(rng.choice('abcdefghijklmnopqrstuvwxyz') for _ in range(rng.randint(3, 8))) for _ in range(2000)]
+    intents = [{'name': f'intent_{index}', 'priority': rng.randint(0, 5),
+                'utterances': [' '.join(rng.sample(words, 2)) for _ in range(args.utterances)]}
+               for index in range(args.intents)]
+    intents.append({'name': 'fallback', 'priority': 0, 'utterances': [WILDCARD]})
+    queries = [' '.join(rng.sample(words, 8)) for _ in range(args.queries // 2)]
+    queries += [f'hey vector {rng.choice(rng.choice(intents[:-1])["utterances"])} please' for _ in range(args.queries - len(queries))]
+
+    start = time.perf_counter()
+    matcher = IntentMatcher(intents)
+    build_ms = (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    compiled = [matcher.match(query) for query in queries]
+    compiled_us = (time.perf_counter() - start) / len(queries) * 1e6
+
+    start = time.perf_counter()
+    scanned = [_scan_match(intents, query) for query in queries]
+    scan_us = (time.perf_counter() - start) / len(queries) * 1e6
+
+    mismatches = sum(1 for a, b in zip(compiled, scanned) if a is not b)
+    print(f'{matcher.utterance_count} utterances, {len(matcher.goto)} automaton nodes, built in {build_ms:.1f} ms')
+    print(f'Compiled matcher: {compiled_us:8.1f} us/query')
+    print(f'Linear scan:      {scan_us:8.1f} us/query')
+    print(f'Mismatches:       {mismatches}')
+
+
+if __name__ == '__main__':
+    main()
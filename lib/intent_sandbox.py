@@ -0,0 +1,450 @@
+"""
+Runs intents in warm worker processes so CPU-heavy intents do not compete with the camera and detection
+threads for the GIL.
+
+Workers are started ahead of time with `python -m lib.intent_sandbox <fd>`, so an intent starts without
+interpreter startup or import cost. Each worker talks to the server over a Unix socket pair. The intent gets
+a RobotProxy in place of the robot: every attribute read, call, item access or assignment on it is sent to
+the server, done on the real robot, and the result sent back. Plain values come back by value; objects,
+methods and containers come back as further proxies, so `robot.intent_data['x']['y'] = 1` changes the
+server's copy.
+"""
+
+import collections
+import importlib.util
+import inspect
+import io
+import logging
+import os
+import pickle
+import socket
+import subprocess
+import sys
+import threading
+import traceback
+import types
+from multiprocessing.connection import Connection
+
+module_logger = logging.getLogger('vector_playground.intent_sandbox')
+
+ROBOT_HANDLE = 0
+PLAIN_TYPES = (type(None), bool, int, float, complex, str, bytes)
+
+
+class SandboxError(Exception):
+    """Raised when a sandboxed intent fails or its worker dies."""
+    pass
+
+
+class SandboxCancelled(SandboxError):
+    """Raised when a sandboxed intent is cancelled or times out and its worker is stopped."""
+    pass
+
+
+class RemoteError(Exception):
+    """Raised inside a worker when a robot call fails in the server."""
+    pass
+
+
+class _Handle:
+    """Stands for a proxied object when it is passed back to the server as an argument."""
+    __slots__ = ('handle',)
+
+    def __init__(self, handle):
+        self.handle = handle
+
+
+class _ValuePickler(pickle.Pickler):
+    """
+    Pickles a value only if it does not reach the robot or use classes the worker cannot import.
+    Objects that hold the robot (SDK components do) must stay in the server, or their methods would
+    run on a copy in the worker.
+    """
+    def __init__(self, file, robot):
+        super().__init__(file)
+        self.robot = robot
+
+    def persistent_id(self, obj):
+        if obj is self.robot or getattr(obj, '__module__', None) == '__main__' and isinstance(obj, type):
+            raise pickle.PicklingError('Value cannot leave the server')
+        return None
+
+
+################
+# Worker side
+################
+
+class RobotProxy:
+    __slots__ = ('_connection', '_handle', '_label')
+
+    def __init__(self, connection, handle, label):
+        object.__setattr__(self, '_connection', connection)
+        object.__setattr__(self, '_handle', handle)
+        object.__setattr__(self, '_label', label)
+
+    def _request(self, message, label):
+        self._connection.send(message)
+        reply = self._connection.recv()
+        return _decode(self._connection, reply, label)
+
+    def __getattr__(self, name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+        return self._request(('getattr', self._handle, name), f'{self._label}.{name}')
+
+    def __setattr__(self, name, value):
+        self._request(('setattr', self._handle, name, _encode_argument(value)), self._label)
+
+    def __call__(self, *args, **kwargs):
+        return self._request(('call', self._handle, _encode_argument(args), _encode_argument(kwargs)), f'{self._label}()')
+
+    def _method(self, name, *args):
+        return self._request(('method', self._handle, name, _encode_argument(args)), f'{self._label}.{name}')
+
+    def __getitem__(self, key):
+        return self._method('__getitem__', key)
+
+    def __setitem__(self, key, value):
+        self._method('__setitem__', key, value)
+
+    def __delitem__(self, key):
+        self._method('__delitem__', key)
+
+    def __contains__(self, item):
+        return self._method('__contains__', item)
+
+    def __len__(self):
+        return self._method('__len__')
+
+    def __bool__(self):
+        return self._request(('bool', self._handle), self._label)
+
+    def __iter__(self):
+        return iter(self._request(('items', self._handle), self._label))
+
+    def __repr__(self):
+        return f'<RobotProxy {self._label}>'
+
+
+def _encode_argument(value):
+    if isinstance(value, RobotProxy):
+        return _Handle(value._handle)
+    if isinstance(value, (list, tuple)):
+        return type(value)(_encode_argument(item) for item in value)
+    if isinstance(value, dict):
+        return {key: _encode_argument(item) for key, item in value.items()}
+    return value
+
+
+def _decode(connection, reply, label):
+    kind = reply[0]
+    if kind == 'value':
+        return reply[1]
+    if kind == 'ref':
+        return RobotProxy(connection, reply[1], label)
+    if kind == 'items':
+        return [_decode(connection, item, label) for item in reply[1]]
+    raise RemoteError(f'{reply[1]}: {reply[2]}')
+
+
+def _picklable_result(value):
+    try:
+        pickle.dumps(value)
+        return value
+    except Exception:
+        return repr(value)
+
+
+def _load_intent_module(modules, intent_name, module_path):
+    """
+    Imports an intent module, again if the file changed since it was imported.
+    """
+    mtime = os.stat(module_path).st_mtime_ns
+    cached = modules.get(module_path)
+    if cached and cached[0] == mtime:
+        return cached[1]
+    spec = importlib.util.spec_from_file_location(intent_name, module_path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    modules[module_path] = (mtime, module)
+    return module
+
+
+def worker_main(fd):
+    connection = Connection(fd)
+    modules = {}  # module path -> (mtime, module)
+    while True:
+        try:
+            message = connection.recv()
+        except EOFError:
+            break
+
+        if message[0] == 'stop':
+            break
+
+        if message[0] == 'preload':
+            for intent_name, module_path in message[1]:
+                try:
+                    _load_intent_module(modules, intent_name, module_path)
+                except Exception as e:
+                    module_logger.error(f"Could not preload intent '{intent_name}': {e}")
+            continue
+
+        _, intent_name, module_path, user_query = message
+        try:
+            module = _load_intent_module(modules, intent_name, module_path)
+            if inspect.iscoroutinefunction(module.main):
+                raise TypeError('Async intents run on the robot\'s event loop and cannot be sandboxed')
+            result = module.main(RobotProxy(connection, ROBOT_HANDLE, 'robot'), user_query)
+            connection.send(('result', _picklable_result(result)))
+        except Exception as e:
+            connection.send(('error', type(e).__name__, str(e), traceback.format_exc()))
+
+
+################
+# Server side
+################
+
+class _SandboxWorker:
+    def __init__(self, process, connection):
+        self.process = process
+        self.connection = connection
+        self.runs = 0
+        self.preload_version = 0  # version of IntentSandbox.preload_modules this worker was sent
+
+
+class IntentSandbox:
+    def __init__(self, workers=2, python=sys.executable):
+        """
+        A pool of warm worker processes that run intents marked "sandbox": true. The workers are only started
+        once there is a sandboxed intent to preload or run.
+        :param workers: Number of worker processes, and so of sandboxed intents that can run at once.
+        :param python: Interpreter the workers run on.
+        """
+        self.size = workers
+        self.python = python
+        self.idle = collections.deque()
+        self.workers = set()
+        self.preload_modules = []
+        self.preload_version = 0
+        self.condition = threading.Condition()
+        self.running = False
+        self.spawned = False
+
+    def start(self):
+        self.running = True
+
+    def _ensure_workers(self):
+        """
+        Starts the worker processes the first time they are needed.
+        """
+        with self.condition:
+            if self.spawned or not self.running:
+                return
+            self.spawned = True
+        for _ in range(self.size):
+            self._add_worker()
+        module_logger.info(f'Started {self.size} intent sandbox workers')
+
+    def stop(self):
+        with self.condition:
+            self.running = False
+            workers = list(self.workers)
+            self.workers.clear()
+            self.idle.clear()
+            self.condition.notify_all()
+        for worker in workers:
+            self._kill(worker, graceful=True)
+
+    def _spawn(self):
+        parent_socket, child_socket = socket.socketpair()
+        lib_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        env = dict(os.environ)
+        env['PYTHONPATH'] = os.pathsep.join(path for path in (os.getcwd(), lib_root, env.get('PYTHONPATH')) if path)
+        process = subprocess.Popen(
+            [self.python, '-m', 'lib.intent_sandbox', str(child_socket.fileno())],
+            pass_fds=(child_socket.fileno(),), cwd=os.getcwd(), env=env
+        )
+        child_socket.close()
+        worker = _SandboxWorker(process, Connection(parent_socket.detach()))
+        self._send_preload(worker)
+        return worker
+
+    def _send_preload(self, worker):
+        """
+        Sends the worker the modules to preload if they changed since it was last sent them.
+        """
+        if worker.preload_version != self.preload_version:
+            worker.preload_version = self.preload_version
+            worker.connection.send(('preload', self.preload_modules))
+
+    def _add_worker(self):
+        worker = self._spawn()
+        with self.condition:
+            if not self.running:
+                self._kill(worker, graceful=True)
+                return
+            self.workers.add(worker)
+            self.idle.append(worker)
+            self.condition.notify()
+
+    @staticmethod
+    def _kill(worker, graceful=False):
+        try:
+            if graceful:
+                worker.connection.send(('stop',))
+                worker.process.wait(timeout=2)
+        except Exception:
+            pass
+        if worker.process.poll() is None:
+            worker.process.kill()
+            worker.process.wait()
+        worker.connection.close()
+
+    def preload(self, modules):
+        """
+        Imports intent modules in every worker ahead of their first run, starting the workers if needed.
+        Busy workers import them when they are handed their next run.
+        :param modules: List of (intent_name, module_path).
+        """
+        modules = list(modules)
+        with self.condition:
+            if modules == self.preload_modules:
+                return
+            self.preload_modules = modules
+            self.preload_version += 1
+            for worker in self.idle:
+                self._send_preload(worker)
+        if modules:
+            self._ensure_workers()
+
+    def run(self, robot, intent_name, module_path, user_query, should_cancel=None):
+        """
+        Runs an intent's main(robot, user_query) in a worker and returns its result.
+        :param robot: The robot the intent's proxy calls go to.
+        :param should_cancel: Polled while the intent runs; when it returns True the worker is killed.
+        :raises SandboxCancelled: If should_cancel returned True.
+        :raises SandboxError: If the intent raised or its worker died.
+        """
+        self._ensure_workers()
+        with self.condition:
+            while self.running and not self.idle:
+                self.condition.wait()
+            if not self.running:
+                raise SandboxError('Intent sandbox is stopped')
+            worker = self.idle.popleft()
+
+        healthy = False
+        try:
+            with self.condition:
+                self._send_preload(worker)
+            worker.connection.send(('run', intent_name, os.path.abspath(module_path), user_query))
+            result = self._serve(worker, robot, should_cancel)
+            healthy = True
+            return result
+        except SandboxError as e:
+            healthy = not isinstance(e, SandboxCancelled) and worker.process.poll() is None
+            raise
+        except (EOFError, OSError) as e:
+            raise SandboxError(f"Sandbox worker for '{intent_name}' died: {e}")
+        finally:
+            worker.runs += 1
+            self._release(worker, healthy)
+
+    def _release(self, worker, healthy):
+        if healthy:
+            with self.condition:
+                if self.running:
+                    self.idle.append(worker)
+                    self.condition.notify()
+                    return
+        with self.condition:
+            self.workers.discard(worker)
+        self._kill(worker)
+        if self.running:
+            self._add_worker()
+
+    def _serve(self, worker, robot, should_cancel):
+        """
+        Answers the worker's robot requests until the intent finishes.
+        """
+        handles = {ROBOT_HANDLE: robot}
+        connection = worker.connection
+        while True:
+            if not connection.poll(0.1):
+                if should_cancel and should_cancel():
+                    raise SandboxCancelled('Sandboxed intent cancelled')
+                if worker.process.poll() is not None:
+                    raise SandboxError(f'Sandbox worker exited with code {worker.process.returncode}')
+                continue
+
+            message = connection.recv()
+            operation = message[0]
+            if operation == 'result':
+                return message[1]
+            if operation == 'error':
+                module_logger.debug(message[3])
+                raise SandboxError(f'{message[1]}: {message[2]}')
+
+            try:
+                target = handles[message[1]]
+                if operation == 'getattr':
+                    reply = self._encode(getattr(target, message[2]), handles)
+                elif operation == 'setattr':
+                    setattr(target, message[2], self._resolve(message[3], handles))
+                    reply = ('value', None)
+                elif operation == 'call':
+                    reply = self._encode(target(*self._resolve(message[2], handles), **self._resolve(message[3], handles)), handles)
+                elif operation == 'method':
+                    reply = self._encode(getattr(target, message[2])(*self._resolve(message[3], handles)), handles)
+                elif operation == 'bool':
+                    reply = ('value', bool(target))
+                elif operation == 'items':
+                    reply = ('items', [self._encode(item, handles) for item in list(target)])
+                else:
+                    reply = ('error', 'ValueError', f'Unknown operation {operation}')
+            except Exception as e:
+                reply = ('error', type(e).__name__, str(e))
+            connection.send(reply)
+
+    @staticmethod
+    def _encode(value, handles):
+        """
+        Sends plain and picklable values by value. Containers, callables and anything that cannot be
+        pickled or holds the robot (SDK components) are kept in the server and sent as a handle.
+        """
+        if isinstance(value, PLAIN_TYPES):
+            return ('value', value)
+        if not isinstance(value, (dict, list, set, types.ModuleType)) and not callable(value):
+            try:
+                _ValuePickler(io.BytesIO(), handles[ROBOT_HANDLE]).dump(value)
+                return ('value', value)
+            except Exception:
+                pass
+        handle = len(handles)
+        handles[handle] = value
+        return ('ref', handle)
+
+    @classmethod
+    def _resolve(cls, value, handles):
+        if isinstance(value, _Handle):
+            return handles[value.handle]
+        if isinstance(value, (list, tuple)):
+            return type(value)(cls._resolve(item, handles) for item in value)
+        if isinstance(value, dict):
+            return {key: cls._resolve(item, handles) for key, item in value.items()}
+        return value
+
+    def status(self):
+        with self.condition:
+            return {
+                'started': self.spawned,
+                'workers': len(self.workers),
+                'idle': len(self.idle),
+                'processes': [{'pid': worker.process.pid, 'runs': worker.runs} for worker in self.workers],
+            }
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format=f'[sandbox {os.getpid()}] %(levelname)s %(name)s: %(message)s')
+    worker_main(int(sys.argv[1]))
@@ -0,0 +1,97 @@
+import json
+import logging
+import os
+import socket
+import threading
+
+module_logger = logging.getLogger('vector_playground.intent_socket_server')
+
+
+class IntentSocketServer:
+    def __init__(self, socket_path, handler):
+        """
+        Serves intent requests from var/external_intent_processor.py over a Unix socket, so each utterance
+        from wire-pod costs one socket round trip instead of starting and loading a full application.
+
+        Requests and responses are JSON objects, one per line. A connection stays open for as many requests
+        as the client sends.
+        :param socket_path: Path of the Unix socket. A stale socket file left by a previous run is replaced.
+        :param handler: Called with each request dictionary, returns the response dictionary.
+        """
+        self.socket_path = socket_path
+        self.handler = handler
+        self.server_socket = None
+        self.accept_thread = None
+        self.running = False
+
+    def start(self):
+        if os.path.exists(self.socket_path):
+            if self._in_use():
+                raise RuntimeError(f'Another process is already serving intent requests on {self.socket_path}')
+            os.remove(self.socket_path)
+        os.makedirs(os.path.dirname(os.path.abspath(self.socket_path)), exist_ok=True)
+
+        self.server_socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        # Only the user running the server (and so wire-pod, when it runs as the same user) may connect. The
+        # socket is created with these permissions, so there is no window in which others can connect.
+        old_umask = os.umask(0o177)
+        try:
+            self.server_socket.bind(self.socket_path)
+        finally:
+            os.umask(old_umask)
+        self.server_socket.listen(16)
+        self.running = True
+        self.accept_thread = threading.Thread(target=self._accept, daemon=True, name='intent-socket')
+        self.accept_thread.start()
+        module_logger.info(f'Listening for intent requests on {self.socket_path}')
+
+    def _in_use(self):
+        """
+        Returns whether a running server answers on socket_path, as opposed to a stale file left by a previous run.
+        """
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(self.socket_path)
+            return True
+        except OSError:
+            return False
+        finally:
+            probe.close()
+
+    def stop(self):
+        self.running = False
+        if self.server_socket is not None:
+            try:
+                self.server_socket.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            self.server_socket.close()
+        if self.accept_thread is not None and self.accept_thread.is_alive():
+            self.accept_thread.join()
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+
+    def _accept(self):
+        while self.running:
+            try:
+                connection, _ = self.server_socket.accept()
+            except OSError:
+                break
+            threading.Thread(target=self._serve, args=(connection,), daemon=True).start()
+
+    def _serve(self, connection):
+        with connection, connection.makefile('rb') as reader:
+            for line in reader:
+                if not line.strip():
+                    continue
+                try:
+                    response = self.handler(json.loads(line))
+                except json.JSONDecodeError:
+                    response = {'success': False, 'error': 'Invalid JSON'}
+                except Exception as e:
+                    module_logger.error(f'Error handling intent request: {e}')
+                    response = {'success': False, 'error': str(e)}
+                try:
+                    connection.sendall(json.dumps(response).encode('utf-8') + b'\n')
+                except OSError:
+                    break
@@ -0,0 +1,161 @@
+import collections
+import logging
+import sys
+import threading
+import time
+import traceback
+
+from lib.metrics_handler import INTENT_MATCH_DURATION, INTENT_RUNS
+
+module_logger = logging.getLogger('vector_playground.intent_telemetry')
+
+# Upper bounds in seconds of the duration histogram kept per intent
+DURATION_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+NO_MATCH = '(no match)'
+
+OUTCOMES = {
+    'succeeded': 'success',
+    'failed': 'exception',
+    'timed_out': 'timeout',
+    'cancelled': 'cancelled',
+}
+
+
+def _percentiles(values):
+    if not values:
+        return None
+    ordered = sorted(values)
+    pick = lambda fraction: ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+    return {
+        'p50': round(pick(0.5) * 1000, 2),
+        'p95': round(pick(0.95) * 1000, 2),
+        'p99': round(pick(0.99) * 1000, 2),
+        'max': round(ordered[-1] * 1000, 2),
+    }
+
+
+class _IntentStats:
+    def __init__(self, window):
+        self.outcomes = collections.Counter()
+        self.buckets = [0] * (len(DURATION_BUCKETS) + 1)
+        self.durations = collections.deque(maxlen=window)
+        self.queue_waits = collections.deque(maxlen=window)
+        self.match_times = collections.deque(maxlen=window)
+        self.last_error = None
+
+    def to_dict(self):
+        runs = sum(self.outcomes.values())
+        return {
+            'runs': runs,
+            'outcomes': dict(self.outcomes),
+            'error_rate': round((runs - self.outcomes['success']) / runs, 4) if runs else None,
+            'duration_ms': _percentiles(self.durations),
+            'duration_histogram': {
+                **{f'le_{bound}': count for bound, count in zip(DURATION_BUCKETS, self.buckets)},
+                'le_inf': self.buckets[-1],
+            },
+            'queue_wait_ms': _percentiles(self.queue_waits),
+            'match_ms': _percentiles(self.match_times),
+            'last_error': self.last_error,
+        }
+
+
+class IntentTelemetry:
+    def __init__(self, window=500, slow_threshold=10.0, max_slow_samples=50):
+        """
+        Keeps match time, queue wait, duration and outcome of intent runs per intent. Duration counts per
+        bucket cover all runs; percentiles are over the last window runs. Runs still going after
+        slow_threshold seconds are sampled with their query and a snapshot of their stack.
+        :param window: Number of recent values kept per intent for percentiles.
+        :param slow_threshold: Seconds after which a running intent is sampled, or None to turn sampling off.
+        :param max_slow_samples: Number of slow run samples kept.
+        """
+        self.window = window
+        self.slow_threshold = slow_threshold
+        self.intents = {}  # intent name -> _IntentStats
+        self.match_metrics = {}  # match method -> INTENT_MATCH_DURATION child
+        self.run_metrics = {}  # (intent name, outcome) -> INTENT_RUNS child
+        self.slow_samples = collections.deque(maxlen=max_slow_samples)
+        self.lock = threading.Lock()
+
+    def configure(self, window=None, slow_threshold=None, max_slow_samples=None):
+        with self.lock:
+            if window is not None:
+                self.window = window
+            self.slow_threshold = slow_threshold
+            if max_slow_samples is not None:
+                self.slow_samples = collections.deque(self.slow_samples, maxlen=max_slow_samples)
+
+    def _stats(self, intent_name):
+        stats = self.intents.get(intent_name)
+        if stats is None:
+            stats = self.intents[intent_name] = _IntentStats(self.window)
+        return stats
+
+    def record_match(self, intent_name, method, seconds):
+        """
+        Records how long matching a query took. Queries that matched nothing are kept under NO_MATCH.
+        """
+        method = method or 'none'
+        with self.lock:
+            metric = self.match_metrics.get(method)
+            if metric is None:
+                metric = self.match_metrics[method] = INTENT_MATCH_DURATION.labels(method)
+            self._stats(intent_name or NO_MATCH).match_times.append(seconds)
+        metric.observe(seconds)
+
+    def record_run(self, execution):
+        """
+        Records a finished IntentExecution.
+        """
+        outcome = OUTCOMES.get(execution.state, execution.state)
+        with self.lock:
+            metric = self.run_metrics.get((execution.intent_name, outcome))
+            if metric is None:
+                metric = self.run_metrics[execution.intent_name, outcome] = INTENT_RUNS.labels(execution.intent_name, outcome)
+            stats = self._stats(execution.intent_name)
+            stats.outcomes[outcome] += 1
+            if execution.started is not None:
+                duration = execution.finished - execution.started
+                stats.durations.append(duration)
+                stats.buckets[next((index for index, bound in enumerate(DURATION_BUCKETS) if duration <= bound), -1)] += 1
+                stats.queue_waits.append(execution.started - execution.submitted)
+            if execution.error and outcome != 'cancelled':
+                stats.last_error = {'error': execution.error, 'query': execution.query, 'time': execution.finished}
+        metric.inc()
+
+    def sample_slow_run(self, execution):
+        """
+        Records the query and current stack of an execution that is taking longer than slow_threshold.
+        Async intents have no thread of their own, so their sample has no stack.
+        """
+        frame = sys._current_frames().get(execution.thread_ident) if execution.thread_ident else None
+        sample = {
+            'execution_id': execution.id,
+            'intent': execution.intent_name,
+            'serial': execution.serial,
+            'query': execution.query,
+            'elapsed': round(time.time() - execution.started, 3),
+            'time': time.time(),
+            'stack': ''.join(traceback.format_stack(frame)) if frame is not None else None,
+        }
+        with self.lock:
+            self.slow_samples.append(sample)
+        module_logger.warning(f'[{execution.serial}] Intent {execution.intent_name} still running after {sample["elapsed"]}s')
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                'intents': {name: stats.to_dict() for name, stats in sorted(self.intents.items())},
+                'slow_threshold': self.slow_threshold,
+                'slow_samples': list(self.slow_samples),
+            }
+
+    def reset(self):
+        with self.lock:
+            self.intents.clear()
+            self.slow_samples.clear()
+
+
+TELEMETRY = IntentTelemetry()
@@ -0,0 +1,155 @@
+import collections
+import heapq
+import itertools
+import logging
+import threading
+import time
+
+module_logger = logging.getLogger('vector_playground.lease_manager')
+
+
+class LeaseManager:
+    def __init__(self, lease_seconds=10, max_events=100):
+        """
+        Tracks control leases and expires each one at its exact deadline.
+
+        Deadlines are kept in a heap. Renewing a lease pushes a new deadline and leaves the old heap entry
+        behind as stale, so renewals are O(log n) and the expiry thread only ever looks at the earliest deadline.
+        :param lease_seconds: How long a lease lasts without a renewal.
+        :param max_events: How many recent expiry events to keep for inspection.
+        """
+        self.lease_seconds = lease_seconds
+        self.running = False
+        self.leases = {}  # serial -> (user_id, deadline, generation)
+        self.deadlines = []  # heap of (deadline, generation, serial)
+        self.generations = itertools.count()
+        self.condition = threading.Condition()
+        self.listeners = []
+        self.events = collections.deque(maxlen=max_events)
+        self.lease_thread = threading.Thread(target=self._expire_leases, daemon=True)
+
+    def start(self):
+        """
+        Starts the expiry thread.
+        """
+        self.running = True
+        module_logger.info(f'Starting Lease Manager with {self.lease_seconds}s leases')
+        self.lease_thread.start()
+
+    def stop(self):
+        """
+        Stops the expiry thread.
+        """
+        with self.condition:
+            self.running = False
+            self.condition.notify()
+        if self.lease_thread.is_alive():
+            self.lease_thread.join()
+
+    def add_listener(self, callback):
+        """
+        Registers a callback for lease expiry events.
+        :param callback: Called as callback(serial, user_id) from the expiry thread.
+        """
+        self.listeners.append(callback)
+
+    def _push(self, serial, user_id):
+        generation = next(self.generations)
+        deadline = time.monotonic() + self.lease_seconds
+        self.leases[serial] = (user_id, deadline, generation)
+        heapq.heappush(self.deadlines, (deadline, generation, serial))
+        # Wake the expiry thread only if this deadline is now the earliest one
+        if self.deadlines[0][1] == generation:
+            self.condition.notify()
+
+    def acquire(self, serial, user_id):
+        """
+        Starts a lease for a user, replacing any existing lease on the robot.
+        :param serial: The robot serial.
+        :param user_id: The user taking control.
+        """
+        with self.condition:
+            self._push(serial, user_id)
+
+    def renew(self, serial, user_id):
+        """
+        Extends a lease if it is held by the user.
+        :param serial: The robot serial.
+        :param user_id: The user renewing the lease.
+        :return: True if the lease was renewed, False if the user does not hold it.
+        """
+        with self.condition:
+            lease = self.leases.get(serial)
+            if lease is None or lease[0] != user_id:
+                return False
+            self._push(serial, user_id)
+            return True
+
+    def release(self, serial, user_id=None):
+        """
+        Ends a lease without firing an expiry event.
+        :param serial: The robot serial.
+        :param user_id: Only release if held by this user. None releases regardless of holder.
+        :return: True if a lease was released.
+        """
+        with self.condition:
+            lease = self.leases.get(serial)
+            if lease is None or (user_id is not None and lease[0] != user_id):
+                return False
+            # The heap entry goes stale and is dropped when it reaches the top
+            del self.leases[serial]
+            return True
+
+    def holder(self, serial):
+        """
+        Returns the user holding the lease on a robot, or None.
+        """
+        lease = self.leases.get(serial)
+        return lease[0] if lease else None
+
+    def remaining(self, serial):
+        """
+        Returns the seconds left on a robot's lease, or None if there is no lease.
+        """
+        lease = self.leases.get(serial)
+        if lease is None:
+            return None
+        return max(0.0, lease[1] - time.monotonic())
+
+    def recent_events(self):
+        """
+        Returns a list of recent expiry events, oldest first.
+        """
+        return list(self.events)
+
+    def _expire_leases(self):
+        """
+        Sleeps until the earliest deadline and expires leases as their deadlines pass.
+        """
+        while True:
+            expired = []
+            with self.condition:
+                if not self.running:
+                    break
+
+                now = time.monotonic()
+                while self.deadlines and self.deadlines[0][0] <= now:
+                    deadline, generation, serial = heapq.heappop(self.deadlines)
+                    lease = self.leases.get(serial)
+                    if lease is not None and lease[2] == generation:
+                        del self.leases[serial]
+                        expired.append((serial, lease[0]))
+
+                if not expired:
+                    timeout = self.deadlines[0][0] - now if self.deadlines else None
+                    self.condition.wait(timeout)
+                    continue
+
+            for serial, user_id in expired:
+                module_logger.debug(f"Lease for robot {serial} held by {user_id} expired")
+                self.events.append({'serial': serial, 'user_id': user_id, 'expired_at': time.time()})
+                for callback in self.listeners:
+                    try:
+                        callback(serial, user_id)
+                    except Exception as e:
+                        module_logger.error(f"Lease expiry listener failed for robot {serial}: {e}")
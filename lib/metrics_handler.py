@@ -0,0 +1,262 @@
+import bisect
+import logging
+import math
+import threading
+
+module_logger = logging.getLogger('vector_playground.metrics_handler')
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+def _escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape_label(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class _CounterChild:
+    __slots__ = ('value', 'lock')
+
+    def __init__(self):
+        self.value = 0
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self.lock:
+            self.value += amount
+
+    def samples(self, name, labelnames, labelvalues):
+        yield f'{name}_total{_format_labels(labelnames, labelvalues)} {_format_value(self.value)}'
+
+
+class _GaugeChild:
+    __slots__ = ('value', 'lock', 'function')
+
+    def __init__(self):
+        self.value = 0
+        self.lock = threading.Lock()
+        self.function = None
+
+    def set(self, value):
+        self.value = value
+
+    def inc(self, amount=1):
+        with self.lock:
+            self.value += amount
+
+    def dec(self, amount=1):
+        with self.lock:
+            self.value -= amount
+
+    def set_function(self, function):
+        """
+        Reads the gauge from a callable at scrape time instead of a stored value.
+        """
+        self.function = function
+
+    def samples(self, name, labelnames, labelvalues):
+        value = self.function() if self.function else self.value
+        yield f'{name}{_format_labels(labelnames, labelvalues)} {_format_value(value)}'
+
+
+class _HistogramChild:
+    __slots__ = ('buckets', 'counts', 'sum', 'count', 'lock')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    def samples(self, name, labelnames, labelvalues):
+        with self.lock:
+            counts = list(self.counts)
+            total, count = self.sum, self.count
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets + (math.inf,), counts):
+            cumulative += bucket_count
+            le = f'le="{_format_value(float(bound))}"'
+            yield f'{name}_bucket{_format_labels(labelnames, labelvalues, le)} {cumulative}'
+        yield f'{name}_sum{_format_labels(labelnames, labelvalues)} {_format_value(total)}'
+        yield f'{name}_count{_format_labels(labelnames, labelvalues)} {count}'
+
+
+class Metric:
+    def __init__(self, metric_type, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        """
+        A metric family. Call labels() once, when the thing being measured is created, and keep the child;
+        the hot path then only touches the child.
+        :param metric_type: counter, gauge or histogram.
+        :param name: Metric name without the _total suffix.
+        :param documentation: HELP text.
+        :param labelnames: Names of the labels children are keyed by.
+        :param buckets: Upper bounds for histogram buckets, in seconds.
+        """
+        self.metric_type = metric_type
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self.children = {}
+        self.lock = threading.Lock()
+        if not self.labelnames:
+            self._default = self.labels()
+
+    def _new_child(self):
+        if self.metric_type == 'counter':
+            return _CounterChild()
+        if self.metric_type == 'gauge':
+            return _GaugeChild()
+        return _HistogramChild(self.buckets)
+
+    def labels(self, *labelvalues):
+        """
+        Returns the child for the label values, creating it on first use.
+        """
+        key = tuple(str(value) for value in labelvalues)
+        child = self.children.get(key)
+        if child is None:
+            if len(key) != len(self.labelnames):
+                raise ValueError(f'{self.name} expects labels {self.labelnames}, got {key}')
+            with self.lock:
+                child = self.children.setdefault(key, self._new_child())
+        return child
+
+    def remove(self, *labelvalues):
+        """
+        Drops a child, e.g. when a robot is removed.
+        """
+        with self.lock:
+            self.children.pop(tuple(str(value) for value in labelvalues), None)
+
+    # Shortcuts for metrics without labels
+    def inc(self, amount=1):
+        self._default.inc(amount)
+
+    def set(self, value):
+        self._default.set(value)
+
+    def set_function(self, function):
+        self._default.set_function(function)
+
+    def observe(self, value):
+        self._default.observe(value)
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.metric_type}']
+        for labelvalues, child in list(self.children.items()):
+            lines.extend(child.samples(self.name, self.labelnames, labelvalues))
+        return '\n'.join(lines)
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.metrics = {}
+        self.lock = threading.Lock()
+
+    def register(self, metric):
+        with self.lock:
+            if metric.name in self.metrics:
+                raise ValueError(f'Metric {metric.name} is already registered')
+            self.metrics[metric.name] = metric
+        return metric
+
+    def render(self):
+        """
+        Returns every metric in the Prometheus text exposition format.
+        """
+        return '\n'.join(metric.render() for metric in list(self.metrics.values())) + '\n'
+
+
+REGISTRY = MetricsRegistry()
+
+
+def counter(name, documentation, labelnames=()):
+    return REGISTRY.register(Metric('counter', name, documentation, labelnames))
+
+
+def gauge(name, documentation, labelnames=()):
+    return REGISTRY.register(Metric('gauge', name, documentation, labelnames))
+
+
+def histogram(name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+    return REGISTRY.register(Metric('histogram', name, documentation, labelnames, buckets))
+
+
+# HTTP
+HTTP_REQUEST_DURATION = histogram('vector_http_request_duration_seconds', 'HTTP request latency by route.', ('route', 'method'))
+HTTP_REQUESTS = counter('vector_http_requests', 'HTTP requests by route and status.', ('route', 'method', 'status'))
+
+# Camera and detection
+CAMERA_FRAMES = counter('vector_camera_frames', 'Camera frames captured.', ('robot',))
+CAMERA_FPS = gauge('vector_camera_capture_fps', 'Camera frames captured per second.', ('robot',))
+DETECTION_DURATION = histogram('vector_detection_duration_seconds', 'Object and hand detection time per frame.', ('robot',))
+DETECTION_FPS = gauge('vector_detection_fps', 'Frames run through detection per second.', ('robot',))
+JPEG_ENCODE_DURATION = histogram('vector_jpeg_encode_duration_seconds', 'Camera feed JPEG encode time.', ('robot',))
+
+# Status and SDK
+STATUS_POLL_DURATION = histogram('vector_status_poll_duration_seconds', 'Time to poll all robot status and sensors.', ('robot',))
+SDK_CALL_DURATION = histogram('vector_sdk_call_duration_seconds', 'Vector SDK call latency.', ('robot', 'call'))
+SDK_CALL_ERRORS = counter('vector_sdk_call_errors', 'Vector SDK calls that raised.', ('robot', 'call'))
+
+# Connections and runtime
+RECONNECT_ATTEMPTS = counter('vector_reconnect_attempts', 'Robot connection attempts by outcome.', ('robot', 'outcome'))
+THREADS = gauge('vector_threads', 'Live Python threads.')
+THREADS.set_function(threading.active_count)
+
+# Intents
+INTENT_DURATION = histogram('vector_intent_duration_seconds', 'Intent execution time.', ('intent',), buckets=DEFAULT_BUCKETS + (30.0, 60.0))
+INTENT_ERRORS = counter('vector_intent_errors', 'Intent executions that raised.', ('intent',))
+INTENT_QUEUE_DEPTH = gauge('vector_intent_queue_depth', 'Intents waiting for a robot.', ('robot',))
+INTENT_QUEUE_WAIT = histogram('vector_intent_queue_wait_seconds', 'Time intents waited for a robot.', ('robot',), buckets=DEFAULT_BUCKETS + (30.0, 60.0))
+TASK_QUEUE_WAIT = histogram('vector_task_queue_wait_seconds', 'Time robot tasks waited for their resources.', ('robot',), buckets=DEFAULT_BUCKETS + (30.0, 60.0))
+TASK_RUN_TIME = histogram('vector_task_run_seconds', 'Robot task run time.', ('robot', 'task'), buckets=DEFAULT_BUCKETS + (30.0, 60.0))
+INTENT_RUNS = counter('vector_intent_runs', 'Finished intent executions by outcome.', ('intent', 'outcome'))
+INTENT_MATCH_DURATION = histogram('vector_intent_match_duration_seconds', 'Time to match a query to an intent, by match method.', ('method',),
+                                  buckets=(0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05))
+INTENT_CACHE_REQUESTS = counter('vector_intent_cache_requests', 'Intent cache lookups by result.', ('cache', 'result'))
+INTENT_REQUESTS_DEDUPLICATED = counter('vector_intent_requests_deduplicated', 'Intent requests joined to an identical recent request.', ('robot',))
+
+
+class RateGauge:
+    def __init__(self, gauge_child, window=1.0):
+        """
+        Turns a stream of events into a per-second rate, updating the gauge once per window.
+        :param gauge_child: The gauge child to set.
+        :param window: Seconds between updates.
+        """
+        self.gauge_child = gauge_child
+        self.window = window
+        self.events = 0
+        self.window_start = None
+
+    def tick(self, now):
+        if self.window_start is None:
+            self.window_start = now
+        self.events += 1
+        elapsed = now - self.window_start
+        if elapsed >= self.window:
+            self.gauge_child.set(round(self.events / elapsed, 2))
+            self.events = 0
+            self.window_start = now
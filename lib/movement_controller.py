@@ -1,13 +1,34 @@
 import logging
+import time
 
 
 from anki_vector.util import distance_mm, speed_mmps, degrees
 
+from lib.metrics_handler import SDK_CALL_DURATION, SDK_CALL_ERRORS
+
 module_logger = logging.getLogger('vector_playground.movement_controller')
 
+SDK_CALLS = ('set_wheel_motors', 'set_lift_motor', 'set_head_motor', 'stop_all_motors',
+             'drive_straight', 'turn_in_place', 'set_head_angle', 'set_lift_height')
+
 class MovementController:
     def __init__(self, robot):
         self.robot = robot
+        self.call_latency = {call: SDK_CALL_DURATION.labels(robot.serial, call) for call in SDK_CALLS}
+        self.call_errors = {call: SDK_CALL_ERRORS.labels(robot.serial, call) for call in SDK_CALLS}
+
+    def _timed(self, call, func, *args, **kwargs):
+        """
+        Runs an SDK call, recording its latency and counting it if it raises.
+        """
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        except Exception:
+            self.call_errors[call].inc()
+            raise
+        finally:
+            self.call_latency[call].observe(time.perf_counter() - start)
 
     def control_move_wheels(self, left_wheel_speed: float, right_wheel_speed: float, left_wheel_acceleration: float = None, right_wheel_acceleration: float = None):
         """
@@ -22,7 +43,7 @@ class MovementController:
         """
 
         try:
-            self.robot.motors.set_wheel_motors(left_wheel_speed, right_wheel_speed, left_wheel_acceleration, right_wheel_acceleration)
+            self._timed('set_wheel_motors', self.robot.motors.set_wheel_motors, left_wheel_speed, right_wheel_speed, left_wheel_acceleration, right_wheel_acceleration)
         except Exception as e:
             module_logger.error(e)
 
@@ -34,7 +55,7 @@ class MovementController:
         """
 
         try:
-            self.robot.motors.set_lift_motor(speed)
+            self._timed('set_lift_motor', self.robot.motors.set_lift_motor, speed)
         except Exception as e:
             module_logger.error(e)
 
@@ -46,7 +67,7 @@ class MovementController:
         """
 
         try:
-            self.robot.motors.set_head_motor(speed)
+            self._timed('set_head_motor', self.robot.motors.set_head_motor, speed)
         except Exception as e:
             module_logger.error(e)
 
@@ -57,7 +78,7 @@ class MovementController:
         """
 
         try:
-            self.robot.motors.stop_all_motors()
+            self._timed('stop_all_motors', self.robot.motors.stop_all_motors)
         except Exception as e:
             module_logger.error(e)
 
@@ -73,7 +94,7 @@ class MovementController:
         :return:
         """
 
-        self.robot.behavior.drive_straight(distance_mm(distance), speed_mmps(speed), should_play_anim=should_play_anim)
+        self._timed('drive_straight', self.robot.behavior.drive_straight, distance_mm(distance), speed_mmps(speed), should_play_anim=should_play_anim)
 
     def control_turn_in_place(self, angle: float, speed: float=45, accel: float=100, angle_tolerance: float=2, is_absolute:bool=False):
         """
@@ -88,7 +109,7 @@ class MovementController:
         """
 
 
-        self.robot.behavior.turn_in_place(angle=degrees(angle), speed=degrees(speed), accel=degrees(accel), angle_tolerance=degrees(angle_tolerance), is_absolute=is_absolute
+        self._timed('turn_in_place', self.robot.behavior.turn_in_place, angle=degrees(angle), speed=degrees(speed), accel=degrees(accel), angle_tolerance=degrees(angle_tolerance), is_absolute=is_absolute
         )
 
     def control_set_head_angle(self, angle, acceleration: float = 10.0, max_speed: float=10.0, duration: float=0):
@@ -105,7 +126,7 @@ class MovementController:
         :return:
         """
 
-        self.robot.behavior.set_head_angle(angle=degrees(angle), accel=acceleration, max_speed=max_speed, duration=duration)
+        self._timed('set_head_angle', self.robot.behavior.set_head_angle, angle=degrees(angle), accel=acceleration, max_speed=max_speed, duration=duration)
 
     def control_set_lift_height(self, height: float, accel: float =10.0, max_speed: float=10.0, duration: float=0.0):
         """
@@ -119,4 +140,4 @@ class MovementController:
 
         :return:
         """
-        self.robot.behavior.set_lift_height(height=height, accel=accel, max_speed=max_speed, duration=duration)
+        self._timed('set_lift_height', self.robot.behavior.set_lift_height, height=height, accel=accel, max_speed=max_speed, duration=duration)
@@ -0,0 +1,175 @@
+import heapq
+import logging
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from lib.metrics_handler import RECONNECT_ATTEMPTS
+
+module_logger = logging.getLogger('vector_playground.reconnect_scheduler')
+
+ATTEMPT_SCHEDULED = 'scheduled'
+ATTEMPT_CONNECTING = 'connecting'
+ATTEMPT_CONNECTED = 'connected'
+ATTEMPT_FAILED = 'failed'
+ATTEMPT_STOPPED = 'stopped'
+
+
+class ReconnectScheduler:
+    def __init__(self, connect_func, max_workers=4, base_delay=5, max_delay=120, jitter=0.5, connect_timeout=10):
+        """
+        Runs robot connection attempts on a bounded worker pool with exponential backoff.
+
+        Each robot has at most one attempt scheduled or in flight. Failed attempts are retried after
+        base_delay * 2^(failures - 1) seconds, capped at max_delay, with part of the delay randomized so
+        robots that dropped together do not all retry together.
+        :param connect_func: Called as connect_func(bot_config, timeout) on a worker. Returns True if the robot connected.
+        :param max_workers: Maximum number of concurrent connection attempts.
+        :param base_delay: Delay in seconds after the first failure.
+        :param max_delay: Upper bound on the delay between attempts.
+        :param jitter: Fraction (0-1) of each delay that is randomized.
+        :param connect_timeout: Timeout in seconds passed to connect_func.
+        """
+        self.connect_func = connect_func
+        self.max_workers = max_workers
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.jitter = jitter
+        self.connect_timeout = connect_timeout
+        self.running = False
+        self.attempts = {}  # serial -> attempt state dictionary
+        self.queue = []  # heap of (due_time, sequence, serial)
+        self.sequence = 0
+        self.condition = threading.Condition()
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='reconnect')
+        self.scheduler_thread = threading.Thread(target=self._dispatch_attempts, daemon=True)
+
+    def start(self):
+        """
+        Starts dispatching scheduled attempts to the worker pool.
+        """
+        self.running = True
+        module_logger.info(f'Starting Reconnect Scheduler with {self.max_workers} workers')
+        self.scheduler_thread.start()
+
+    def stop(self):
+        """
+        Stops dispatching attempts and drops any that have not started.
+        """
+        with self.condition:
+            self.running = False
+            self.queue.clear()
+            for state in self.attempts.values():
+                if state['state'] == ATTEMPT_SCHEDULED:
+                    state['state'] = ATTEMPT_STOPPED
+            self.condition.notify()
+        if self.scheduler_thread.is_alive():
+            self.scheduler_thread.join()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def schedule(self, bot_config, delay=0):
+        """
+        Schedules a connection attempt for a robot unless one is already scheduled or in flight.
+        :param bot_config: The robot's SDK configuration.
+        :param delay: Seconds to wait before the attempt.
+        :return: True if an attempt was scheduled.
+        """
+        serial = bot_config.get('serial')
+        with self.condition:
+            state = self.attempts.get(serial)
+            if state is None:
+                state = {
+                    'serial': serial,
+                    'name': bot_config.get('name'),
+                    'state': None,
+                    'failures': 0,
+                    'next_attempt': None,
+                    'last_attempt': None,
+                    'last_duration': None,
+                    'last_error': None,
+                }
+                self.attempts[serial] = state
+            elif state['state'] in (ATTEMPT_SCHEDULED, ATTEMPT_CONNECTING):
+                return False
+
+            state['bot_config'] = bot_config
+            self._enqueue(state, delay)
+            return True
+
+    def _enqueue(self, state, delay):
+        due = time.time() + delay
+        state['state'] = ATTEMPT_SCHEDULED
+        state['next_attempt'] = due
+        self.sequence += 1
+        heapq.heappush(self.queue, (due, self.sequence, state['serial']))
+        self.condition.notify()
+
+    def _backoff(self, failures):
+        delay = min(self.max_delay, self.base_delay * 2 ** (failures - 1))
+        return delay * (1 - self.jitter * random.random())
+
+    def _dispatch_attempts(self):
+        """
+        Waits for the next due attempt and hands it to the worker pool.
+        """
+        while True:
+            with self.condition:
+                if not self.running:
+                    break
+
+                now = time.time()
+                if not self.queue or self.queue[0][0] > now:
+                    timeout = self.queue[0][0] - now if self.queue else None
+                    self.condition.wait(timeout)
+                    continue
+
+                _, _, serial = heapq.heappop(self.queue)
+                state = self.attempts[serial]
+                state['state'] = ATTEMPT_CONNECTING
+                state['next_attempt'] = None
+                state['last_attempt'] = now
+                bot_config = state['bot_config']
+
+            self.executor.submit(self._run_attempt, serial, bot_config)
+
+    def _run_attempt(self, serial, bot_config):
+        start = time.time()
+        error = None
+        try:
+            connected = self.connect_func(bot_config, self.connect_timeout)
+        except Exception as e:
+            connected = False
+            error = str(e)
+            module_logger.error(f'Connection attempt for {serial} raised: {e}')
+
+        RECONNECT_ATTEMPTS.labels(serial, 'success' if connected else 'failure').inc()
+
+        with self.condition:
+            state = self.attempts[serial]
+            state['last_duration'] = time.time() - start
+            if connected:
+                state['state'] = ATTEMPT_CONNECTED
+                state['failures'] = 0
+                state['last_error'] = None
+                return
+
+            state['failures'] += 1
+            state['last_error'] = error or 'connection failed'
+            if not self.running:
+                state['state'] = ATTEMPT_STOPPED
+                return
+
+            delay = self._backoff(state['failures'])
+            self._enqueue(state, delay)
+        module_logger.info(f'Retrying {serial} in {delay:.1f}s after {state["failures"]} failed attempts')
+
+    def status(self):
+        """
+        Returns the attempt state of every robot the scheduler has seen.
+        """
+        with self.condition:
+            return {
+                serial: {key: value for key, value in state.items() if key != 'bot_config'}
+                for serial, state in self.attempts.items()
+            }
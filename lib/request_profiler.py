@@ -0,0 +1,159 @@
+import collections
+import logging
+import os
+import random
+import re
+import sys
+import threading
+import time
+
+module_logger = logging.getLogger('vector_playground.request_profiler')
+
+PROFILE_EXTENSION = '.folded'
+
+
+class _StackSampler:
+    def __init__(self, thread_id, interval):
+        """
+        Samples the stack of one thread until stopped.
+        :param thread_id: The thread to sample.
+        :param interval: Seconds between samples.
+        """
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = collections.Counter()
+        self.stop_event = threading.Event()
+        self.start_time = time.perf_counter()
+        self.sampler_thread = threading.Thread(target=self._sample, daemon=True, name='request-profiler')
+        self.sampler_thread.start()
+
+    def _sample(self):
+        while not self.stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+                frame = frame.f_back
+            self.stacks[';'.join(reversed(stack))] += 1
+
+    def stop(self):
+        self.stop_event.set()
+        self.sampler_thread.join()
+        return time.perf_counter() - self.start_time
+
+
+class RequestProfiler:
+    def __init__(self, output_dir, interval=0.001, max_stored=200):
+        """
+        Profiles a fraction of the requests to one route by sampling the request thread's stack.
+        Profiles are written in the collapsed stack format read by flamegraph.pl and speedscope.
+        While disabled, should_profile is a single attribute check.
+        :param output_dir: Directory the profiles are written to.
+        :param interval: Seconds between stack samples.
+        :param max_stored: Oldest profiles beyond this count are deleted.
+        """
+        self.output_dir = output_dir
+        self.interval = interval
+        self.max_stored = max_stored
+        self.enabled = False
+        self.route = None
+        self.fraction = 0.0
+        self.remaining = 0
+        self.lock = threading.Lock()
+
+        os.makedirs(self.output_dir, exist_ok=True)
+
+    def enable(self, route, fraction=1.0, max_profiles=10):
+        """
+        Starts profiling requests to a route.
+        :param route: The Flask URL rule, e.g. /robots/<serial>/camera_feed.
+        :param fraction: Fraction (0-1] of matching requests to profile.
+        :param max_profiles: Profiling switches itself off after this many profiles.
+        """
+        with self.lock:
+            self.route = route
+            self.fraction = fraction
+            self.remaining = max_profiles
+            self.enabled = True
+        module_logger.info(f'Profiling {fraction * 100:.0f}% of requests to {route}, up to {max_profiles} profiles')
+
+    def disable(self):
+        with self.lock:
+            self.enabled = False
+            self.route = None
+            self.remaining = 0
+
+    def status(self):
+        return {
+            'enabled': self.enabled,
+            'route': self.route,
+            'fraction': self.fraction,
+            'remaining': self.remaining,
+        }
+
+    def should_profile(self, route):
+        """
+        Decides whether to profile a request and reserves one of the remaining profiles if so.
+        """
+        if not self.enabled or route != self.route or random.random() >= self.fraction:
+            return False
+        with self.lock:
+            if not self.enabled or self.remaining <= 0:
+                return False
+            self.remaining -= 1
+            if self.remaining == 0:
+                self.enabled = False
+            return True
+
+    def start(self):
+        """
+        Starts sampling the calling thread.
+        :return: A handle to pass to finish().
+        """
+        return _StackSampler(threading.get_ident(), self.interval)
+
+    def finish(self, sampler, route):
+        """
+        Stops sampling and writes the profile.
+        :return: The profile file name.
+        """
+        duration = sampler.stop()
+        route_name = re.sub(r'[^A-Za-z0-9]+', '_', route).strip('_') or 'root'
+        filename = f'{time.strftime("%Y%m%d-%H%M%S")}-{int(time.time() * 1000) % 1000:03d}_{route_name}_{duration * 1000:.0f}ms{PROFILE_EXTENSION}'
+        with open(os.path.join(self.output_dir, filename), 'w') as f:
+            for stack, count in sampler.stacks.most_common():
+                f.write(f'{stack} {count}\n')
+        self._prune()
+        module_logger.debug(f'Wrote profile {filename}')
+        return filename
+
+    def _prune(self):
+        profiles = self.list_profiles()
+        for profile in profiles[self.max_stored:]:
+            try:
+                os.remove(os.path.join(self.output_dir, profile['name']))
+            except OSError:
+                pass
+
+    def list_profiles(self):
+        """
+        Returns the stored profiles, newest first.
+        """
+        profiles = []
+        for name in os.listdir(self.output_dir):
+            if name.endswith(PROFILE_EXTENSION):
+                stat = os.stat(os.path.join(self.output_dir, name))
+                profiles.append({'name': name, 'size': stat.st_size, 'created': stat.st_mtime})
+        return sorted(profiles, key=lambda profile: profile['created'], reverse=True)
+
+    def profile_path(self, name):
+        """
+        Returns the path of a stored profile, or None if the name is not a profile in the output directory.
+        """
+        if os.path.basename(name) != name or not name.endswith(PROFILE_EXTENSION):
+            return None
+        path = os.path.join(self.output_dir, name)
+        return path if os.path.exists(path) else None
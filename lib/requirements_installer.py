@@ -0,0 +1,212 @@
+import hashlib
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+module_logger = logging.getLogger('vector_playground.requirements_installer')
+
+MARKER_FILE = '.requirements_installed'
+
+INSTALL_PENDING = 'pending'
+INSTALL_RUNNING = 'installing'
+INSTALL_FAILED = 'failed'
+
+# Seconds before a failed install is retried, doubled after each further failure
+RETRY_BASE_DELAY = 60
+RETRY_MAX_DELAY = 3600
+
+
+def read_requirements(requirements_path):
+    """
+    Returns the requirement lines of a requirements file without comments and blank lines.
+    Paths given to -r and -c are made absolute so the lines can be merged into another file.
+    """
+    requirements = []
+    base_dir = os.path.dirname(os.path.abspath(requirements_path))
+    with open(requirements_path) as f:
+        for line in f:
+            line = line.split(' #', 1)[0].strip()
+            if not line or line.startswith('#'):
+                continue
+            for option in ('-r ', '-c '):
+                if line.startswith(option):
+                    line = option + os.path.join(base_dir, line[len(option):].strip())
+            requirements.append(line)
+    return requirements
+
+
+def requirements_digest(requirements):
+    return hashlib.sha256('\n'.join(requirements).encode('utf-8')).hexdigest()[:16]
+
+
+class RequirementsInstaller:
+    def __init__(self, on_finished=None):
+        """
+        Installs intent requirements in the background. An intent's requirements count as installed when the
+        marker file in its directory holds the hash of its current requirements, so editing requirements.txt
+        triggers a reinstall. Everything outstanding is merged into one pip run; if that run fails, each
+        intent is retried on its own so one bad file does not hold back the rest. Failed installs are retried
+        by retry_failed with exponential backoff, or right away when the intent is loaded again.
+        :param on_finished: Called with the list of intent names whose install finished, successfully or not.
+        """
+        self.on_finished = on_finished
+        self.pending = {}  # intent name -> {'path', 'requirements', 'digest', 'state', 'error', 'attempts', 'retry_at'}
+        self.lock = threading.Lock()
+        self.install_thread = None
+
+    @staticmethod
+    def _pip():
+        # Locate the pip executable inside the virtual environment
+        venv_pip = os.path.join(os.path.dirname(sys.executable), 'pip')
+        if not os.path.exists(venv_pip):
+            raise RuntimeError(f"pip not found in the virtual environment: {venv_pip}")
+        return venv_pip
+
+    def check(self, intent_name, requirements_path):
+        """
+        Checks whether an intent's requirements are installed and queues them if not.
+        :return: True if the intent can run now, False if it has to wait for an install.
+        """
+        if not os.path.exists(requirements_path):
+            return True
+
+        requirements = read_requirements(requirements_path)
+        if not requirements:
+            return True
+
+        digest = requirements_digest(requirements)
+        marker_path = os.path.join(os.path.dirname(requirements_path), MARKER_FILE)
+        try:
+            with open(marker_path) as f:
+                if f.read().strip() == digest:
+                    return True
+        except OSError:
+            pass
+
+        with self.lock:
+            entry = self.pending.get(intent_name)
+            if entry is None or entry['digest'] != digest:
+                self.pending[intent_name] = {'path': requirements_path, 'requirements': requirements,
+                                             'digest': digest, 'state': INSTALL_PENDING, 'error': None,
+                                             'attempts': 0, 'retry_at': None}
+            elif entry['state'] == INSTALL_FAILED:
+                # Loading the intent again retries a failed install of the same requirements
+                entry['state'] = INSTALL_PENDING
+        return False
+
+    def retry_failed(self, force=False):
+        """
+        Queues failed installs again once their backoff has passed.
+        :param force: Retry every failed install now, regardless of backoff.
+        :return: The names of the intents queued again.
+        """
+        now = time.time()
+        with self.lock:
+            retried = [name for name, entry in self.pending.items()
+                       if entry['state'] == INSTALL_FAILED and (force or entry['retry_at'] <= now)]
+            for name in retried:
+                self.pending[name]['state'] = INSTALL_PENDING
+        if retried:
+            module_logger.info(f"Retrying requirements install for {', '.join(sorted(retried))}")
+        return retried
+
+    def discard(self, intent_name):
+        """
+        Forgets a queued install, e.g. when the intent is removed. An install already running still completes.
+        """
+        with self.lock:
+            entry = self.pending.get(intent_name)
+            if entry is not None and entry['state'] != INSTALL_RUNNING:
+                del self.pending[intent_name]
+
+    def is_pending(self, intent_name):
+        return intent_name in self.pending
+
+    def status(self):
+        with self.lock:
+            return {name: {'state': entry['state'], 'digest': entry['digest'], 'error': entry['error'],
+                           'attempts': entry['attempts'], 'retry_at': entry['retry_at']}
+                    for name, entry in self.pending.items()}
+
+    def start(self):
+        """
+        Starts installing the queued requirements unless an install is already running.
+        """
+        with self.lock:
+            if not any(entry['state'] == INSTALL_PENDING for entry in self.pending.values()):
+                return
+            if self.install_thread is not None and self.install_thread.is_alive():
+                return
+            self.install_thread = threading.Thread(target=self._install_pending, daemon=True, name='requirements-installer')
+            self.install_thread.start()
+
+    def _install_pending(self):
+        while True:
+            with self.lock:
+                batch = {name: entry for name, entry in self.pending.items() if entry['state'] == INSTALL_PENDING}
+                if not batch:
+                    self.install_thread = None
+                    return
+                for entry in batch.values():
+                    entry['state'] = INSTALL_RUNNING
+
+            start = time.time()
+            module_logger.info(f"Installing requirements for {', '.join(sorted(batch))}")
+            results = {}
+            try:
+                merged = list(dict.fromkeys(line for entry in batch.values() for line in entry['requirements']))
+                self._run_pip(merged)
+                results = {name: None for name in batch}
+            except Exception as e:
+                module_logger.warning(f'Merged requirements install failed, installing each intent separately: {e}')
+                for name, entry in batch.items():
+                    try:
+                        self._run_pip(entry['requirements'])
+                        results[name] = None
+                    except Exception as e:
+                        results[name] = str(e)
+                        module_logger.error(f"Failed to install requirements for '{name}': {e}")
+
+            with self.lock:
+                for name, error in results.items():
+                    entry = batch[name]
+                    if error is None:
+                        self._write_marker(entry)
+                    # A newer version of the file may have been queued while pip ran
+                    if self.pending.get(name) is entry:
+                        if error is None:
+                            del self.pending[name]
+                        else:
+                            entry['state'] = INSTALL_FAILED
+                            entry['error'] = error
+                            entry['attempts'] += 1
+                            entry['retry_at'] = time.time() + min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** (entry['attempts'] - 1))
+            module_logger.info(f'Requirements install finished in {time.time() - start:.1f}s')
+
+            if self.on_finished:
+                try:
+                    self.on_finished(sorted(results))
+                except Exception as e:
+                    module_logger.error(f'Error in requirements install callback: {e}')
+
+    def _run_pip(self, requirements):
+        with tempfile.NamedTemporaryFile('w', suffix='.txt', delete=False) as f:
+            f.write('\n'.join(requirements) + '\n')
+            merged_path = f.name
+        try:
+            subprocess.run([self._pip(), 'install', '-r', merged_path], check=True)
+        finally:
+            os.remove(merged_path)
+
+    @staticmethod
+    def _write_marker(entry):
+        marker_path = os.path.join(os.path.dirname(entry['path']), MARKER_FILE)
+        try:
+            with open(marker_path, 'w') as f:
+                f.write(entry['digest'])
+        except OSError as e:
+            module_logger.warning(f'Could not write {marker_path}: {e}')
@@ -14,31 +14,38 @@ from lib.task_manager import TaskManager
 module_logger = logging.getLogger('vector_playground.robot_controller')
 
 class RobotController:
-    def __init__(self, robot, config_data, intent_loader, on_control_lost_callback=None):
+    def __init__(self, robot, config_data, intent_loader, on_control_lost_callback=None, runtime=None):
         """
         Initializes the robot controller.
         :param robot: The robot object.
         :param on_control_lost_callback: A callback function to call when control is lost.
+        :param runtime: SharedRuntime to run the control loop, status polling, camera capture and tasks on,
+            or None for threads of the robot's own.
         """
 
         self.robot = robot
         self.robot.intent_data = {}
         self.on_control_lost_callback = on_control_lost_callback
         self.control_lost_listener_started = False
-        self.status_handler = StatusHandler(self.robot)
+        self.runtime = runtime
+        self.control_job = None
+        self.status_handler = StatusHandler(self.robot, runtime)
         self.robot.status_handler = self.status_handler
         self.object_detector = ObjectDetector(config_data)
-        self.camera_stream = CameraStream(self.robot, self.object_detector)
+        self.camera_stream = CameraStream(self.robot, self.object_detector, runtime=runtime)
         self.movement_controller = MovementController(self.robot)
         self.robot.movement_controller = self.movement_controller
         self.audio_controller = AudioController(self.robot)
         self.robot.audio_controller = self.audio_controller
-        self.intent_controller = IntentController(self.robot, intent_loader)
-        self.task_manager = TaskManager(self.robot)
+        if runtime:
+            self.task_manager = TaskManager(self.robot, loop=runtime.loop, executor=runtime.task_executor)
+        else:
+            self.task_manager = TaskManager(self.robot)
+        self.intent_controller = IntentController(self.robot, intent_loader, self.task_manager)
 
         self.last_task_time = time.time()
         self.running = False
-        self.control_thread = threading.Thread(target=self._control_loop)
+        self.control_thread = None if runtime else threading.Thread(target=self._control_loop)
         self.behavior_thread = threading.Thread(target=self._behavior_control)
 
     def start(self):
@@ -47,7 +54,10 @@ class RobotController:
         """
         self.running = True
         module_logger.info(f'[{self.robot.name}-{self.robot.serial}] Starting Robot Controller')
-        self.control_thread.start()
+        if self.runtime:
+            self.control_job = self.runtime.run_periodic(f'control-{self.robot.serial}', self._control_step, .1, blocking=False)
+        else:
+            self.control_thread.start()
         self.camera_stream.start()
         self.task_manager.start()
         self.status_handler.start()
@@ -63,6 +73,9 @@ class RobotController:
         self.running = False
         self.control_lost_listener_started = False
 
+        if self.control_job is not None:
+            self.control_job.cancel()
+            self.control_job = None
         if self.control_thread is not None and self.control_thread.is_alive():
             self.control_thread.join()
 
@@ -77,23 +90,28 @@ class RobotController:
         The main control loop of the robot, which manages actions and tasks.
         """
         while self.running:
-            # Check if it's time for a new random task (e.g., every 5 seconds)
-            if time.time() - self.last_task_time > 15:
-                # self.task_manager.perform_random_task()
-                # self.last_task_time = time.time()
-                module_logger.info(f'[{self.robot.name}-{self.robot.serial}] Gyroscope: {self.status_handler.gyroscope.x}x {self.status_handler.gyroscope.y}y {self.status_handler.gyroscope.z}z')
-                module_logger.info(f'[{self.robot.name}-{self.robot.serial}] Head Angle: {self.status_handler.head_angle}')
-                module_logger.info(f'[{self.robot.name}-{self.robot.serial}] Lift Height: {self.status_handler.lift_height}')
-                module_logger.info(f'[{self.robot.name}-{self.robot.serial}] Proximity: {self.status_handler.proximity.distance.distance_mm}')
-                module_logger.info(f'[{self.robot.name}-{self.robot.serial}] Accelerometer: {self.status_handler.accelerometer}')
-                module_logger.info(f'[{self.robot.name}-{self.robot.serial}] Position: {self.status_handler.position}')
-                module_logger.info(f'[{self.robot.name}-{self.robot.serial}] Current Status: {self.status_handler.current_statuses}')
-                module_logger.info(f'[{self.robot.name}-{self.robot.serial}] Objects Detected: {self.object_detector.objects_data}')
-                module_logger.info(f'[{self.robot.name}-{self.robot.serial}] Hands Detected: {self.object_detector.hands_data}')
-                self.last_task_time = time.time()
-
+            self._control_step()
             time.sleep(.1)
 
+    def _control_step(self):
+        """
+        One pass of the control loop.
+        """
+        # Check if it's time for a new random task (e.g., every 5 seconds)
+        if time.time() - self.last_task_time > 15:
+            # self.task_manager.perform_random_task()
+            # self.last_task_time = time.time()
+            module_logger.info(f'[{self.robot.name}-{self.robot.serial}] Gyroscope: {self.status_handler.gyroscope.x}x {self.status_handler.gyroscope.y}y {self.status_handler.gyroscope.z}z')
+            module_logger.info(f'[{self.robot.name}-{self.robot.serial}] Head Angle: {self.status_handler.head_angle}')
+            module_logger.info(f'[{self.robot.name}-{self.robot.serial}] Lift Height: {self.status_handler.lift_height}')
+            module_logger.info(f'[{self.robot.name}-{self.robot.serial}] Proximity: {self.status_handler.proximity.distance.distance_mm}')
+            module_logger.info(f'[{self.robot.name}-{self.robot.serial}] Accelerometer: {self.status_handler.accelerometer}')
+            module_logger.info(f'[{self.robot.name}-{self.robot.serial}] Position: {self.status_handler.position}')
+            module_logger.info(f'[{self.robot.name}-{self.robot.serial}] Current Status: {self.status_handler.current_statuses}')
+            module_logger.info(f'[{self.robot.name}-{self.robot.serial}] Objects Detected: {self.object_detector.objects_data}')
+            module_logger.info(f'[{self.robot.name}-{self.robot.serial}] Hands Detected: {self.object_detector.hands_data}')
+            self.last_task_time = time.time()
+
     async def _on_control_lost(self):
         while True:
             await self.robot.conn.control_lost_event.wait()
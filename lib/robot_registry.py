@@ -0,0 +1,111 @@
+import logging
+import threading
+from types import MappingProxyType
+
+module_logger = logging.getLogger('vector_playground.robot_registry')
+
+ROBOT_AVAILABLE = 'available'
+ROBOT_CONTROLLED = 'controlled'
+ROBOT_DISCONNECTED = 'disconnected'
+
+
+class RobotRegistry:
+    def __init__(self):
+        """
+        Keeps track of every configured robot and its connection/control state.
+
+        Writes are serialized by a lock and replace the whole mapping (copy-on-write), so readers can
+        take a snapshot without locking and never see a robot added or changed mid-iteration.
+        Entries are read-only mappings; use the registry methods to change them.
+        """
+        self._lock = threading.Lock()
+        self._robots = MappingProxyType({})
+
+    def snapshot(self):
+        """
+        Returns an immutable view of all robots keyed by serial.
+        """
+        return self._robots
+
+    def get(self, serial):
+        """
+        Returns the read-only entry for a robot, or None if it is not registered.
+        :param serial: The robot serial.
+        """
+        return self._robots.get(serial)
+
+    def __contains__(self, serial):
+        return serial in self._robots
+
+    def __len__(self):
+        return len(self._robots)
+
+    def _replace(self, serial, entry):
+        robots = dict(self._robots)
+        if entry is None:
+            robots.pop(serial, None)
+        else:
+            robots[serial] = MappingProxyType(entry)
+        self._robots = MappingProxyType(robots)
+
+    def put(self, serial, **fields):
+        """
+        Registers a robot, replacing any existing entry.
+        :param serial: The robot serial.
+        :param fields: The entry fields.
+        :return: The new entry.
+        """
+        with self._lock:
+            self._replace(serial, dict(fields, serial=serial))
+            return self._robots[serial]
+
+    def update(self, serial, func=None, **fields):
+        """
+        Updates fields of an existing robot.
+        :param serial: The robot serial.
+        :param func: Optional callable receiving the current entry and returning a dictionary of changes,
+                     for read-modify-write updates such as counters.
+        :param fields: Fields to set.
+        :return: The updated entry, or None if the robot is not registered.
+        """
+        with self._lock:
+            current = self._robots.get(serial)
+            if current is None:
+                return None
+            entry = dict(current)
+            if func is not None:
+                entry.update(func(current))
+            entry.update(fields)
+            self._replace(serial, entry)
+            return self._robots[serial]
+
+    def compare_and_set(self, serial, expected, **fields):
+        """
+        Atomically updates a robot only if its current entry matches the expected values.
+        :param serial: The robot serial.
+        :param expected: Dictionary of field values the current entry must have. A tuple value matches any of its items.
+        :param fields: Fields to set when the entry matches.
+        :return: The updated entry, or None if the robot is missing or did not match.
+        """
+        with self._lock:
+            current = self._robots.get(serial)
+            if current is None:
+                return None
+            for key, value in expected.items():
+                if isinstance(value, tuple):
+                    if current.get(key) not in value:
+                        return None
+                elif current.get(key) != value:
+                    return None
+            entry = dict(current)
+            entry.update(fields)
+            self._replace(serial, entry)
+            return self._robots[serial]
+
+    def remove(self, serial):
+        """
+        Removes a robot from the registry.
+        :param serial: The robot serial.
+        """
+        with self._lock:
+            self._replace(serial, None)
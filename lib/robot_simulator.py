@@ -0,0 +1,477 @@
+"""
+Simulated Vector robots for load and scaling tests.
+
+A SimulatedRobot implements the parts of anki_vector.Robot that RobotController, StatusHandler, CameraStream
+and TaskManager use. Its state and camera frames come from a trace, either recorded from a real robot with
+
+    python -m lib.robot_simulator record <serial> var/traces/desk --duration 60
+
+or generated synthetically. SDK calls that go over the network on a real robot (motors, behaviors, battery
+state, connect) sleep for a configurable latency plus seeded jitter, so a run with the same trace and seed
+is repeatable.
+"""
+
+import argparse
+import asyncio
+import bisect
+import json
+import logging
+import os
+import random
+import threading
+import time
+from types import SimpleNamespace
+
+import cv2
+import numpy as np
+from PIL import Image
+
+module_logger = logging.getLogger('vector_playground.robot_simulator')
+
+CAMERA_WIDTH = 640
+CAMERA_HEIGHT = 360
+TRACE_FILE = 'trace.json'
+FRAMES_DIR = 'frames'
+
+_trace_cache = {}
+_trace_cache_lock = threading.Lock()
+
+
+def _synthetic_frames(count=8):
+    """
+    Builds a short loop of RGBA camera frames with a moving bar so every frame is different.
+    """
+    frames = []
+    gradient = np.tile(np.linspace(0, 255, CAMERA_WIDTH, dtype=np.uint8), (CAMERA_HEIGHT, 1))
+    for index in range(count):
+        rgba = np.zeros((CAMERA_HEIGHT, CAMERA_WIDTH, 4), dtype=np.uint8)
+        rgba[..., 0] = gradient
+        rgba[..., 1] = np.roll(gradient, index * CAMERA_WIDTH // count, axis=1)
+        rgba[..., 2] = 96
+        rgba[..., 3] = 255
+        x = index * CAMERA_WIDTH // count
+        rgba[:, x:x + 20, :3] = 255
+        frames.append(Image.fromarray(rgba, 'RGBA'))
+    return frames
+
+
+def _synthetic_samples(seed, duration=30.0, interval=0.5):
+    """
+    Builds a state trace of a robot sitting on its charger with small sensor noise.
+    """
+    rng = random.Random(seed)
+    samples = []
+    for index in range(int(duration / interval)):
+        samples.append({
+            't': index * interval,
+            'status': 0x1000 | (0x2000 if index % 20 < 10 else 0),
+            'battery': {'battery_volts': round(3.9 + rng.random() * 0.2, 3), 'battery_level': 2,
+                        'is_charging': index % 20 < 10, 'is_on_charger_platform': True},
+            'gyro': [round(rng.gauss(0, 0.01), 4) for _ in range(3)],
+            'accel': [round(rng.gauss(0, 5), 2), round(rng.gauss(0, 5), 2), round(9800 + rng.gauss(0, 5), 2)],
+            'pose': [0.0, 0.0, 0.0],
+            'head_angle_rad': 0.0,
+            'lift_height_mm': 32.0,
+            'proximity_mm': round(400 + rng.gauss(0, 3), 1),
+            'touch': [False, 4600 + rng.randint(-20, 20)],
+        })
+    return samples
+
+
+class RobotTrace:
+    def __init__(self, samples, frames, frame_times, duration):
+        """
+        A recorded run of robot state and camera frames, replayed in a loop.
+        :param samples: State samples sorted by their 't' offset in seconds.
+        :param frames: RGBA PIL images.
+        :param frame_times: Offset in seconds of each frame.
+        :param duration: Length of the trace in seconds; replay wraps around after it.
+        """
+        self.samples = samples
+        self.sample_times = [sample['t'] for sample in samples]
+        self.frames = frames
+        self.frame_times = frame_times
+        self.duration = duration
+
+    @classmethod
+    def load(cls, path):
+        """
+        Loads a trace directory written by record_trace. Traces are cached, so robots replaying the same
+        trace share its decoded frames.
+        """
+        path = os.path.abspath(path)
+        with _trace_cache_lock:
+            trace = _trace_cache.get(path)
+            if trace is None:
+                with open(os.path.join(path, TRACE_FILE)) as f:
+                    data = json.load(f)
+                frames = [Image.open(os.path.join(path, frame['file'])).convert('RGBA') for frame in data['frames']]
+                frame_times = [frame['t'] for frame in data['frames']]
+                trace = cls(data['samples'], frames, frame_times, data['duration'])
+                _trace_cache[path] = trace
+                module_logger.info(f'Loaded trace {path}: {len(trace.samples)} samples, {len(frames)} frames, {trace.duration:.1f}s')
+        return trace
+
+    @classmethod
+    def synthetic(cls, seed=0, fps=15):
+        samples = _synthetic_samples(seed)
+        frames = _synthetic_frames()
+        duration = samples[-1]['t'] + 0.5
+        frame_count = int(duration * fps)
+        return cls(samples, [frames[index % len(frames)] for index in range(frame_count)],
+                   [index / fps for index in range(frame_count)], duration)
+
+    def sample_at(self, elapsed):
+        index = bisect.bisect_right(self.sample_times, elapsed % self.duration) - 1
+        return self.samples[max(index, 0)]
+
+    def frame_at(self, elapsed):
+        """
+        Returns (frame_number, image) of the latest frame at an offset. The frame number keeps counting across loops.
+        """
+        if not self.frames:
+            return None, None
+        loops, offset = divmod(elapsed, self.duration)
+        index = max(bisect.bisect_right(self.frame_times, offset) - 1, 0)
+        return int(loops) * len(self.frames) + index, self.frames[index]
+
+
+class SimulatedLatency:
+    def __init__(self, latency_ms=0.0, jitter_ms=0.0, seed=0):
+        """
+        Sleeps for latency plus uniformly distributed jitter on every simulated network call.
+        :param latency_ms: Fixed delay per call.
+        :param jitter_ms: Upper bound of the random extra delay.
+        :param seed: Seed for the jitter, so runs are repeatable.
+        """
+        self.latency = latency_ms / 1000
+        self.jitter = jitter_ms / 1000
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+
+    def wait(self):
+        if not self.latency and not self.jitter:
+            return
+        with self.lock:
+            delay = self.latency + self.jitter * self.rng.random()
+        time.sleep(delay)
+
+
+class SimulatedCamera:
+    def __init__(self, robot):
+        self.robot = robot
+        self.started = False
+        self.image_id = None
+        self.image = None
+
+    def init_camera_feed(self):
+        self.started = True
+
+    def close_camera_feed(self):
+        self.started = False
+
+    @property
+    def _latest_image(self):
+        if not self.started:
+            return None
+        frame_number, image = self.robot.trace.frame_at(self.robot.elapsed())
+        if frame_number != self.image_id:
+            self.image_id = frame_number
+            self.image = SimpleNamespace(raw_image=image, image_id=frame_number)
+        return self.image
+
+    @property
+    def latest_image(self):
+        return self._latest_image
+
+
+class SimulatedMotors:
+    def __init__(self, robot):
+        self.robot = robot
+
+    def set_wheel_motors(self, left_wheel_speed, right_wheel_speed, left_wheel_accel=None, right_wheel_accel=None):
+        self.robot.latency.wait()
+        self.robot.record_call('set_wheel_motors', left_wheel_speed, right_wheel_speed)
+
+    def set_lift_motor(self, speed):
+        self.robot.latency.wait()
+        self.robot.record_call('set_lift_motor', speed)
+
+    def set_head_motor(self, speed):
+        self.robot.latency.wait()
+        self.robot.record_call('set_head_motor', speed)
+
+    def stop_all_motors(self):
+        self.robot.latency.wait()
+        self.robot.record_call('stop_all_motors')
+
+
+class SimulatedBehavior:
+    def __init__(self, robot):
+        self.robot = robot
+
+    def __getattr__(self, name):
+        # Every behavior (say_text, drive_on_charger, set_head_angle, ...) completes after one round trip
+        def behavior(*args, **kwargs):
+            self.robot.latency.wait()
+            self.robot.record_call(name, *args)
+        return behavior
+
+
+class SimulatedEvents:
+    def __init__(self):
+        self.handlers = {}
+        self.lock = threading.Lock()
+
+    def subscribe(self, handler, event_type, *args):
+        with self.lock:
+            self.handlers.setdefault(event_type, []).append((handler, args))
+
+    def unsubscribe(self, handler, event_type):
+        with self.lock:
+            self.handlers[event_type] = [entry for entry in self.handlers.get(event_type, []) if entry[0] != handler]
+
+    def dispatch(self, event_type, event):
+        """
+        Calls the subscribed handlers the way the SDK does: handler(robot, event_type, event, *args).
+        """
+        with self.lock:
+            handlers = list(self.handlers.get(event_type, []))
+        for handler, args in handlers:
+            handler(None, event_type, event, *args)
+
+
+class SimulatedConnection:
+    def __init__(self):
+        """
+        Mirrors the SDK connection: an asyncio loop on its own thread and a control_lost_event on that loop.
+        """
+        self.loop = asyncio.new_event_loop()
+        self.control_lost_event = None
+        ready = threading.Event()
+        self.connection_thread = threading.Thread(target=self._run_loop, args=(ready,), daemon=True)
+        self.connection_thread.start()
+        ready.wait()
+
+    def _run_loop(self, ready):
+        asyncio.set_event_loop(self.loop)
+        self.control_lost_event = asyncio.Event()
+        ready.set()
+        self.loop.run_forever()
+
+    def lose_control(self):
+        """
+        Fires control_lost_event as the SDK does when another client takes behavior control.
+        """
+        self.loop.call_soon_threadsafe(self.control_lost_event.set)
+
+    def close(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.connection_thread.join()
+
+
+class SimulatedRobot:
+    def __init__(self, serial=None, config=None, trace=None, latency_ms=None, jitter_ms=None, seed=None, clock=time.monotonic, **kwargs):
+        """
+        Stands in for anki_vector.Robot, replaying a trace of state and camera frames.
+        The sim_* keys of the robot's SDK configuration are used for any argument not given.
+        :param serial: The robot serial.
+        :param config: The robot's SDK configuration.
+        :param trace: A RobotTrace or a trace directory (sim_trace). Defaults to a synthetic trace.
+        :param latency_ms: Delay of each simulated network call (sim_latency_ms).
+        :param jitter_ms: Random extra delay of each simulated network call (sim_jitter_ms).
+        :param seed: Seed for the jitter and the trace start offset (sim_seed). Defaults to one derived from the serial.
+        :param clock: Time source; replace it to step the simulation manually.
+        """
+        config = config or {}
+        self.serial = serial
+        self.name = config.get('name', serial)
+        if seed is None:
+            seed = int(config.get('sim_seed', sum(ord(c) for c in str(serial))))
+        if trace is None:
+            trace = config.get('sim_trace')
+        if trace is None:
+            trace = RobotTrace.synthetic(seed)
+        elif isinstance(trace, str):
+            trace = RobotTrace.load(trace)
+
+        self.trace = trace
+        self.seed = seed
+        self.clock = clock
+        # Robots replaying the same trace start at different points so they are not in lockstep
+        self.start_offset = random.Random(seed).random() * trace.duration
+        self.started = clock()
+        self.latency = SimulatedLatency(
+            float(config.get('sim_latency_ms', 0)) if latency_ms is None else latency_ms,
+            float(config.get('sim_jitter_ms', 0)) if jitter_ms is None else jitter_ms,
+            seed,
+        )
+        self.calls = []
+        self.calls_lock = threading.Lock()
+
+        self.camera = SimulatedCamera(self)
+        self.motors = SimulatedMotors(self)
+        self.behavior = SimulatedBehavior(self)
+        self.events = SimulatedEvents()
+        self.conn = None
+
+    def elapsed(self):
+        return self.clock() - self.started + self.start_offset
+
+    def record_call(self, name, *args):
+        """
+        Keeps the last 1000 SDK calls so a test can check what the controller sent.
+        """
+        with self.calls_lock:
+            self.calls.append((self.elapsed(), name, args))
+            del self.calls[:-1000]
+
+    def _sample(self):
+        return self.trace.sample_at(self.elapsed())
+
+    @property
+    def status(self):
+        return SimpleNamespace(_status=self._sample()['status'])
+
+    @property
+    def gyro(self):
+        x, y, z = self._sample()['gyro']
+        return SimpleNamespace(x=x, y=y, z=z)
+
+    @property
+    def accel(self):
+        x, y, z = self._sample()['accel']
+        return SimpleNamespace(x=x, y=y, z=z)
+
+    @property
+    def pose(self):
+        x, y, z = self._sample()['pose']
+        return SimpleNamespace(position=SimpleNamespace(x=x, y=y, z=z))
+
+    @property
+    def head_angle_rad(self):
+        return self._sample()['head_angle_rad']
+
+    @property
+    def lift_height_mm(self):
+        return self._sample()['lift_height_mm']
+
+    @property
+    def proximity(self):
+        distance = SimpleNamespace(distance_mm=self._sample()['proximity_mm'])
+        return SimpleNamespace(last_sensor_reading=SimpleNamespace(distance=distance))
+
+    @property
+    def touch(self):
+        is_being_touched, raw_touch_value = self._sample()['touch']
+        return SimpleNamespace(last_sensor_reading=SimpleNamespace(is_being_touched=is_being_touched, raw_touch_value=raw_touch_value))
+
+    def connect(self, timeout=10):
+        self.latency.wait()
+        self.conn = SimulatedConnection()
+
+    def disconnect(self):
+        if self.conn:
+            self.conn.close()
+            self.conn = None
+
+    def get_battery_state(self):
+        self.latency.wait()
+        return SimpleNamespace(**self._sample()['battery'])
+
+
+class SimulatedObjectDetector:
+    def __init__(self, config_data=None, min_detection_confidence=0.68):
+        """
+        Drop-in for ObjectDetector that skips the models and only converts the frame to BGR.
+        """
+        self.hands_data = []
+        self.objects_data = []
+
+    def process_frame(self, frame):
+        return cv2.cvtColor(frame, cv2.COLOR_RGB2BGR)
+
+
+def simulated_sdk_config(count, trace=None, latency_ms=0, jitter_ms=0):
+    """
+    Returns SDK configuration entries for a fleet of simulated robots, in the format load_sdk_configuration returns.
+    """
+    fleet = []
+    for index in range(count):
+        bot_config = {'serial': f'00sim{index:03d}', 'name': f'Sim-{index}', 'ip': '127.0.0.1', 'cert': '', 'guid': '',
+                      'sim_latency_ms': str(latency_ms), 'sim_jitter_ms': str(jitter_ms), 'sim_seed': str(index)}
+        if trace:
+            bot_config['sim_trace'] = trace
+        fleet.append(bot_config)
+    return fleet
+
+
+def _read_state(robot):
+    battery = robot.get_battery_state()
+    position = robot.pose.position
+    touch = robot.touch.last_sensor_reading
+    return {
+        'status': robot.status._status,
+        'battery': {'battery_volts': battery.battery_volts, 'battery_level': battery.battery_level,
+                    'is_charging': battery.is_charging, 'is_on_charger_platform': battery.is_on_charger_platform},
+        'gyro': [robot.gyro.x, robot.gyro.y, robot.gyro.z],
+        'accel': [robot.accel.x, robot.accel.y, robot.accel.z],
+        'pose': [position.x, position.y, position.z],
+        'head_angle_rad': robot.head_angle_rad,
+        'lift_height_mm': robot.lift_height_mm,
+        'proximity_mm': robot.proximity.last_sensor_reading.distance.distance_mm,
+        'touch': [touch.is_being_touched, touch.raw_touch_value],
+    }
+
+
+def record_trace(robot, output_dir, duration=60, interval=0.5):
+    """
+    Records state samples and camera frames from a connected robot into a trace directory.
+    :param robot: A connected anki_vector.Robot.
+    :param output_dir: Directory to write trace.json and the frames to.
+    :param duration: Seconds to record.
+    :param interval: Seconds between state samples.
+    """
+    os.makedirs(os.path.join(output_dir, FRAMES_DIR), exist_ok=True)
+    robot.camera.init_camera_feed()
+    samples, frames = [], []
+    last_image_id = None
+    start = time.monotonic()
+    next_sample = start
+    while (now := time.monotonic()) - start < duration:
+        if now >= next_sample:
+            samples.append({'t': round(now - start, 3), **_read_state(robot)})
+            next_sample += interval
+
+        image = robot.camera.latest_image
+        if image is not None and image.image_id != last_image_id:
+            last_image_id = image.image_id
+            filename = os.path.join(FRAMES_DIR, f'{len(frames):06d}.jpg')
+            image.raw_image.convert('RGB').save(os.path.join(output_dir, filename), quality=85)
+            frames.append({'t': round(now - start, 3), 'file': filename})
+        time.sleep(0.01)
+
+    with open(os.path.join(output_dir, TRACE_FILE), 'w') as f:
+        json.dump({'duration': duration, 'samples': samples, 'frames': frames}, f)
+    module_logger.info(f'Recorded {len(samples)} samples and {len(frames)} frames to {output_dir}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Record a robot trace for the simulator.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    record = subparsers.add_parser('record', help='Record state and camera frames from a real robot')
+    record.add_argument('serial', help='Serial of a robot configured with the Vector SDK')
+    record.add_argument('output_dir', help='Directory to write the trace to')
+    record.add_argument('--duration', type=float, default=60, help='Seconds to record')
+    record.add_argument('--interval', type=float, default=0.5, help='Seconds between state samples')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    import anki_vector
+
+    with anki_vector.Robot(args.serial) as robot:
+        record_trace(robot, args.output_dir, args.duration, args.interval)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,221 @@
+import collections
+import hashlib
+import json
+import logging
+import secrets
+import sqlite3
+import threading
+import time
+
+from flask.sessions import SessionInterface, SessionMixin
+from werkzeug.datastructures import CallbackDict
+
+module_logger = logging.getLogger('vector_playground.session_handler')
+
+
+class MemorySession(CallbackDict, SessionMixin):
+    def __init__(self, initial=None, sid=None, new=False, token_auth=False):
+        """
+        A server side session held in memory.
+        :param initial: Initial session data.
+        :param sid: The session id stored in the client cookie.
+        :param new: True if the session was created for this request.
+        :param token_auth: True if the session belongs to a bearer token request and must never be saved.
+        """
+
+        def on_update(session):
+            session.modified = True
+
+        CallbackDict.__init__(self, initial, on_update)
+        self.sid = sid
+        self.new = new
+        self.token_auth = token_auth
+        self.modified = False
+
+
+class MemorySessionInterface(SessionInterface):
+    def __init__(self, sqlite_path=None, api_tokens=None, prune_interval=300, max_sessions=10000):
+        """
+        Session interface that keeps sessions in a dictionary, optionally persisted to SQLite.
+        Sessions are only written to SQLite when their contents change, so polling requests never touch disk.
+        :param sqlite_path: Path to a SQLite database used to persist sessions across restarts, or None.
+        :param api_tokens: Dictionary of bearer token to client name for programmatic clients.
+        :param prune_interval: Seconds between sweeps of expired sessions.
+        :param max_sessions: Sessions kept before the least recently used ones are evicted.
+        """
+        self.sqlite_path = sqlite_path
+        self.prune_interval = prune_interval
+        self.max_sessions = max_sessions
+        self.sessions = collections.OrderedDict()  # sid -> (data, expiry), least recently used first
+        self.lock = threading.Lock()
+        self.last_prune = time.time()
+
+        # Tokens are looked up by digest so the raw values are not kept around
+        self.api_tokens = {
+            self._hash_token(token): name for token, name in (api_tokens or {}).items()
+        }
+
+        if self.sqlite_path:
+            self._init_db()
+            self._load_sessions()
+
+    @staticmethod
+    def _hash_token(token):
+        return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+    def _connect(self):
+        return sqlite3.connect(self.sqlite_path, timeout=5)
+
+    def _init_db(self):
+        with self._connect() as conn:
+            conn.execute('CREATE TABLE IF NOT EXISTS sessions (sid TEXT PRIMARY KEY, data TEXT NOT NULL, expiry REAL NOT NULL)')
+
+    def _load_sessions(self):
+        """
+        Loads every unexpired session from SQLite into memory.
+        """
+        now = time.time()
+        try:
+            with self._connect() as conn:
+                conn.execute('DELETE FROM sessions WHERE expiry <= ?', (now,))
+                rows = conn.execute('SELECT sid, data, expiry FROM sessions ORDER BY expiry').fetchall()
+        except sqlite3.Error as e:
+            module_logger.error(f'Failed to load sessions from {self.sqlite_path}: {e}')
+            return
+
+        for sid, data, expiry in rows:
+            try:
+                self.sessions[sid] = (json.loads(data), expiry)
+            except json.JSONDecodeError:
+                module_logger.warning(f'Discarding unreadable session {sid}')
+        self._evict(self._overflow())
+        module_logger.info(f'Loaded {len(self.sessions)} sessions from {self.sqlite_path}')
+
+    def _persist(self, sid, data, expiry):
+        if not self.sqlite_path:
+            return
+        try:
+            with self._connect() as conn:
+                conn.execute('INSERT OR REPLACE INTO sessions (sid, data, expiry) VALUES (?, ?, ?)', (sid, json.dumps(data), expiry))
+        except sqlite3.Error as e:
+            module_logger.error(f'Failed to persist session {sid}: {e}')
+
+    def _delete(self, sid):
+        with self.lock:
+            self.sessions.pop(sid, None)
+        if self.sqlite_path:
+            try:
+                with self._connect() as conn:
+                    conn.execute('DELETE FROM sessions WHERE sid = ?', (sid,))
+            except sqlite3.Error as e:
+                module_logger.error(f'Failed to delete session {sid}: {e}')
+
+    def _overflow(self):
+        """
+        Removes the least recently used sessions beyond max_sessions from memory and returns their ids.
+        Called with the lock held, or before the interface is in use.
+        """
+        evicted = []
+        while len(self.sessions) > self.max_sessions:
+            evicted.append(self.sessions.popitem(last=False)[0])
+        return evicted
+
+    def _evict(self, sids):
+        if not sids:
+            return
+        module_logger.debug(f'Evicted {len(sids)} least recently used sessions')
+        if self.sqlite_path:
+            try:
+                with self._connect() as conn:
+                    conn.executemany('DELETE FROM sessions WHERE sid = ?', [(sid,) for sid in sids])
+            except sqlite3.Error as e:
+                module_logger.error(f'Failed to delete evicted sessions: {e}')
+
+    def _prune(self, now):
+        """
+        Drops expired sessions from memory. Expired rows in SQLite are cleaned up on the next start.
+        """
+        with self.lock:
+            if now - self.last_prune < self.prune_interval:
+                return
+            self.last_prune = now
+            expired = [sid for sid, (_, expiry) in self.sessions.items() if expiry <= now]
+            for sid in expired:
+                del self.sessions[sid]
+        if expired:
+            module_logger.debug(f'Pruned {len(expired)} expired sessions')
+
+    def _token_session(self, request):
+        auth_header = request.headers.get('Authorization', '')
+        if not auth_header.startswith('Bearer '):
+            return None
+
+        client_name = self.api_tokens.get(self._hash_token(auth_header[7:].strip()))
+        if client_name is None:
+            return None
+
+        return MemorySession({'user_id': f'token:{client_name}'}, token_auth=True)
+
+    def open_session(self, app, request):
+        if self.api_tokens:
+            token_session = self._token_session(request)
+            if token_session is not None:
+                return token_session
+
+        now = time.time()
+        self._prune(now)
+
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if sid:
+            entry = self.sessions.get(sid)
+            if entry is not None and entry[1] > now:
+                return MemorySession(dict(entry[0]), sid=sid)
+
+        return MemorySession(sid=secrets.token_urlsafe(32), new=True)
+
+    def save_session(self, app, session, response):
+        if session.token_auth:
+            return
+
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+
+        if not session:
+            if session.modified:
+                self._delete(session.sid)
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+
+        if not self.should_set_cookie(app, session):
+            return
+
+        expires = self.get_expiration_time(app, session)
+        expiry = time.time() + app.permanent_session_lifetime.total_seconds()
+
+        if session.modified or session.new:
+            data = dict(session)
+            with self.lock:
+                self.sessions[session.sid] = (data, expiry)
+                self.sessions.move_to_end(session.sid)
+                evicted = self._overflow()
+            self._persist(session.sid, data, expiry)
+            self._evict(evicted)
+        else:
+            # Refreshing the expiry of an unchanged session stays in memory only
+            with self.lock:
+                entry = self.sessions.get(session.sid)
+                if entry is not None:
+                    self.sessions[session.sid] = (entry[0], expiry)
+                    self.sessions.move_to_end(session.sid)
+
+        response.set_cookie(
+            name,
+            session.sid,
+            expires=expires,
+            httponly=self.get_cookie_httponly(app),
+            domain=domain,
+            path=path,
+            secure=self.get_cookie_secure(app),
+            samesite=self.get_cookie_samesite(app),
+        )
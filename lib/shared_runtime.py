@@ -0,0 +1,103 @@
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+module_logger = logging.getLogger('vector_playground.shared_runtime')
+
+
+class PeriodicJob:
+    def __init__(self, runtime, name, func, interval, blocking=True):
+        """
+        Calls func on the runtime's executor, or on the loop itself if it does not block, then waits interval
+        seconds, until cancelled. Created by SharedRuntime.run_periodic.
+        """
+        self.runtime = runtime
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self.blocking = blocking
+        self.call = None  # concurrent.futures.Future of the latest call
+        self.stopped = False
+        self.finished = threading.Event()
+        self.future = asyncio.run_coroutine_threadsafe(self._run(), runtime.loop)
+
+    async def _run(self):
+        try:
+            while not self.stopped:
+                try:
+                    if self.blocking:
+                        self.call = self.runtime.executor.submit(self.func)
+                        await asyncio.wrap_future(self.call)
+                    else:
+                        self.func()
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    module_logger.error(f'Periodic job {self.name} failed: {e}')
+                await asyncio.sleep(self.interval)
+        finally:
+            self.finished.set()
+
+    def cancel(self, wait=True, timeout=10):
+        """
+        Stops the job. With wait, also waits for a call that is already running to return.
+        """
+        self.stopped = True
+        self.future.cancel()
+        if not wait:
+            return
+        if self.runtime.loop.is_running():
+            self.finished.wait(timeout)
+        call = self.call
+        if call is not None:
+            try:
+                call.result(timeout=timeout)
+            except Exception:
+                pass
+
+
+class SharedRuntime:
+    def __init__(self, workers=8, task_workers=8):
+        """
+        One event loop thread shared by all robots, in place of a control, camera, status and task loop thread
+        per robot. The robots' periodic work runs as coroutines on the loop; the blocking part of each step
+        (SDK reads, frame conversion and detection) runs on the executor. Tasks (behaviors, batches and async
+        intents) make their SDK calls on a second executor, so long behaviors cannot hold up camera capture and
+        status polling.
+        :param workers: Executor threads for periodic jobs, i.e. how many blocking steps run at the same time
+            across all robots.
+        :param task_workers: Executor threads for the robots' tasks; also the loop's default executor.
+        """
+        self.workers = workers
+        self.task_workers = task_workers
+        self.loop = asyncio.new_event_loop()
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='robot-runtime')
+        self.task_executor = ThreadPoolExecutor(max_workers=task_workers, thread_name_prefix='robot-tasks')
+        self.loop.set_default_executor(self.task_executor)
+        self.thread = threading.Thread(target=self._run_loop, daemon=True, name='robot-runtime-loop')
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def start(self):
+        module_logger.info(f'Starting shared robot runtime with {self.workers} job and {self.task_workers} task threads')
+        self.thread.start()
+
+    def stop(self):
+        if self.thread.is_alive():
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.thread.join()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        self.task_executor.shutdown(wait=False, cancel_futures=True)
+
+    def run_periodic(self, name, func, interval, blocking=True):
+        """
+        Calls func every interval seconds (measured from the end of the previous call) until the returned job
+        is cancelled.
+        :param blocking: Whether func blocks and so runs on the executor. Quick functions that only read state
+            run on the loop instead.
+        :return: The PeriodicJob.
+        """
+        return PeriodicJob(self, name, func, interval, blocking)
@@ -0,0 +1,218 @@
+import gzip
+import hashlib
+import json
+import logging
+import mimetypes
+import os
+import re
+import sys
+
+from flask import abort, request, send_file, url_for
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+module_logger = logging.getLogger('vector_playground.static_assets')
+
+DIST_DIR = 'dist'
+MANIFEST_FILE = 'manifest.json'
+
+# Files worth hashing and serving from /assets
+ASSET_EXTENSIONS = ('.css', '.js', '.map', '.svg', '.ttf', '.eot', '.woff', '.woff2', '.png', '.ico')
+
+# Formats that are already compressed and gain nothing from gzip/brotli
+PRECOMPRESSED_EXTENSIONS = ('.woff', '.woff2', '.png', '.ico')
+
+CSS_URL_PATTERN = re.compile(r'url\(\s*([\'"]?)([^\'")]+)\1\s*\)')
+
+CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+
+def _hashed_name(rel_path, content):
+    digest = hashlib.sha256(content).hexdigest()[:12]
+    base, ext = os.path.splitext(rel_path)
+    return f'{base}.{digest}{ext}'
+
+
+def _write_variants(dist_path, content, compress):
+    """
+    Writes a file and, if worthwhile, its gzip and brotli variants.
+    :return: Dictionary of encoding to size in bytes.
+    """
+    os.makedirs(os.path.dirname(dist_path), exist_ok=True)
+    with open(dist_path, 'wb') as f:
+        f.write(content)
+    sizes = {'identity': len(content)}
+    if not compress:
+        return sizes
+
+    gzipped = gzip.compress(content, compresslevel=9, mtime=0)
+    if len(gzipped) < len(content):
+        with open(dist_path + '.gz', 'wb') as f:
+            f.write(gzipped)
+        sizes['gzip'] = len(gzipped)
+
+    if brotli is not None:
+        compressed = brotli.compress(content, quality=11)
+        if len(compressed) < len(content):
+            with open(dist_path + '.br', 'wb') as f:
+                f.write(compressed)
+            sizes['br'] = len(compressed)
+    return sizes
+
+
+def _rewrite_css_urls(css, css_rel_path, manifest):
+    """
+    Points url() references in a stylesheet at the hashed file names.
+    """
+    css_dir = os.path.dirname(css_rel_path)
+
+    def replace(match):
+        quote, target = match.group(1), match.group(2)
+        if target.startswith(('data:', 'http:', 'https:', '/')):
+            return match.group(0)
+        path, _, suffix = target.partition('?')
+        path, _, fragment = path.partition('#')
+        rel_target = os.path.normpath(os.path.join(css_dir, path)).replace(os.sep, '/')
+        hashed = manifest.get(rel_target)
+        if hashed is None:
+            return match.group(0)
+        new_target = os.path.relpath(hashed['file'], css_dir or '.').replace(os.sep, '/')
+        if fragment:
+            new_target += f'#{fragment}'
+        return f'url({quote}{new_target}{quote})'
+
+    return CSS_URL_PATTERN.sub(replace, css)
+
+
+def build_assets(static_folder):
+    """
+    Copies every static asset into static/dist under a content-hashed name, writes gzip and brotli
+    variants next to it and records the mapping in static/dist/manifest.json.
+    Stylesheets are processed last so their url() references can point at the hashed fonts and images.
+    :param static_folder: Path to the Flask static folder.
+    :return: The manifest dictionary.
+    """
+    dist_folder = os.path.join(static_folder, DIST_DIR)
+    sources = []
+    for dirpath, dirnames, filenames in os.walk(static_folder):
+        if os.path.abspath(dirpath).startswith(os.path.abspath(dist_folder)):
+            continue
+        for filename in filenames:
+            if filename.lower().endswith(ASSET_EXTENSIONS):
+                rel_path = os.path.relpath(os.path.join(dirpath, filename), static_folder).replace(os.sep, '/')
+                sources.append(rel_path)
+
+    sources.sort(key=lambda rel_path: (rel_path.endswith('.css'), rel_path))
+
+    manifest = {}
+    for rel_path in sources:
+        with open(os.path.join(static_folder, rel_path), 'rb') as f:
+            content = f.read()
+        original_size = len(content)
+
+        if rel_path.endswith('.css'):
+            content = _rewrite_css_urls(content.decode('utf-8'), rel_path, manifest).encode('utf-8')
+
+        hashed = _hashed_name(rel_path, content)
+        compress = not rel_path.lower().endswith(PRECOMPRESSED_EXTENSIONS)
+        sizes = _write_variants(os.path.join(dist_folder, hashed), content, compress)
+        sizes['original'] = original_size
+        manifest[rel_path] = {'file': hashed, 'sizes': sizes}
+
+    with open(os.path.join(dist_folder, MANIFEST_FILE), 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+
+    return manifest
+
+
+class StaticAssets:
+    def __init__(self, app):
+        """
+        Serves the hashed, precompressed assets produced by build_assets.
+        Templates use asset_url('css/bootstrap.min.css'); when no build exists it falls back to the plain static URL.
+        :param app: The Flask application.
+        """
+        self.app = app
+        self.dist_folder = os.path.join(app.static_folder, DIST_DIR)
+        self.manifest = {}
+        self.served_files = set()
+        self.load_manifest()
+
+        app.add_url_rule('/assets/<path:filename>', 'assets', self.serve)
+        app.jinja_env.globals['asset_url'] = self.url
+
+    def load_manifest(self):
+        manifest_path = os.path.join(self.dist_folder, MANIFEST_FILE)
+        try:
+            with open(manifest_path, 'r') as f:
+                self.manifest = json.load(f)
+        except FileNotFoundError:
+            module_logger.info('No built static assets found, serving files from static/ directly')
+            return
+        except json.JSONDecodeError as e:
+            module_logger.error(f'Invalid static asset manifest {manifest_path}: {e}')
+            return
+
+        self.served_files = {entry['file'] for entry in self.manifest.values()}
+        module_logger.info(f'Loaded {len(self.manifest)} built static assets')
+
+    def url(self, filename):
+        """
+        Returns the URL for a static file, preferring its hashed build.
+        :param filename: Path relative to the static folder.
+        """
+        entry = self.manifest.get(filename)
+        if entry is None:
+            return url_for('static', filename=filename)
+        return url_for('assets', filename=entry['file'])
+
+    def serve(self, filename):
+        """
+        Sends a hashed asset, using the brotli or gzip variant when the client accepts it.
+        """
+        if filename not in self.served_files:
+            abort(404)
+
+        path = os.path.join(self.dist_folder, filename)
+        mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        accepted = request.accept_encodings
+
+        encoding = None
+        for candidate, suffix in (('br', '.br'), ('gzip', '.gz')):
+            if accepted[candidate] and os.path.exists(path + suffix):
+                encoding = candidate
+                path += suffix
+                break
+
+        response = send_file(path, mimetype=mimetype, conditional=True)
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+        response.headers['Vary'] = 'Accept-Encoding'
+        response.headers['Cache-Control'] = CACHE_CONTROL
+        return response
+
+
+def main():
+    static_folder = sys.argv[1] if len(sys.argv) > 1 else os.path.join(os.getcwd(), 'static')
+    if brotli is None:
+        print('brotli is not installed, only gzip variants will be built')
+
+    manifest = build_assets(static_folder)
+
+    totals = {'original': 0, 'gzip': 0, 'br': 0}
+    for rel_path, entry in sorted(manifest.items()):
+        sizes = entry['sizes']
+        best = min(sizes.get('br', sizes['identity']), sizes.get('gzip', sizes['identity']))
+        totals['original'] += sizes['original']
+        totals['gzip'] += sizes.get('gzip', sizes['identity'])
+        totals['br'] += best
+        print(f"{rel_path:<70} {sizes['original'] / 1024:>9.1f} KiB -> {best / 1024:>8.1f} KiB")
+
+    print(f"Total: {totals['original'] / 1024:.1f} KiB raw, {totals['gzip'] / 1024:.1f} KiB gzip, {totals['br'] / 1024:.1f} KiB best")
+
+
+if __name__ == '__main__':
+    main()
@@ -2,15 +2,22 @@ import logging
 import threading
 import time
 
+from lib.metrics_handler import STATUS_POLL_DURATION
+
 module_logger = logging.getLogger('vector_playground.status_handler')
 
 class StatusHandler:
-    def __init__(self, robot):
+    def __init__(self, robot, runtime=None, interval=0.5):
         """
         Initializes the status handler with the robot instance.
         :param robot: The robot object.
+        :param runtime: SharedRuntime to poll on instead of a thread of its own.
+        :param interval: Seconds between polls.
         """
         self.robot = robot
+        self.runtime = runtime
+        self.interval = interval
+        self.poll_job = None
         self.running = False
 
         # Initialize the current_statuses dictionary
@@ -55,14 +62,18 @@ class StatusHandler:
         # Lock for thread-safe operations
         self.lock = threading.Lock()
 
-        self.status_thread = threading.Thread(target=self._monitor_status)
+        self.status_thread = None if runtime else threading.Thread(target=self._monitor_status)
+        self.poll_metric = STATUS_POLL_DURATION.labels(robot.serial)
 
     def start(self):
         """
         Starts monitoring the robot's status in a separate thread.
         """
         self.running = True
-        self.status_thread.start()
+        if self.runtime:
+            self.poll_job = self.runtime.run_periodic(f'status-{self.robot.serial}', self._poll_once, self.interval)
+        else:
+            self.status_thread.start()
 
     def stop(self):
         """
@@ -70,7 +81,10 @@ class StatusHandler:
         """
         module_logger.info(f'[{self.robot.name}-{self.robot.serial}] Stopping status monitoring')
         self.running = False
-        if self.status_thread.is_alive():
+        if self.poll_job is not None:
+            self.poll_job.cancel()
+            self.poll_job = None
+        if self.status_thread is not None and self.status_thread.is_alive():
             self.status_thread.join()
         module_logger.info(f'[{self.robot.name}-{self.robot.serial}] Stopped status monitoring')
 
@@ -79,16 +93,24 @@ class StatusHandler:
         Continuously monitors the robot's status in a loop until stopped.
         """
         while self.running:
-            self._update_status()
-            self._check_battery_state()
-            self._check_gyroscope()
-            self._check_accelerometer()
-            self._check_position()
-            self._check_head_angle()
-            self._check_lift_height()
-            self._check_proximity()
-            self._check_touch()
-            time.sleep(0.5)  # Adjust the polling rate as needed
+            self._poll_once()
+            time.sleep(self.interval)
+
+    def _poll_once(self):
+        """
+        Reads the robot's status and sensors once.
+        """
+        poll_start = time.perf_counter()
+        self._update_status()
+        self._check_battery_state()
+        self._check_gyroscope()
+        self._check_accelerometer()
+        self._check_position()
+        self._check_head_angle()
+        self._check_lift_height()
+        self._check_proximity()
+        self._check_touch()
+        self.poll_metric.observe(time.perf_counter() - poll_start)
 
     def _update_status(self):
         """
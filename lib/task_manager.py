@@ -1,27 +1,144 @@
 import asyncio
+import collections
+import concurrent.futures
+import inspect
+import itertools
 import logging
 import random
 import threading
+import time
+import uuid
 
 from anki_vector.events import Events
 from anki_vector.util import *
 
+from lib.intent_async import AsyncRobot
+from lib.metrics_handler import TASK_QUEUE_WAIT, TASK_RUN_TIME
+
 module_logger = logging.getLogger('vector_playground.task_manager')
 
+# Parts of the robot a task can claim. Tasks whose claims overlap never run at the same time.
+RESOURCE_WHEELS = 'wheels'
+RESOURCE_LIFT = 'lift'
+RESOURCE_HEAD = 'head'
+RESOURCE_SPEAKER = 'speaker'
+RESOURCES_MOTION = frozenset((RESOURCE_WHEELS, RESOURCE_LIFT, RESOURCE_HEAD))
+RESOURCES_ALL = RESOURCES_MOTION | {RESOURCE_SPEAKER}
+
+# What each /robots/<serial>/batch command claims
+BATCH_RESOURCES = {
+    'move_wheels': frozenset((RESOURCE_WHEELS,)),
+    'move_lift': frozenset((RESOURCE_LIFT,)),
+    'move_head': frozenset((RESOURCE_HEAD,)),
+    'stop_all': RESOURCES_MOTION,
+    'wait': frozenset(),
+    # Runs through the intent executor; an async intent claims its own resources when its task starts
+    'user_intent': frozenset(),
+}
+
+TASK_QUEUED = 'queued'
+TASK_RUNNING = 'running'
+TASK_SUCCEEDED = 'succeeded'
+TASK_FAILED = 'failed'
+TASK_CANCELLED = 'cancelled'
+TASK_PREEMPTED = 'preempted'
+
+# Motor calls that stop what a cancelled task left moving, per resource it claimed
+STOP_CALLS = {
+    RESOURCE_WHEELS: lambda motors: motors.set_wheel_motors(0, 0),
+    RESOURCE_LIFT: lambda motors: motors.set_lift_motor(0),
+    RESOURCE_HEAD: lambda motors: motors.set_head_motor(0),
+}
+
+
+class ScheduledTask:
+    def __init__(self, name, coro_factory, resources, priority, replace):
+        self.id = uuid.uuid4().hex
+        self.name = name
+        self.coro_factory = coro_factory
+        self.resources = frozenset(resources)
+        self.priority = priority
+        self.replace = replace
+        self.state = TASK_QUEUED
+        self.submitted = time.time()
+        self.started = None
+        self.finished = None
+        self.error = None
+        self.preempted_by = None
+        self.handle = None  # the asyncio.Task while running
+        self.calls = set()  # executor calls the task started that have not returned yet
+        self.stopping = False  # cancelled, waiting for its motors to stop and its calls to return
+        # Stays pending until the task finishes, so callers can cancel it with future.cancel() at any time
+        self.future = concurrent.futures.Future()
+
+    @property
+    def done(self):
+        return self.state in (TASK_SUCCEEDED, TASK_FAILED, TASK_CANCELLED, TASK_PREEMPTED)
+
+    def to_dict(self):
+        now = time.time()
+        return {
+            'id': self.id,
+            'name': self.name,
+            'priority': self.priority,
+            'resources': sorted(self.resources),
+            'state': self.state,
+            'submitted': self.submitted,
+            'started': self.started,
+            'finished': self.finished,
+            'queue_wait': round((self.started or self.finished or now) - self.submitted, 4),
+            'run_time': round((self.finished or now) - self.started, 4) if self.started else None,
+            'preempted_by': self.preempted_by,
+            'stopping': self.stopping,
+            'error': self.error,
+        }
+
+
 class TaskManager:
-    def __init__(self, robot):
+    def __init__(self, robot, max_history=100, loop=None, executor=None, stop_timeout=10):
         """
-        Initializes the task manager.
+        Initializes the task manager. Tasks are coroutines run on the manager's event loop. Each task claims
+        resources (wheels, lift, head, speaker); tasks with disjoint claims run together, the others wait in
+        priority order. A task may preempt running tasks it conflicts with if they have a lower priority, or
+        the same priority when it is submitted with replace=True.
+
+        Cancelling a task only interrupts its coroutine; an SDK call it started keeps running on the executor.
+        So a cancelled or preempted task keeps its resources until the motors it claimed are stopped and its
+        SDK calls have returned, or stop_timeout passes. SDK behaviors (app intents, drive_on_charger, ...)
+        cannot be aborted half way, so a task preempting one starts once the behavior returns.
         :param robot: The robot object.
+        :param max_history: Number of tasks, finished or not, kept for listing.
+        :param loop: A shared event loop run by someone else (see SharedRuntime) to schedule the tasks on,
+            or None for a loop and thread of the manager's own.
+        :param executor: Executor for the tasks' blocking SDK calls, required with a shared loop. By default the
+            manager creates one and makes it its loop's default executor.
+        :param stop_timeout: Seconds a cancelled task's SDK calls are waited for before its resources are released anyway.
         """
         self.robot = robot
         self.subscribed = False
         self.observed_event = threading.Event()
-        self.loop = asyncio.new_event_loop()
-        self.current_task = None  # Keep track of the current task
-        self.task_lock = threading.Lock()
-        self.task_manager_thread = threading.Thread(target=self._start_loop, daemon=True)
+        self.owns_loop = loop is None
+        self.loop = asyncio.new_event_loop() if self.owns_loop else loop
+        if executor is None:
+            if not self.owns_loop:
+                raise ValueError('A task manager on a shared loop needs the executor that goes with it')
+            executor = concurrent.futures.ThreadPoolExecutor(thread_name_prefix=f'tasks-{robot.serial}')
+            self.loop.set_default_executor(executor)
+        self.executor = executor
+        self.current_task = None  # Last task started by one of the intent_* methods
+        self.queue = []  # waiting tasks; only touched on the loop thread
+        self.running_tasks = {}  # task id -> running ScheduledTask; only touched on the loop thread
+        self.tasks = collections.OrderedDict()  # task id -> ScheduledTask, oldest first
+        self.tasks_lock = threading.Lock()
+        self.handles = {}  # asyncio.Task -> running ScheduledTask; only touched on the loop thread
+        self.queue_wait_metric = TASK_QUEUE_WAIT.labels(robot.serial)
+        self.run_time_metrics = {}  # task name -> TASK_RUN_TIME child
+        self.stop_timeout = stop_timeout
+        self.max_history = max_history
+        self.sequence = itertools.count()
+        self.task_manager_thread = threading.Thread(target=self._start_loop, daemon=True) if self.owns_loop else None
         self.running = False
+        self.async_robot = AsyncRobot(robot, self.loop, self._run_in_executor)
 
     def _start_loop(self):
         """
@@ -38,41 +155,287 @@ class TaskManager:
         module_logger.info(f'[{self.robot.name}-{self.robot.serial}] Starting the Task Manager...')
         self.robot.events.subscribe(self._on_object_observed, Events.robot_observed_object, self.observed_event)
         self.subscribed = True
-        self.task_manager_thread.start()
+        if self.owns_loop:
+            self.task_manager_thread.start()
 
     def stop(self):
         """
-        Stops the event loop and waits for the loop thread to finish.
+        Stops the event loop and waits for the loop thread to finish. On a shared loop, cancels this
+        manager's tasks instead.
         """
         module_logger.info(f'[{self.robot.name}-{self.robot.serial}] Stopping the Task Manager...')
         self.running = False
         if self.subscribed:
             self.robot.events.unsubscribe(self._on_object_observed, Events.robot_observed_object)
             self.subscribed = False
-        self.loop.call_soon_threadsafe(self.loop.stop)
-        self.task_manager_thread.join()
+        if self.owns_loop:
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.task_manager_thread.join()
+            self.executor.shutdown(wait=False)
+        elif self.loop.is_running():
+            self.loop.call_soon_threadsafe(self._cancel_all)
         module_logger.info(f'[{self.robot.name}-{self.robot.serial}] Stopped the Task Manager.')
 
-    def _run_coroutine(self, coro):
+    ################
+    # Scheduling
+    ################
+
+    def submit(self, name, coro_factory, resources=RESOURCES_ALL, priority=0, replace=False):
+        """
+        Queues a task. Safe to call from any thread; never blocks.
+        :param name: Name shown in the task list.
+        :param coro_factory: Called on the loop when the task starts, returns the coroutine to run.
+        :param resources: Resources the task claims while it runs.
+        :param priority: Higher priorities start first and may preempt lower ones.
+        :param replace: Also preempt conflicting tasks of the same priority, so the newest task wins.
+        :return: The ScheduledTask. Its .future resolves to the coroutine's result; cancelling it cancels the task.
         """
-        Schedules a coroutine to run in the event loop.
+        task = ScheduledTask(name, coro_factory, resources, priority, replace)
+        with self.tasks_lock:
+            self.tasks[task.id] = task
+            self._prune()
+        task.future.add_done_callback(lambda future: future.cancelled() and self.cancel(task.id))
+        self.loop.call_soon_threadsafe(self._enqueue, task)
+        return task
+
+    def cancel(self, task_id):
         """
-        with self.task_lock:
-            self.current_task = asyncio.run_coroutine_threadsafe(coro, self.loop)
+        Asks for a queued or running task to be cancelled and returns right away. A running task gets a
+        CancelledError at its next await.
+        :return: False if the task is unknown or already finished.
+        """
+        with self.tasks_lock:
+            task = self.tasks.get(task_id)
+        if task is None or task.done:
+            return False
+        self.loop.call_soon_threadsafe(self._cancel, task)
+        return True
+
+    def list_tasks(self):
+        """
+        Returns the known tasks, newest first, with their queue wait and run time.
+        """
+        with self.tasks_lock:
+            tasks = list(self.tasks.values())
+        return [task.to_dict() for task in reversed(tasks)]
+
+    def _prune(self):
+        excess = len(self.tasks) - self.max_history
+        if excess <= 0:
+            return
+        for task_id in [task_id for task_id, task in self.tasks.items() if task.done][:excess]:
+            del self.tasks[task_id]
+
+    def _enqueue(self, task):
+        if task.future.cancelled():
+            self._finish(task, TASK_CANCELLED)
+            return
+        self.queue.append((-task.priority, next(self.sequence), task))
+        self.queue.sort(key=lambda entry: entry[:2])
+        self._schedule()
+
+    def _cancel(self, task):
+        if task.state == TASK_QUEUED:
+            self.queue = [entry for entry in self.queue if entry[2] is not task]
+            self._finish(task, TASK_CANCELLED)
+            self._schedule()
+        elif task.state == TASK_RUNNING and task.handle is not None:
+            task.handle.cancel()
+
+    def _cancel_all(self):
+        for task in [entry[2] for entry in self.queue] + list(self.running_tasks.values()):
+            self._cancel(task)
+
+    def _can_preempt(self, task, running):
+        return running.priority < task.priority or (task.replace and running.priority <= task.priority)
+
+    def _schedule(self):
+        """
+        Starts every waiting task whose resources are free, in priority order. A task that cannot start
+        reserves its resources, so lower-priority tasks wanting them keep waiting behind it; lower-priority
+        tasks with other resources still start. Runs on the loop thread.
+        """
+        reserved = set()
+        for entry in list(self.queue):
+            task = entry[2]
+            if task.resources & reserved:
+                continue
+            conflicts = [running for running in self.running_tasks.values() if running.resources & task.resources]
+            if not conflicts:
+                self.queue.remove(entry)
+                self._start(task)
+                continue
+            if all(self._can_preempt(task, running) for running in conflicts):
+                for running in conflicts:
+                    if running.preempted_by is None and not running.stopping:
+                        module_logger.info(f'[{self.robot.name}-{self.robot.serial}] Task {task.name} preempts {running.name}')
+                        running.preempted_by = task.id
+                        running.handle.cancel()
+            reserved |= task.resources
+
+    def _start(self, task):
+        task.state = TASK_RUNNING
+        task.started = time.time()
+        self.queue_wait_metric.observe(task.started - task.submitted)
+        self.running_tasks[task.id] = task
+        task.handle = self.loop.create_task(task.coro_factory())
+        self.handles[task.handle] = task
+        # A done callback also sees tasks cancelled before their coroutine ever ran
+        task.handle.add_done_callback(lambda handle: self._on_done(task, handle))
+
+    def _on_done(self, task, handle):
+        self.handles.pop(handle, None)
+        if handle.cancelled():
+            state = TASK_PREEMPTED if task.preempted_by else TASK_CANCELLED
+            if task.calls or task.resources & RESOURCES_MOTION:
+                # The resources stay claimed until the hardware has actually stopped
+                task.stopping = True
+                self.loop.create_task(self._stop_cancelled(task, state))
+                return
+            self._finish(task, state)
+        elif handle.exception() is not None:
+            module_logger.error(f'[{self.robot.name}-{self.robot.serial}] Task {task.name} failed: {handle.exception()}')
+            self._finish(task, TASK_FAILED, exception=handle.exception())
+        else:
+            self._finish(task, TASK_SUCCEEDED, result=handle.result())
+        self.running_tasks.pop(task.id, None)
+        self._schedule()
+
+    async def _stop_cancelled(self, task, state):
+        """
+        Stops the motors a cancelled task claimed and waits for its SDK calls to return, then hands its
+        resources on.
+        """
+        motors = [STOP_CALLS[resource] for resource in sorted(task.resources) if resource in STOP_CALLS]
+        for stop in motors:
+            try:
+                await self.loop.run_in_executor(self.executor, stop, self.robot.motors)
+            except Exception as e:
+                module_logger.error(f'[{self.robot.name}-{self.robot.serial}] Could not stop motors after {task.name}: {e}')
+        if task.calls:
+            _, pending = await asyncio.wait([asyncio.wrap_future(call, loop=self.loop) for call in task.calls],
+                                            timeout=self.stop_timeout)
+            if pending:
+                module_logger.warning(f'[{self.robot.name}-{self.robot.serial}] {task.name} is still running after '
+                                      f'{self.stop_timeout}s, releasing its resources anyway')
+        task.stopping = False
+        self._finish(task, state)
+        self.running_tasks.pop(task.id, None)
+        self._schedule()
+
+    def _finish(self, task, state, result=None, exception=None):
+        task.state = state
+        task.finished = time.time()
+        task.handle = None
+        if task.started is not None:
+            metric = self.run_time_metrics.get(task.name)
+            if metric is None:
+                metric = self.run_time_metrics[task.name] = TASK_RUN_TIME.labels(self.robot.serial, task.name)
+            metric.observe(task.finished - task.started)
+        if exception is not None:
+            task.error = f'{type(exception).__name__}: {exception}'
+            if not task.future.done():
+                task.future.set_exception(exception)
+        elif state == TASK_SUCCEEDED:
+            if not task.future.done():
+                task.future.set_result(result)
+        else:
+            task.future.cancel()
+
+    def _run_in_executor(self, func, *args):
+        """
+        Starts a blocking call on the loop's executor and records it on the task it is made for, so a cancelled
+        task can wait for its calls to return. Called on the loop thread.
+        """
+        call = self.executor.submit(func, *args)
+        task = self.handles.get(asyncio.current_task(self.loop))
+        if task is not None:
+            # Cancelling the awaiting coroutine does not stop a call that already started, so track the call itself
+            task.calls.add(call)
+            call.add_done_callback(lambda call: self.loop.call_soon_threadsafe(task.calls.discard, call))
+        return asyncio.wrap_future(call, loop=self.loop)
+
+    async def _blocking(self, func, *args, **kwargs):
+        """
+        Runs a blocking SDK call on the loop's executor. Awaits the result too if the call returned an awaitable.
+        """
+        result = await self._run_in_executor(lambda: func(*args, **kwargs))
+        if inspect.isawaitable(result):
+            result = await result
+        return result
+
+    def _replace_current_task(self, name, func, *args, resources=RESOURCES_ALL, **kwargs):
+        """
+        Starts an SDK behavior in place of whatever the previous intent_* call started.
+        """
+        module_logger.debug(f'[{self.robot.name}-{self.robot.serial}] Starting {name}')
+        self.current_task = self.submit(name, lambda: self._blocking(func, *args, **kwargs), resources, replace=True)
+        return self.current_task
 
     def cancel_current_task(self):
         """
-        Cancels the currently running task if any.
+        Cancels the task last started by an intent_* method, if any, without waiting for it to stop.
+        """
+        if self.current_task is not None:
+            self.cancel(self.current_task.id)
+            self.current_task = None
+
+    def run_batch(self, steps, stop_on_error=True, priority=0, results=None):
+        """
+        Runs a list of commands in order on the task loop.
+        :param steps: List of (name, func, args, delay) tuples. func is called with args in the loop's executor,
+                      then the batch waits delay seconds before the next step.
+        :param stop_on_error: Skip the remaining steps once one raises.
+        :param priority: Scheduling priority. The batch claims the resources its commands use (see BATCH_RESOURCES).
+        :param results: List each step's result is appended to as soon as the step finishes, so the steps that
+                        ran are known even if the batch is cancelled or preempted.
+        :return: The ScheduledTask. Its future resolves to the list of per-step results.
         """
-        with self.task_lock:
-            if self.current_task:
-                self.current_task.cancel()
-                try:
-                    # Wait for the task to be cancelled
-                    self.current_task.result()
-                except (asyncio.CancelledError, asyncio.InvalidStateError):
-                    module_logger.debug(f'[{self.robot.name}-{self.robot.serial}] Previous task was cancelled.')
-                self.current_task = None
+        resources = frozenset().union(*(BATCH_RESOURCES.get(name, RESOURCES_ALL) for name, _, _, _ in steps))
+        results = [] if results is None else results
+        return self.submit('batch', lambda: self._run_batch(steps, stop_on_error, results), resources, priority)
+
+    async def _run_batch(self, steps, stop_on_error, results):
+        batch_start = time.perf_counter()
+        for index, (name, func, args, delay) in enumerate(steps):
+            step_start = time.perf_counter()
+            step_result = {
+                'step': index,
+                'command': name,
+                'started_ms': round((step_start - batch_start) * 1000, 2),
+            }
+            try:
+                # SDK calls block, so keep them off the loop thread
+                result = await self._run_in_executor(func, *args)
+                step_result['success'] = True
+                step_result['result'] = result if isinstance(result, (str, int, float, bool, type(None), list, dict)) else str(result)
+            except Exception as e:
+                module_logger.error(f'[{self.robot.name}-{self.robot.serial}] Batch step {index} ({name}) failed: {e}')
+                step_result['success'] = False
+                step_result['message'] = str(e)
+            step_result['duration_ms'] = round((time.perf_counter() - step_start) * 1000, 2)
+            results.append(step_result)
+
+            if not step_result['success'] and stop_on_error:
+                break
+            if delay:
+                await asyncio.sleep(delay)
+        return results
+
+    def run_intent(self, main, user_query, name=None, resources=(), priority=0):
+        """
+        Runs an async intent's main(robot, user_query) as a task on the loop. The intent gets the AsyncRobot.
+        By default it claims no resources, so any number of async intents run side by side.
+        :return: A concurrent.futures.Future for the intent's result. Cancelling it cancels the task.
+        """
+        return self.submit(f'intent:{name}', lambda: self._run_intent(main, user_query, name), resources, priority).future
+
+    async def _run_intent(self, main, user_query, name):
+        try:
+            return await main(self.async_robot, user_query)
+        except asyncio.CancelledError:
+            module_logger.info(f'[{self.robot.name}-{self.robot.serial}] Intent {name} was cancelled')
+            raise
 
     def _on_object_observed(self, robot, event_type, event, evt):
         pass
@@ -81,66 +444,47 @@ class TaskManager:
         """
         Makes the robot perform a dance.
         """
-        self.cancel_current_task()
-        module_logger.debug(f'[{self.robot.name}-{self.robot.serial}] Starting intent_imperative_dance')
-        self._run_coroutine(self.robot.behavior.app_intent(intent='intent_imperative_dance'))
+        return self._replace_current_task('intent_imperative_dance', self.robot.behavior.app_intent, intent='intent_imperative_dance')
 
     def intent_system_sleep(self):
         """
         Makes the robot go to sleep.
         """
-        self.cancel_current_task()
-        module_logger.debug(f'[{self.robot.name}-{self.robot.serial}] Starting intent_system_sleep')
-        self._run_coroutine(self.robot.behavior.app_intent(intent='intent_system_sleep'))
+        return self._replace_current_task('intent_system_sleep', self.robot.behavior.app_intent, intent='intent_system_sleep')
 
     def intent_imperative_fetchcube(self):
         """
         Makes the robot fetch the cube.
         """
-        self.cancel_current_task()
-        module_logger.debug(f'[{self.robot.name}-{self.robot.serial}] Starting intent_imperative_fetchcube')
-        self._run_coroutine(self.robot.behavior.app_intent(intent='intent_imperative_fetchcube'))
+        return self._replace_current_task('intent_imperative_fetchcube', self.robot.behavior.app_intent, intent='intent_imperative_fetchcube')
 
     def intent_imperative_findcube(self):
         """
         Makes the robot find the cube.
         """
-
-        self.cancel_current_task()
-        module_logger.debug(f'[{self.robot.name}-{self.robot.serial}] Starting intent_imperative_findcube')
-        self._run_coroutine(self.robot.behavior.app_intent(intent='intent_imperative_findcube'))
+        return self._replace_current_task('intent_imperative_findcube', self.robot.behavior.app_intent, intent='intent_imperative_findcube')
 
     def intent_explore_start(self):
         """
         Starts the robot's exploration behavior.
         """
-
-        self.cancel_current_task()
-        module_logger.debug(f'[{self.robot.name}-{self.robot.serial}] Starting intent_explore_start')
-        self._run_coroutine(self.robot.behavior.app_intent(intent='intent_explore_start'))
+        return self._replace_current_task('intent_explore_start', self.robot.behavior.app_intent, intent='intent_explore_start')
 
 
     def intent_play_rollcube(self):
         """
         Makes the robot play by rolling the cube.
         """
-
-        self.cancel_current_task()
-        module_logger.debug(f'[{self.robot.name}-{self.robot.serial}] Starting intent_play_rollcube')
-        self._run_coroutine(self.robot.behavior.app_intent(intent='intent_play_rollcube'))
+        return self._replace_current_task('intent_play_rollcube', self.robot.behavior.app_intent, intent='intent_play_rollcube')
 
     def enter_charger(self):
         """
         Makes the robot go to the charger.
         """
-        self.cancel_current_task()
-        module_logger.debug(f'[{self.robot.name}-{self.robot.serial}] Starting behavior drive on charger')
-        self._run_coroutine(self.robot.behavior.drive_on_charger())
+        return self._replace_current_task('drive_on_charger', self.robot.behavior.drive_on_charger, resources=RESOURCES_MOTION)
 
     def leave_charger(self):
-        self.cancel_current_task()
-        module_logger.debug(f'[{self.robot.name}-{self.robot.serial}] Starting behavior drive off charger')
-        self._run_coroutine(self.robot.behavior.drive_off_charger())
+        return self._replace_current_task('drive_off_charger', self.robot.behavior.drive_off_charger, resources=RESOURCES_MOTION)
 
     def perform_random_task(self):
         """
@@ -163,14 +507,16 @@ class TaskManager:
         """
         Waits for the current task to complete.
         """
-        with self.task_lock:
-            if self.current_task:
-                try:
-                    result = self.current_task.result(timeout=timeout)
-                    return result
-                except asyncio.TimeoutError:
-                    print("Task timed out.")
-                except Exception as e:
-                    print(f"Task resulted in exception: {e}")
+        task = self.current_task
+        if task:
+            try:
+                result = task.future.result(timeout=timeout)
+                return result
+            except concurrent.futures.TimeoutError:
+                print("Task timed out.")
+            except concurrent.futures.CancelledError:
+                print("Task was cancelled.")
+            except Exception as e:
+                print(f"Task resulted in exception: {e}")
         return None
 
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Measures how RobotController scales with the number of robots.
+
+Starts N controllers against simulated robots (lib/robot_simulator.py), lets them run, and reports
+thread count, process CPU use, camera and detection frame rates and status poll latency per fleet size.
+With --mode both, each fleet size is run with threads per robot and again on a SharedRuntime.
+
+    python tools/controller_scaling.py --robots 1,8,32,64 --duration 20 --latency-ms 15 --jitter-ms 10 --mode both
+"""
+
+import argparse
+import json
+import os
+import resource
+import sys
+import threading
+import time
+
+root_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, root_path)
+
+from lib import robot_controller
+from lib.intent_controller import IntentLoader
+from lib.metrics_handler import CAMERA_FPS, DETECTION_FPS, STATUS_POLL_DURATION
+from lib.robot_simulator import SimulatedObjectDetector, SimulatedRobot, simulated_sdk_config
+from lib.shared_runtime import SharedRuntime
+
+
+def get_arguments():
+    parser = argparse.ArgumentParser(description='Measure RobotController scaling with simulated robots.')
+    parser.add_argument('--robots', default='1,4,16,32', help='Comma separated fleet sizes')
+    parser.add_argument('--duration', type=float, default=15, help='Seconds to run each fleet size')
+    parser.add_argument('--trace', help='Trace directory recorded with python -m lib.robot_simulator record')
+    parser.add_argument('--latency-ms', type=float, default=0, help='Simulated SDK call latency')
+    parser.add_argument('--jitter-ms', type=float, default=0, help='Simulated SDK call jitter')
+    parser.add_argument('--mode', choices=('threads', 'shared', 'both'), default='threads',
+                        help='Threads per robot, one SharedRuntime for all robots, or both')
+    parser.add_argument('--runtime-workers', type=int, default=8, help='Executor threads of the SharedRuntime')
+    parser.add_argument('--output', help='Also write the JSON report to this file')
+    return parser.parse_args()
+
+
+def cpu_seconds():
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+def mean(values):
+    return round(sum(values) / len(values), 2) if values else None
+
+
+def run_fleet(count, duration, trace, latency_ms, jitter_ms, intent_loader, runtime_workers=None):
+    threads_before = threading.active_count()
+    runtime = None
+    if runtime_workers:
+        runtime = SharedRuntime(workers=runtime_workers)
+        runtime.start()
+    controllers = []
+    for bot_config in simulated_sdk_config(count, trace, latency_ms, jitter_ms):
+        robot = SimulatedRobot(serial=bot_config['serial'], config=bot_config)
+        robot.connect()
+        controller = robot_controller.RobotController(robot, {}, intent_loader, runtime=runtime)
+        controller.start()
+        controllers.append(controller)
+
+    # Skip the first seconds while the frame rate gauges fill
+    time.sleep(min(2.0, duration / 4))
+    poll_before = {c.robot.serial: (STATUS_POLL_DURATION.labels(c.robot.serial).sum, STATUS_POLL_DURATION.labels(c.robot.serial).count)
+                   for c in controllers}
+    cpu_start, wall_start = cpu_seconds(), time.perf_counter()
+    time.sleep(duration)
+    cpu_used, wall = cpu_seconds() - cpu_start, time.perf_counter() - wall_start
+
+    serials = [c.robot.serial for c in controllers]
+    poll_ms = []
+    for serial in serials:
+        child = STATUS_POLL_DURATION.labels(serial)
+        total, polls = child.sum - poll_before[serial][0], child.count - poll_before[serial][1]
+        if polls:
+            poll_ms.append(total / polls * 1000)
+
+    result = {
+        'robots': count,
+        'mode': 'shared' if runtime else 'threads',
+        'threads': threading.active_count() - threads_before,
+        'cpu_percent': round(cpu_used / wall * 100, 1),
+        'camera_fps_per_robot': mean([CAMERA_FPS.labels(serial).value for serial in serials]),
+        'detection_fps_per_robot': mean([DETECTION_FPS.labels(serial).value for serial in serials]),
+        'status_poll_ms': mean(poll_ms),
+    }
+
+    for controller in controllers:
+        controller.stop()
+        controller.robot.disconnect()
+    if runtime:
+        runtime.stop()
+    return result
+
+
+def main():
+    args = get_arguments()
+    robot_controller.ObjectDetector = SimulatedObjectDetector
+    intent_loader = IntentLoader(os.path.join(root_path, 'var', 'intents'))
+    trace = os.path.abspath(args.trace) if args.trace else None
+
+    modes = ('threads', 'shared') if args.mode == 'both' else (args.mode,)
+
+    report = {
+        'latency_ms': args.latency_ms,
+        'jitter_ms': args.jitter_ms,
+        'fleets': [run_fleet(int(count), args.duration, trace, args.latency_ms, args.jitter_ms, intent_loader,
+                             args.runtime_workers if mode == 'shared' else None)
+                   for count in args.robots.split(',') for mode in modes],
+    }
+
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output)
+
+
+if __name__ == '__main__':
+    main()
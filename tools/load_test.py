@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+"""
+HTTP load test for vector_playground.
+
+Starts the app in-process against simulated robots (lib/robot_simulator.py), then drives a mix of
+camera polls, status polls, heartbeats and motor commands at increasing concurrency and prints
+throughput, p50/p99 latency and error rate per route as JSON.
+
+Clients authenticate with a bearer token, with a cookie session like a browser, or both in turn
+(--auth both), so the cost of the session lookup can be compared. Each level also reports how many
+sessions the server holds afterwards.
+
+    python tools/load_test.py --robots 2 --levels 1,4,16,32 --duration 10 --auth both --output var/load_test.json
+"""
+
+import argparse
+import configparser
+import importlib
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+import requests
+from werkzeug.serving import make_server
+
+root_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, root_path)
+
+from lib.robot_simulator import simulated_sdk_config
+
+TOKEN = 'load-test-token'
+
+# (weight, method, route template, url template)
+REQUEST_MIX = [
+    (50, 'GET', '/robots/<serial>/camera_feed', '/robots/{serial}/camera_feed'),
+    (20, 'GET', '/robots/<serial>/status', '/robots/{serial}/status'),
+    (10, 'POST', '/heartbeat/<serial>', '/heartbeat/{serial}'),
+    (10, 'GET', '/robots/<serial>/move_wheels', '/robots/{serial}/move_wheels?left={speed}&right={speed}'),
+    (5, 'GET', '/robots/<serial>/move_head', '/robots/{serial}/move_head?speed={small_speed}'),
+    (5, 'GET', '/robots/<serial>/move_lift', '/robots/{serial}/move_lift?speed={small_speed}'),
+]
+
+
+def get_arguments():
+    parser = argparse.ArgumentParser(description='Load test vector_playground against simulated robots.')
+    parser.add_argument('--robots', type=int, default=2, help='Number of simulated robots')
+    parser.add_argument('--levels', default='1,2,4,8,16,32', help='Comma separated concurrency levels')
+    parser.add_argument('--duration', type=float, default=10, help='Seconds to run each level')
+    parser.add_argument('--trace', help='Trace directory recorded with python -m lib.robot_simulator record')
+    parser.add_argument('--latency-ms', type=float, default=0, help='Simulated SDK call latency')
+    parser.add_argument('--jitter-ms', type=float, default=0, help='Simulated SDK call jitter')
+    parser.add_argument('--auth', choices=('token', 'cookie', 'both'), default='token',
+                        help='Authenticate clients with the bearer token, a cookie session, or each in turn')
+    parser.add_argument('--port', type=int, default=0, help='Port for the app (0 picks a free port)')
+    parser.add_argument('--output', help='Also write the JSON report to this file')
+    return parser.parse_args()
+
+
+def prepare_workdir(robot_count, trace=None, latency_ms=0, jitter_ms=0):
+    """
+    Creates a throwaway working directory with a config, an SDK config listing the simulated robots
+    and the repository's templates, static files and intents.
+    """
+    workdir = tempfile.mkdtemp(prefix='vector_load_test_')
+    etc_path = os.path.join(workdir, 'etc')
+    os.makedirs(etc_path)
+
+    sdk_config = configparser.ConfigParser()
+    for bot_config in simulated_sdk_config(robot_count, trace, latency_ms, jitter_ms):
+        sdk_config[bot_config.pop('serial')] = bot_config
+    with open(os.path.join(etc_path, 'sdk_config.ini'), 'w') as f:
+        sdk_config.write(f)
+
+    config = {
+        'log_level': 3,
+        'sdk_config_path': etc_path,
+        'session': {'type': 'memory', 'api_tokens': {TOKEN: 'load-test'}},
+    }
+    with open(os.path.join(etc_path, 'config.json'), 'w') as f:
+        json.dump(config, f)
+
+    shutil.copytree(os.path.join(root_path, 'var', 'intents'), os.path.join(workdir, 'var', 'intents'))
+    return workdir
+
+
+def start_app(port):
+    """
+    Imports vector_playground with the SDK robot and object detector swapped for simulated ones,
+    connects the robots and serves the app on a background thread.
+    """
+    from lib import robot_controller
+    from lib.robot_simulator import SimulatedObjectDetector, SimulatedRobot
+
+    robot_controller.ObjectDetector = SimulatedObjectDetector
+    playground = importlib.import_module('vector_playground')
+    playground.Robot = SimulatedRobot
+    playground.app.template_folder = os.path.join(root_path, 'templates')
+    playground.app.static_folder = os.path.join(root_path, 'static')
+
+    playground.initialize_robots()
+    playground.lease_manager.start()
+
+    server = make_server('127.0.0.1', port, playground.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    deadline = time.time() + 30
+    while len(playground.robot_registry) and time.time() < deadline:
+        if all(info['controller'] for info in playground.robot_registry.snapshot().values()):
+            break
+        time.sleep(0.1)
+    return playground, server
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def client_session(auth, cookies=None):
+    """
+    Returns an HTTP session that authenticates with the bearer token, or with the given session cookies.
+    """
+    http = requests.Session()
+    if auth == 'token':
+        http.headers['Authorization'] = f'Bearer {TOKEN}'
+    elif cookies is not None:
+        http.cookies.update(cookies)
+    return http
+
+
+def run_client(base_url, serials, stop_event, samples, auth, cookies):
+    http = client_session(auth, cookies)
+    weights = [entry[0] for entry in REQUEST_MIX]
+    while not stop_event.is_set():
+        _, method, route, url = random.choices(REQUEST_MIX, weights=weights)[0]
+        url = url.format(serial=random.choice(serials), speed=random.choice((0, 100, -100)), small_speed=random.choice((0, 2, -2)))
+        start = time.perf_counter()
+        try:
+            response = http.request(method, base_url + url, timeout=10)
+            error = response.status_code >= 400
+        except requests.RequestException:
+            error = True
+        samples.append((route, time.perf_counter() - start, error))
+
+
+def summarize(samples, duration):
+    routes = {}
+    for route, latency, error in samples:
+        routes.setdefault(route, []).append((latency, error))
+    routes['all'] = [(latency, error) for _, latency, error in samples]
+
+    summary = {}
+    for route, results in routes.items():
+        latencies = [latency * 1000 for latency, _ in results]
+        errors = sum(1 for _, error in results if error)
+        summary[route] = {
+            'requests': len(results),
+            'throughput_rps': round(len(results) / duration, 2),
+            'p50_ms': round(percentile(latencies, 0.50), 2) if latencies else None,
+            'p99_ms': round(percentile(latencies, 0.99), 2) if latencies else None,
+            'error_rate': round(errors / len(results), 4) if results else 0,
+        }
+    return summary
+
+
+def run_level(base_url, serials, concurrency, duration, auth, cookies, session_count):
+    samples = []
+    stop_event = threading.Event()
+    clients = [threading.Thread(target=run_client, args=(base_url, serials, stop_event, samples, auth, cookies), daemon=True)
+               for _ in range(concurrency)]
+    start = time.perf_counter()
+    for client in clients:
+        client.start()
+    time.sleep(duration)
+    stop_event.set()
+    for client in clients:
+        client.join()
+    return {
+        'auth': auth,
+        'concurrency': concurrency,
+        'duration': round(time.perf_counter() - start, 2),
+        'sessions': session_count(),
+        'routes': summarize(samples, duration),
+    }
+
+
+def main():
+    args = get_arguments()
+    levels = [int(level) for level in args.levels.split(',')]
+
+    trace = os.path.abspath(args.trace) if args.trace else None
+    workdir = prepare_workdir(args.robots, trace, args.latency_ms, args.jitter_ms)
+    os.chdir(workdir)
+    playground, server = start_app(args.port)
+    base_url = f'http://127.0.0.1:{server.server_port}'
+
+    serials = list(playground.robot_registry.snapshot().keys())
+    session_interface = playground.app.session_interface
+    session_count = lambda: len(session_interface.sessions) if hasattr(session_interface, 'sessions') else None
+
+    results = []
+    for auth in (('token', 'cookie') if args.auth == 'both' else (args.auth,)):
+        # One client takes control of every robot; with cookies, all clients then share its session like browser tabs
+        claim = client_session(auth)
+        for serial in serials:
+            claim.get(f'{base_url}/control/{serial}', timeout=10)
+        cookies = claim.cookies.get_dict() if auth == 'cookie' else None
+        results.extend(run_level(base_url, serials, concurrency, args.duration, auth, cookies, session_count)
+                       for concurrency in levels)
+        for serial in serials:
+            claim.post(f'{base_url}/release/{serial}', timeout=10)
+
+    report = {
+        'robots': len(serials),
+        'request_mix': {route: weight for weight, _, route, _ in REQUEST_MIX},
+        'levels': results,
+    }
+
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(os.path.join(root_path, args.output), 'w') as f:
+            f.write(output)
+
+    server.shutdown()
+    playground.shutdown = True
+    playground.lease_manager.stop()
+    playground.reconnect_scheduler.stop()
+    for info in playground.robot_registry.snapshot().values():
+        if info['controller']:
+            info['controller'].stop()
+    shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
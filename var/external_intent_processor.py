@@ -1,75 +1,77 @@
-import argparse
+#!/usr/bin/env python3
+# Called by wire-pod once per utterance (see system_intent.json). Sends the utterance to the running
+# Vector Playground server over its Unix socket and prints the JSON response.
+#
+# Only the standard library's socket, json, os and sys are imported so the client starts fast.
+
 import json
 import os
+import socket
 import sys
-import time
-
-from lib.config_handler import load_config_file
-from lib.intent_handler import process_intent
-from lib.logging_handler import CustomLogger
 
-##############
-# Setup App
-##############
 app_name = "external_intent_processor"
-__version__ = "1.0"
-start_time = time.time()
-vector_playground_url = ''
-
-def get_arguments():
-    # Set up argument parser with description and help text
-    parser = argparse.ArgumentParser(
-        description='Vector Internal Intent Processor. Processes user queries for a specific bot and language.'
-    )
-    parser.add_argument(
-        'bot_serial',
-        help='Bot serial number (required)',
-        type=str
-    )
-    parser.add_argument(
-        'locale',
-        help='Locale identifier (required, e.g., "en_US", "fr_FR")',
-        type=str
-    )
-    parser.add_argument(
-        'user_query',
-        help='User query to be processed (required)',
-        type=str
-    )
-
-    # Error handling if arguments are missing
-    if len(sys.argv) < 4:
-        parser.print_help()
-        sys.exit(1)
+__version__ = "2.0"
 
-    # Parse arguments
-    try:
-        args = parser.parse_args()
-    except argparse.ArgumentError as e:
-        print(f"Error: {e}")
-        parser.print_help()
-        sys.exit(1)
+USAGE = f"""usage: {os.path.basename(sys.argv[0])} [--wait SECONDS] bot_serial locale user_query
 
-    return args
+Vector Internal Intent Processor. Sends a user query for a specific bot and language to Vector Playground.
 
+positional arguments:
+  bot_serial       Bot serial number (required)
+  locale           Locale identifier (required, e.g., "en_US", "fr_FR")
+  user_query       User query to be processed (required)
 
-def intent_request(args):
-    url = f"{vector_playground_url}/{args.bot_serial}/{args.locale}/{args.user_query}"
+options:
+  --wait SECONDS   Wait up to SECONDS for the matched intent to finish and print its result
 
+environment:
+  VECTOR_PLAYGROUND_SOCKET  Path of the server's socket (default: intent.sock next to this script)
+"""
 
+default_socket_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'intent.sock')
 
-def main():
-    # Get passed arguments
-    args = get_arguments()
 
-    intents = load_intents()
+def get_arguments(argv):
+    wait = 0
+    if len(argv) >= 2 and argv[0] == '--wait':
+        try:
+            wait = float(argv[1])
+        except ValueError:
+            print(f"Error: --wait expects a number of seconds, got '{argv[1]}'", file=sys.stderr)
+            sys.exit(1)
+        argv = argv[2:]
+
+    if len(argv) != 3:
+        print(USAGE, file=sys.stderr)
+        sys.exit(1)
 
-    logger.info(args)
-    logger.debug(intents)
+    bot_serial, locale, user_query = argv
+    return {'bot_serial': bot_serial, 'locale': locale, 'user_query': user_query, 'wait': wait}
+
+
+def intent_request(request, socket_path):
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        client.connect(socket_path)
+        client.sendall(json.dumps(request).encode('utf-8') + b'\n')
+        with client.makefile('rb') as reader:
+            response = reader.readline()
+    if not response:
+        raise ConnectionError('Vector Playground closed the connection without a response')
+    return json.loads(response)
+
+
+def main():
+    request = get_arguments(sys.argv[1:])
+    socket_path = os.environ.get('VECTOR_PLAYGROUND_SOCKET', default_socket_path)
+
+    try:
+        response = intent_request(request, socket_path)
+    except (OSError, ValueError) as e:
+        response = {'success': False, 'error': f'Vector Playground is not reachable at {socket_path}: {e}'}
 
-    intent_result = process_intent(intents, args.bot_serial, args.locale, args.user_query)
+    print(json.dumps(response))
+    sys.exit(0 if response.get('success') else 1)
 
-    logger.info(f"Took {time.time() - start_time} seconds")
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
@@ -3,8 +3,12 @@ import logging
 
 import ephem
 
+from lib.intent_cache import cached
+
 intent_logger = logging.getLogger('vector_playground.moon_phase')
 
+# The phase name changes about once every few days, so an hour old answer is still right
+@cached(ttl=3600)
 def calculate_moon_phase():
     moon = ephem.Moon()
     moon.compute()
@@ -1,6 +1,8 @@
 # vector_playground.py (main script)
 
+import concurrent.futures
 import io
+import json
 import os
 import sys
 import traceback
@@ -9,11 +11,24 @@ import cv2
 from anki_vector import Robot
 from anki_vector.exceptions import VectorNotFoundException
 
+from lib import intent_cache
 from lib.config_handler import load_config_file, load_sdk_configuration, module_logger
 from lib.intent_controller import IntentLoader
+from lib.intent_executor import EXECUTION_SUCCEEDED, FINISHED_STATES, IntentExecutor, QueueFullError
+from lib.intent_sandbox import IntentSandbox
+from lib.intent_socket_server import IntentSocketServer
+from lib.intent_telemetry import TELEMETRY
+from lib.lease_manager import LeaseManager
 from lib.logging_handler import CustomLogger
+from lib.metrics_handler import HTTP_REQUEST_DURATION, HTTP_REQUESTS, REGISTRY
+from lib.reconnect_scheduler import ReconnectScheduler
+from lib.request_profiler import RequestProfiler
 from lib.robot_controller import RobotController
-from flask import Flask, jsonify, request, render_template, session, redirect, url_for, send_file
+from lib.robot_registry import RobotRegistry, ROBOT_AVAILABLE, ROBOT_CONTROLLED, ROBOT_DISCONNECTED
+from lib.session_handler import MemorySessionInterface
+from lib.shared_runtime import SharedRuntime
+from lib.static_assets import StaticAssets
+from flask import Flask, Response, g, jsonify, request, render_template, session, redirect, url_for, send_file
 from flask_session import Session
 import uuid
 import time
@@ -74,13 +89,32 @@ except Exception as e:
     logger.error(f'Unexpected error while <<loading>> Vector SDK configuration : {e}')
     sys.exit(1)
 
+# Persistent intent result caches are saved here
+intent_cache.configure(os.path.join(var_path, 'cache', 'intents'))
+
+# Worker processes for intents marked "sandbox": true
+sandbox_workers = config_data.get("intent_sandbox", {}).get("workers", 2)
+intent_sandbox = IntentSandbox(workers=sandbox_workers) if sandbox_workers else None
+
 try:
-    intent_loader = IntentLoader()
+    matching_config = config_data.get("intent_matching", {})
+    loading_config = config_data.get("intent_loading", {})
+    intent_loader = IntentLoader(
+        fuzzy_threshold=matching_config.get("fuzzy_threshold", 0.45) if matching_config.get("fuzzy", False) else None,
+        cache_dir=os.path.join(var_path, 'cache'),
+        workers=loading_config.get("workers", 4),
+        sandbox=intent_sandbox
+    )
+    if loading_config.get("warm_up", False):
+        intent_loader.warm_up()
     logger.warning(intent_loader.user_intents)
 except Exception as e:
     logger.error(e)
 app = Flask(__name__, template_folder='templates', static_folder='static')
 
+# Hashed, precompressed assets built by lib/static_assets.py
+static_assets = StaticAssets(app)
+
 if not os.getenv('SECRET_KEY'):
     try:
         with open(os.path.join(config_path, 'secret_key'), 'rb') as f:
@@ -94,9 +128,8 @@ else:
     app.config['SECRET_KEY'] = os.getenv('SECRET_KEY')
 
 # Session Configuration
-app.config['SESSION_TYPE'] = 'filesystem'
-# app.config['SESSION_PERMANENT'] = False
-# app.config['SESSION_USE_SIGNER'] = True
+session_config = config_data.get("session", {})
+session_type = session_config.get("type", "memory")
 
 # Cookie Configuration
 # app.config['SESSION_COOKIE_SECURE'] = config_data["general"]["cookie_secure"]
@@ -107,76 +140,124 @@ app.config['SESSION_TYPE'] = 'filesystem'
 # app.config['SESSION_COOKIE_SAMESITE'] = 'Lax'
 
 # Initializing the session
-sess = Session()
-sess.init_app(app)
-
-# Global dictionary of controllers
-controllers = {}
-controllers_lock = threading.Lock()
-
-def heartbeat_monitor():
-    global shutdown
-    while True:
-        logger.debug(f'Running Heartbeat Loop')
-        current_time = time.time()
-        for serial, info in controllers.items():
-            if info['status'] == 'controlled' and info['user_id']:
-                if current_time - info['last_heartbeat'] > 10:  # Timeout in seconds
-                    logger.debug(f"Releasing robot {serial} due to inactivity")
-                    info['status'] = 'available'
-                    info['user_id'] = None
-        if shutdown:
-            break
-        time.sleep(5)
-
-def robot_reconnector():
-    global shutdown
-    logger.info("Starting Robot Reconnector")
-    while True:
-        with controllers_lock:
-            for serial, info in controllers.items():
-                if info['status'] == 'disconnected':
-                    if info.get("connect_tries") >= 5 and (time.time() - info.get("last_connect_try", time.time()) > 120):
-                        controllers[serial]['connect_tries'] = 0
-                        controllers[serial]['last_connect_try'] = 0
-                        try_connection = True
-                    elif info.get("connect_tries") <= 5 and (time.time() - info.get("last_connect_try", time.time()) > 30):
-                        try_connection = True
-                    else:
-                        try_connection = False
-
-                    if try_connection:
-                        module_logger.info(f"Trying to reconnect to {info.get('name')} {info.get('serial')}")
-                        threading.Thread(target=connect_robot, args=(info.get('bot_config', {}),)).start()
-
-        if shutdown:
-            break
-        time.sleep(5)
+if session_type == 'filesystem':
+    app.config['SESSION_TYPE'] = 'filesystem'
+    # app.config['SESSION_PERMANENT'] = False
+    # app.config['SESSION_USE_SIGNER'] = True
+    sess = Session()
+    sess.init_app(app)
+else:
+    sqlite_path = session_config.get("sqlite_path")
+    if sqlite_path and not os.path.isabs(sqlite_path):
+        sqlite_path = os.path.join(root_path, sqlite_path)
+    app.session_interface = MemorySessionInterface(
+        sqlite_path=sqlite_path,
+        api_tokens=session_config.get("api_tokens"),
+        max_sessions=session_config.get("max_sessions", 10000)
+    )
+logger.info(f"Using {session_type} session backend")
+
+# Token clients allowed to use the /admin routes
+admin_user_ids = {f"token:{name}" for name in config_data.get("admin_clients", [])}
+
+# Token clients allowed to queue intents on any robot through /robots/<serial>/intent_request
+intent_client_ids = {f"token:{name}" for name in config_data.get("intent_clients", [])}
+
+# On-demand request profiling, off until enabled through /admin/profiling
+request_profiler = RequestProfiler(
+    os.path.join(var_path, 'profiles'),
+    interval=config_data.get("profiling", {}).get("interval", 0.001),
+    max_stored=config_data.get("profiling", {}).get("max_stored", 200)
+)
+
+# Registry of robots and their controllers
+robot_registry = RobotRegistry()
+
+# Per-intent timing and outcomes, served by /admin/intents/telemetry
+telemetry_config = config_data.get("intent_telemetry", {})
+TELEMETRY.configure(
+    window=telemetry_config.get("window", 500),
+    slow_threshold=telemetry_config.get("slow_threshold", 10),
+    max_slow_samples=telemetry_config.get("max_slow_samples", 50)
+)
+
+# Runs intents off the request threads, queued per robot
+execution_config = config_data.get("intent_execution", {})
+intent_executor = IntentExecutor(
+    max_workers=execution_config.get("max_workers", 8),
+    per_robot_limit=execution_config.get("per_robot_limit", 1),
+    default_timeout=execution_config.get("default_timeout", 60),
+    max_queued=execution_config.get("max_queued", 50),
+    dedup_window=execution_config.get("dedup_window", 2.0),
+    slow_threshold=TELEMETRY.slow_threshold,
+    on_slow=TELEMETRY.sample_slow_run,
+    on_finished=TELEMETRY.record_run
+)
+
+# Unix socket the wire-pod intent processor sends utterances to
+intent_socket_path = config_data.get("intent_socket", {}).get("path", os.path.join(var_path, 'intent.sock'))
+
+# One event loop and executor for all robots' control, status, camera and task loops instead of threads per robot
+shared_runtime_config = config_data.get("shared_runtime", {})
+shared_runtime = SharedRuntime(
+    workers=shared_runtime_config.get("workers", 8),
+    task_workers=shared_runtime_config.get("task_workers", 8)
+) if shared_runtime_config.get("enabled", False) else None
+
+# Control leases, renewed by heartbeats
+lease_manager = LeaseManager(lease_seconds=config_data.get("control_lease_seconds", 10))
+
+def handle_lease_expired(serial, user_id):
+    # Only release if the robot is still held by the user whose lease expired
+    released = robot_registry.compare_and_set(
+        serial,
+        {'status': ROBOT_CONTROLLED, 'user_id': user_id},
+        status=ROBOT_AVAILABLE,
+        user_id=None
+    )
+    if released:
+        logger.debug(f"Releasing robot {serial} due to inactivity")
+
+lease_manager.add_listener(handle_lease_expired)
 
 def handle_control_lost(serial):
     logger.warning(f"Handling control lost for robot {serial}")
-    with controllers_lock:
-        robot_info = controllers.get(serial)
-        if robot_info:
-            # Update robot status to unavailable
-            robot_info['status'] = 'disconnected'
-            robot_info['user_id'] = None
-            controllers[serial]['connect_tries'] = 0
-            controllers[serial]['last_connect_try'] = 0
-
-            # Stop the robot controller and disconnect the robot
-            controller = robot_info['controller']
-            if controller:
-                controller.stop()
-                logger.info(f"Controller stopped and robot disconnected for robot {serial}")
-        else:
-            logger.error(f"No robot info found for serial {serial}")
+    # Update robot status to disconnected
+    robot_info = robot_registry.update(serial, status=ROBOT_DISCONNECTED, user_id=None)
+    lease_manager.release(serial)
+    if robot_info:
+        # Stop the robot controller and disconnect the robot
+        controller = robot_info['controller']
+        if controller:
+            controller.stop()
+            logger.info(f"Controller stopped and robot disconnected for robot {serial}")
+        reconnect_scheduler.schedule(robot_info['bot_config'], delay=reconnect_scheduler.base_delay)
+    else:
+        logger.error(f"No robot info found for serial {serial}")
 
-def connect_robot(bot_config):
+def _record_connect_failure(robot, robot_serial, robot_name, bot_config):
+    try:
+        # Release the channel the failed attempt opened so retries don't pile them up
+        robot.disconnect()
+    except Exception as e:
+        logger.debug(f"Ignoring error while cleaning up failed connection to {robot_serial}: {e}")
+
+    updated = robot_registry.update(robot_serial, status=ROBOT_DISCONNECTED, user_id=None)
+    if updated is None:
+        robot_registry.put(
+            robot_serial,
+            controller=None,
+            name=robot_name,
+            status=ROBOT_DISCONNECTED,
+            user_id=None,
+            bot_config=bot_config
+        )
+
+def connect_robot(bot_config, timeout=10):
     global shutdown
 
     if shutdown:
-        return
+        return False
 
     robot_serial = bot_config.get("serial")
     robot_name = bot_config.get("name")
@@ -186,84 +267,224 @@ def connect_robot(bot_config):
     robot.serial = robot_serial
     robot.name = robot_name
     try:
-        robot.connect()
-        controller = RobotController(robot, config_data, intent_loader, on_control_lost_callback=handle_control_lost)
-
-        controllers[robot_serial] = {
-            'controller': controller,
-            'serial': robot_serial,
-            'name': robot_name,
-            'status': 'available',
-            'user_id': None,
-            'connect_tries': 0,
-            'last_connect_try': time.time(),
-            'last_heartbeat': time.time(),
-            'bot_config': bot_config
-        }
+        robot.connect(timeout=timeout)
+        controller = RobotController(robot, config_data, intent_loader, on_control_lost_callback=handle_control_lost,
+                                     runtime=shared_runtime)
+
+        robot_registry.put(
+            robot_serial,
+            controller=controller,
+            name=robot_name,
+            status=ROBOT_AVAILABLE,
+            user_id=None,
+            bot_config=bot_config
+        )
         controller.start()
         logger.info(f"Connected to robot {robot_name} {robot_serial}")
+        return True
     except VectorNotFoundException as e:
         if 'Unable to establish a connection to Vector.' in str(e):
             e = 'Unable to establish a connection to Vector.'
         logger.error(f"Could not connect to robot {robot_name} {robot_serial}: {e}")
-        if robot_serial in controllers:
-            controllers[robot_serial]['status'] = 'disconnected'
-            controllers[robot_serial]['user_id'] = None
-            controllers[robot_serial]['connect_tries'] += 1
-            controllers[robot_serial]['last_connect_try'] = time.time()
-        else:
-            controllers[robot_serial] = {
-                'controller': None,
-                'serial': robot_serial,
-                'name': robot_name,
-                'status': 'disconnected',
-                'user_id': None,
-                'last_heartbeat': None,
-                'connect_tries': 0,
-                'last_connect_try': time.time(),
-                'bot_config': bot_config
-            }
+        _record_connect_failure(robot, robot_serial, robot_name, bot_config)
     except Exception as e:
         if 'Failed to get control of Vector.' in str(e):
             message = f'Failed to get control of Vector: {robot.name} {robot_serial}'
         else:
             message = f"An unexpected error occurred while connecting to robot {robot.name} {robot_serial}: {e}"
         logger.error(message)
-        if robot_serial in controllers:
-            controllers[robot_serial]['status'] = 'disconnected'
-            controllers[robot_serial]['user_id'] = None
-            controllers[robot_serial]['connect_tries'] += 1
-            controllers[robot_serial]['last_connect_try'] = time.time()
-        else:
-            controllers[robot_serial] = {
-                'controller': None,
-                'serial': robot_serial,
-                'name': robot_name,
-                'status': 'disconnected',
-                'user_id': None,
-                'last_heartbeat': None,
-                'connect_tries': 0,
-                'last_connect_try': time.time(),
-                'bot_config': bot_config
-            }
+        _record_connect_failure(robot, robot_serial, robot_name, bot_config)
+    return False
+
+# Connection attempts, shared by startup and reconnection
+reconnect_config = config_data.get("reconnect", {})
+reconnect_scheduler = ReconnectScheduler(
+    connect_robot,
+    max_workers=reconnect_config.get("max_workers", 4),
+    base_delay=reconnect_config.get("base_delay", 5),
+    max_delay=reconnect_config.get("max_delay", 120),
+    jitter=reconnect_config.get("jitter", 0.5),
+    connect_timeout=reconnect_config.get("connect_timeout", 10)
+)
 
 def initialize_robots():
 
-    # Initialize each robot and its controller
+    # Initialize each robot and its controller, at most max_workers at a time
     for bot_config in sdk_config_data:
-        threading.Thread(target=connect_robot, args=(bot_config,)).start()
+        robot_registry.put(
+            bot_config.get("serial"),
+            controller=None,
+            name=bot_config.get("name"),
+            status=ROBOT_DISCONNECTED,
+            user_id=None,
+            bot_config=bot_config
+        )
+        reconnect_scheduler.schedule(bot_config)
+    reconnect_scheduler.start()
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+    if request_profiler.enabled and request.url_rule and request_profiler.should_profile(request.url_rule.rule):
+        g.profile_sampler = request_profiler.start()
+
+@app.teardown_request
+def finish_request_profile(exception):
+    sampler = g.pop('profile_sampler', None)
+    if sampler is not None:
+        request_profiler.finish(sampler, request.url_rule.rule)
+
+# endpoint -> method -> (route, duration histogram child, {status code: request counter child})
+route_metrics = {}
+
+def _add_route_metrics(endpoint, route, method):
+    metrics = (route, HTTP_REQUEST_DURATION.labels(route, method), {})
+    route_metrics.setdefault(endpoint, {})[method] = metrics
+    return metrics
+
+def register_route_metrics():
+    """
+    Creates the request metric children for every route up front, so a request only does dictionary lookups.
+    """
+    for rule in app.url_map.iter_rules():
+        for method in rule.methods:
+            _add_route_metrics(rule.endpoint, rule.rule, method)
+
+@app.after_request
+def record_request_metrics(response):
+    start = g.get('request_start')
+    if start is not None:
+        metrics = route_metrics.get(request.endpoint, {}).get(request.method)
+        if metrics is None:
+            route = request.url_rule.rule if request.url_rule else 'unmatched'
+            metrics = _add_route_metrics(request.endpoint, route, request.method)
+        route, duration, counts = metrics
+        duration.observe(time.perf_counter() - start)
+        count = counts.get(response.status_code)
+        if count is None:
+            count = counts[response.status_code] = HTTP_REQUESTS.labels(route, request.method, response.status_code)
+        count.inc()
+    return response
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    return Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
+def is_admin():
+    return session.get('user_id') in admin_user_ids
+
+@app.route('/admin/profiling', methods=['GET', 'POST', 'DELETE'])
+def admin_profiling():
+    if not is_admin():
+        return jsonify({'error': 'Forbidden'}), 403
+
+    if request.method == 'POST':
+        profile_data = request.get_json(silent=True) or {}
+        route = profile_data.get('route')
+        if route not in {rule.rule for rule in app.url_map.iter_rules()}:
+            return jsonify({'error': 'Unknown route'}), 400
+        try:
+            fraction = float(profile_data.get('fraction', 1.0))
+            max_profiles = int(profile_data.get('max_profiles', 10))
+        except (TypeError, ValueError):
+            return jsonify({'error': 'Malformed request.'}), 400
+        if not (0 < fraction <= 1) or max_profiles < 1:
+            return jsonify({'error': 'Malformed request.'}), 400
+        request_profiler.enable(route, fraction, max_profiles)
+    elif request.method == 'DELETE':
+        request_profiler.disable()
+
+    return jsonify(request_profiler.status())
+
+@app.route('/admin/profiles', methods=['GET'])
+def admin_list_profiles():
+    if not is_admin():
+        return jsonify({'error': 'Forbidden'}), 403
+    return jsonify({'profiles': request_profiler.list_profiles()})
+
+@app.route('/admin/profiles/<name>', methods=['GET'])
+def admin_get_profile(name):
+    if not is_admin():
+        return jsonify({'error': 'Forbidden'}), 403
+    path = request_profiler.profile_path(name)
+    if path is None:
+        return jsonify({'error': 'Profile not found'}), 404
+    return send_file(path, mimetype='text/plain', as_attachment=True, download_name=name)
+
+@app.route('/admin/leases', methods=['GET'])
+def admin_leases():
+    if not is_admin():
+        return jsonify({'error': 'Forbidden'}), 403
+    leases = {}
+    for serial in robot_registry.snapshot():
+        user_id = lease_manager.holder(serial)
+        if user_id is not None:
+            leases[serial] = {'user_id': user_id, 'remaining': lease_manager.remaining(serial)}
+    return jsonify({'leases': leases, 'expired': lease_manager.recent_events()}), 200
+
+@app.route('/admin/intents', methods=['GET'])
+def admin_list_intents():
+    if not is_admin():
+        return jsonify({'error': 'Forbidden'}), 403
+    intents = []
+    requirements = intent_loader.installer.status()
+    for intent_name, intent in sorted(intent_loader.loaded.items()):
+        intents.append({
+            'name': intent.get('name'),
+            'directory': intent_name,
+            'available': intent_loader.is_available(intent),
+            'requirements': requirements.get(intent_name, {'state': 'installed'}),
+            'imported': intent['module'].is_loaded,
+            'sandbox': bool(intent.get('sandbox')),
+            'load_times_ms': intent_loader.load_times.get(intent_name, {}),
+        })
+    response = {'intents': intents}
+    if intent_sandbox is not None:
+        response['sandbox'] = intent_sandbox.status()
+    return jsonify(response), 200
+
+@app.route('/admin/intents/cache', methods=['GET', 'DELETE'])
+def admin_intent_cache():
+    if not is_admin():
+        return jsonify({'error': 'Forbidden'}), 403
+    if request.method == 'DELETE':
+        name = request.args.get('name')
+        caches = [cache for cache in intent_cache.cache_stats() if name is None or cache['name'] == name]
+        if name is not None and not caches:
+            return jsonify({'error': 'Cache not found'}), 404
+        for cache in caches:
+            intent_cache.get_cache(cache['name']).clear()
+    return jsonify({'caches': intent_cache.cache_stats()}), 200
+
+@app.route('/admin/intents/telemetry', methods=['GET', 'DELETE'])
+def admin_intent_telemetry():
+    if not is_admin():
+        return jsonify({'error': 'Forbidden'}), 403
+    if request.method == 'DELETE':
+        TELEMETRY.reset()
+    return jsonify(TELEMETRY.snapshot()), 200
+
+@app.route('/admin/intents/reload', methods=['POST'])
+def admin_reload_intents():
+    if not is_admin():
+        return jsonify({'error': 'Forbidden'}), 403
+    changes = intent_loader.reload_changed(retry_failed=True)
+    return jsonify({'changes': changes, 'intents': [intent.get('name') for intent in intent_loader.user_intents]}), 200
+
+# Endpoints scraped or polled by tools rather than browsers; giving them sessions would only pile up unused ones
+SESSIONLESS_ENDPOINTS = {'metrics', 'static', 'assets'}
 
 @app.before_request
 def ensure_user_id():
+    if request.endpoint in SESSIONLESS_ENDPOINTS:
+        return
     if 'user_id' not in session:
         session['user_id'] = str(uuid.uuid4())  # Generate a new UUID for the session
         logger.info(f"New session started with user_id: {session['user_id']}")
-    else:
-        logger.debug(f"Session already has user_id: {session['user_id']}")
 @app.route('/')
 def index():
     robot_list = []
-    for serial, info in controllers.items():
+    for serial, info in robot_registry.snapshot().items():
         robot_list.append({
             'serial': serial,
             'status': info['status']
@@ -272,58 +493,72 @@ def index():
 
 @app.route('/control/<serial>', methods=['GET'])
 def control_robot(serial):
-    robot_info = controllers.get(serial)
+    robot_info = robot_registry.get(serial)
     if not robot_info:
         return "Robot not found", 404
 
     logger.debug(robot_info)
 
-    if robot_info['status'] == 'controlled' and robot_info['user_id'] != session.get('user_id'):
-        return "Robot is currently controlled by another user", 403
-
-    if robot_info['status'] == 'disconnected' or robot_info["status"] == "unavailable":
-        return "Robot is currently disconnected.", 404
-
     # Assign robot to the user
     session['user_id'] = session.get('user_id') or str(uuid.uuid4())
-    robot_info['status'] = 'controlled'
-    robot_info['user_id'] = session['user_id']
-    robot_info['last_heartbeat'] = time.time()
+    user_id = session['user_id']
+    claimed = robot_registry.compare_and_set(
+        serial,
+        {'status': (ROBOT_AVAILABLE, ROBOT_CONTROLLED), 'user_id': (None, user_id)},
+        status=ROBOT_CONTROLLED,
+        user_id=user_id
+    )
+
+    if not claimed:
+        robot_info = robot_registry.get(serial)
+        if robot_info['status'] == ROBOT_CONTROLLED:
+            return "Robot is currently controlled by another user", 403
+        return "Robot is currently disconnected.", 404
+
+    lease_manager.acquire(serial, user_id)
 
     return render_template('control.html', serial=serial)
 
 @app.route('/heartbeat/<serial>', methods=['POST'])
 def heartbeat(serial):
-    robot_info = controllers.get(serial)
+    robot_info = robot_registry.get(serial)
     if not robot_info:
         return jsonify({'error': 'Robot not found'}), 404
 
-    if robot_info['user_id'] != session.get('user_id'):
+    # Extend the control lease
+    if not lease_manager.renew(serial, session.get('user_id')):
         return jsonify({'error': 'You are not controlling this robot'}), 403
 
-    # Update the last heartbeat time
-    robot_info['last_heartbeat'] = time.time()
     return jsonify({'status': 'ok'})
 
 @app.route('/release/<serial>', methods=['POST'])
 def release_robot(serial):
-    robot_info = controllers.get(serial)
+    robot_info = robot_registry.get(serial)
     if not robot_info:
         return jsonify({'error': 'Robot not found'}), 404
 
-    if robot_info['user_id'] == session.get('user_id'):
-        robot_info['status'] = 'available'
-        robot_info['user_id'] = None
+    released = robot_registry.compare_and_set(
+        serial,
+        {'status': ROBOT_CONTROLLED, 'user_id': session.get('user_id')},
+        status=ROBOT_AVAILABLE,
+        user_id=None
+    )
+    if released:
+        lease_manager.release(serial, session.get('user_id'))
     return jsonify({'status': 'released'})
 
 @app.route('/robots', methods=['GET'])
 def get_robots():
-    robot_list = list(controllers.keys())
+    robot_list = list(robot_registry.snapshot().keys())
     return jsonify({'robots': robot_list})
 
+@app.route('/robots/connection_status', methods=['GET'])
+def get_connection_status():
+    return jsonify(reconnect_scheduler.status())
+
 @app.route('/robots/<serial>/status', methods=['GET'])
 def get_robot_status(serial):
-    robot_info = controllers.get(serial)
+    robot_info = robot_registry.get(serial)
     if not robot_info:
         return "Robot not found", 404
 
@@ -340,7 +575,7 @@ def get_robot_status(serial):
 
 @app.route('/robots/<serial>/camera_feed')
 def camera_feed(serial):
-    robot_info = controllers.get(serial)
+    robot_info = robot_registry.get(serial)
     if not robot_info:
         return "Robot not found", 404
 
@@ -353,7 +588,9 @@ def camera_feed(serial):
     image = controller.camera_stream.latest_image
     if image is not None:
         # Encode the image as JPEG
+        encode_start = time.perf_counter()
         ret, jpeg = cv2.imencode('.jpg', image)
+        controller.camera_stream.jpeg_encode_metric.observe(time.perf_counter() - encode_start)
         if ret:
             img_io = io.BytesIO(jpeg.tobytes())
             img_io.seek(0)
@@ -365,8 +602,7 @@ def camera_feed(serial):
 
 @app.route('/robots/<serial>/user_intent', methods=['GET'])
 def api_user_intent(serial):
-    intent_to_run = None
-    robot_info = controllers.get(serial)
+    robot_info = robot_registry.get(serial)
     intent = request.args.get('intent')
     user_query = request.args.get('query')
 
@@ -382,35 +618,264 @@ def api_user_intent(serial):
     if intent is None or user_query is None:
         return jsonify({'success': False, 'message': 'Missing required parameters.'}), 400
 
+    intent_to_run = next((user_intent for user_intent in intent_loader.user_intents if user_intent.get('name') == intent), None)
+    if intent_to_run is None:
+        return jsonify({'success': False, 'message': f"Unknown intent '{intent}'"}), 404
+    if not intent_loader.is_available(intent_to_run):
+        return jsonify({'success': False, 'message': f"The intent '{intent}' is waiting for its requirements to install."}), 503
+
     try:
-        for user_intent in intent_loader.user_intents:
-            if user_intent.get('name') == intent:
-                intent_to_run = user_intent
-                break
-
-        if intent_to_run:
-            controller.intent_controller.run_user_intent(intent_to_run, user_query)
-            return jsonify({'success': True}), 200
-    except Exception as e:
-        module_logger.exception(e)
-        traceback.print_exc()
-        return jsonify({'success': False, 'message': str(e)}), 500
+        execution = submit_intent(serial, controller, intent_to_run, user_query)
+    except RuntimeError as e:
+        return jsonify({'success': False, 'message': str(e)}), 503
+
+    return jsonify({
+        'success': True,
+        'execution_id': execution.id,
+        'status_url': url_for('api_intent_execution', serial=serial, execution_id=execution.id)
+    }), 202
+
+def submit_intent(serial, controller, intent_data, user_query):
+    """
+    Queues an intent on the executor. If it times out or is cancelled while running, the robot's motors are stopped.
+    """
+    return intent_executor.submit(
+        serial,
+        intent_data.get('name'),
+        user_query,
+        controller.intent_controller.start_user_intent,
+        (intent_data, user_query),
+        timeout=intent_data.get('timeout'),
+        on_abort=lambda execution: controller.movement_controller.control_stop_all()
+    )
+
+# Longest an intent request may wait for its intent to finish
+INTENT_REQUEST_MAX_WAIT = 30
+
+def queue_intent_request(serial, controller, user_query, locale=None, priority=0, wait=0):
+    """
+    Matches a query against the robot's intents and queues the match. The same query for the same robot
+    within intent_execution.dedup_window seconds joins the earlier execution instead of running again.
+    :param wait: Seconds to wait for the intent to finish before responding.
+    :return: (response dictionary, HTTP status)
+    """
+    matched_intent, score, method = controller.intent_controller.match_intent_scored(user_query)
+    if matched_intent is None:
+        return {'success': True, 'matched': False, 'queue': intent_executor.queue_stats(serial)}, 200
+
+    try:
+        execution, duplicate = intent_executor.submit_request(
+            serial,
+            matched_intent.get('name'),
+            user_query,
+            controller.intent_controller.start_user_intent,
+            (matched_intent, user_query),
+            timeout=matched_intent.get('timeout'),
+            on_abort=lambda execution: controller.movement_controller.control_stop_all(),
+            priority=priority,
+            dedup_key=' '.join(user_query.lower().split())
+        )
+    except QueueFullError as e:
+        return {'success': False, 'error': str(e), 'queue': intent_executor.queue_stats(serial)}, 429
+    except RuntimeError as e:
+        return {'success': False, 'error': str(e)}, 503
+    logger.info(f"[{serial}] Intent request ({locale}) matched {matched_intent.get('name')}{' (duplicate)' if duplicate else ''}")
+
+    status = execution.to_dict()
+    deadline = time.monotonic() + wait
+    while status['state'] not in FINISHED_STATES and time.monotonic() < deadline:
+        latest = intent_executor.wait(execution.id, status['version'], deadline - time.monotonic())
+        if latest is None:
+            # Pruned from the executor's history, so its outcome is lost; report the last status seen
+            return {
+                'success': False,
+                'error': 'Execution expired',
+                'intent': matched_intent.get('name'),
+                'execution': status,
+                'queue': intent_executor.queue_stats(serial)
+            }, 410
+        status = latest
+
+    return {
+        'success': True,
+        'matched': True,
+        'intent': matched_intent.get('name'),
+        'method': method,
+        'score': round(score, 4),
+        'duplicate': duplicate,
+        'execution': status,
+        'queue': intent_executor.queue_stats(serial)
+    }, 200 if status['state'] in FINISHED_STATES else 202
+
+def _request_number(value, default, minimum, maximum):
+    """
+    Converts a request value to a number in [minimum, maximum], or raises ValueError.
+    """
+    value = float(default if value is None else value)
+    if not (minimum <= value <= maximum):
+        raise ValueError(f'must be between {minimum} and {maximum}')
+    return value
+
+def handle_external_intent(intent_request):
+    """
+    Handles an intent request from var/external_intent_processor.py, see queue_intent_request.
+    """
+    serial = intent_request.get('bot_serial')
+    user_query = intent_request.get('user_query')
+    if not serial or user_query is None:
+        return {'success': False, 'error': 'Missing bot_serial or user_query'}
+
+    robot_info = robot_registry.get(serial)
+    if not robot_info:
+        return {'success': False, 'error': 'Robot not found'}
+    controller = robot_info['controller']
+    if controller is None:
+        return {'success': False, 'error': 'Robot not connected'}
+
+    try:
+        priority = int(_request_number(intent_request.get('priority'), 0, -100, 100))
+        wait = _request_number(intent_request.get('wait'), 0, 0, INTENT_REQUEST_MAX_WAIT)
+    except (TypeError, ValueError) as e:
+        return {'success': False, 'error': f'Malformed request: {e}'}
+
+    response, _ = queue_intent_request(serial, controller, user_query, intent_request.get('locale'), priority, wait)
+    return response
+
+def _intent_execution_access(serial, execution_id=None):
+    """
+    Returns an error response if the caller may not see the robot's executions, otherwise None.
+    """
+    robot_info = robot_registry.get(serial)
+    if not robot_info:
+        return jsonify({'error': 'Robot not found'}), 404
+    if robot_info['user_id'] != session.get('user_id'):
+        return jsonify({'error': 'You are not controlling this robot'}), 403
+    if execution_id is not None:
+        execution = intent_executor.get(execution_id)
+        if execution is None or execution['serial'] != serial:
+            return jsonify({'error': 'Execution not found'}), 404
+    return None
+
+@app.route('/robots/<serial>/intents/executions', methods=['GET'])
+def api_intent_executions(serial):
+    error = _intent_execution_access(serial)
+    if error:
+        return error
+    return jsonify({'queue_depth': intent_executor.queue_depth(serial), 'executions': intent_executor.list(serial)}), 200
+
+@app.route('/robots/<serial>/intents/executions/<execution_id>', methods=['GET', 'DELETE'])
+def api_intent_execution(serial, execution_id):
+    """
+    GET returns an execution's status. With ?wait=<seconds>, waits for it to change past ?version=<n> or finish.
+    DELETE cancels it.
+    """
+    error = _intent_execution_access(serial, execution_id)
+    if error:
+        return error
+
+    if request.method == 'DELETE':
+        if not intent_executor.cancel(execution_id):
+            return jsonify({'success': False, 'message': 'Execution already finished'}), 409
+        return jsonify({'success': True, 'execution': intent_executor.get(execution_id)}), 200
 
-@app.route('/robots/<serial>/intent_request', methods=['POST'])
+    try:
+        wait = min(float(request.args.get('wait', 0)), 30)
+        version = int(request.args.get('version', -1))
+    except ValueError:
+        return jsonify({'error': 'Malformed request'}), 400
+    if wait > 0:
+        return jsonify(intent_executor.wait(execution_id, version, wait)), 200
+    return jsonify(intent_executor.get(execution_id)), 200
+
+@app.route('/robots/<serial>/intents/executions/<execution_id>/stream', methods=['GET'])
+def api_intent_execution_stream(serial, execution_id):
+    """
+    Streams an execution's status as server-sent events until it finishes.
+    """
+    error = _intent_execution_access(serial, execution_id)
+    if error:
+        return error
+
+    def generate():
+        version = -1
+        while True:
+            execution = intent_executor.wait(execution_id, version, 15)
+            if execution is None:
+                return
+            if execution['version'] > version:
+                version = execution['version']
+                yield f"event: status\ndata: {json.dumps(execution)}\n\n"
+            else:
+                yield ": keep-alive\n\n"
+            if execution['state'] in FINISHED_STATES:
+                return
+
+    return Response(generate(), mimetype='text/event-stream', headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/robots/<serial>/intent_request', methods=['GET', 'POST'])
 def api_intent_request(serial):
-    robot_info = controllers.get(serial)
+    robot_info = robot_registry.get(serial)
     if not robot_info:
         return jsonify({'error': 'Robot not found'}), 404
 
-    intent_data = request.get_json()
+    # Other processes on the host use the Unix socket; over HTTP they need an intent or admin API token
+    if robot_info['user_id'] != session.get('user_id') and not is_admin() and session.get('user_id') not in intent_client_ids:
+        return jsonify({'error': 'You are not controlling this robot'}), 403
+
+    if request.method == 'GET':
+        return jsonify({'queue': intent_executor.queue_stats(serial)}), 200
+
+    controller = robot_info['controller']
+    if controller is None:
+        return jsonify({'error': 'Robot not connected'}), 503
+
+    intent_data = request.get_json(silent=True)
     if not intent_data:
         return jsonify({'error': 'Invalid or missing JSON data'}), 400
 
+    user_query = intent_data.get('user_query', intent_data.get('query'))
+    if not isinstance(user_query, str) or not user_query.strip():
+        return jsonify({'error': 'Missing user_query'}), 400
+
+    try:
+        priority = int(_request_number(intent_data.get('priority'), 0, -100, 100))
+        wait = _request_number(intent_data.get('wait'), 0, 0, INTENT_REQUEST_MAX_WAIT)
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': f'Malformed request: {e}'}), 400
+
+    response, status_code = queue_intent_request(serial, controller, user_query, intent_data.get('locale'), priority, wait)
+    if status_code == 429:
+        return jsonify(response), 429, {'Retry-After': '1'}
+    return jsonify(response), status_code
+
+
+@app.route('/robots/<serial>/tasks', methods=['GET'])
+def api_tasks(serial):
+    robot_info = robot_registry.get(serial)
+    if not robot_info:
+        return jsonify({'error': 'Robot not found'}), 404
+    if robot_info['user_id'] != session.get('user_id'):
+        return jsonify({'error': 'You are not controlling this robot'}), 403
+    controller = robot_info['controller']
+    if controller is None:
+        return jsonify({'error': 'Robot not connected'}), 503
+    return jsonify({'tasks': controller.task_manager.list_tasks()}), 200
 
+@app.route('/robots/<serial>/tasks/<task_id>', methods=['DELETE'])
+def api_cancel_task(serial, task_id):
+    robot_info = robot_registry.get(serial)
+    if not robot_info:
+        return jsonify({'error': 'Robot not found'}), 404
+    if robot_info['user_id'] != session.get('user_id'):
+        return jsonify({'error': 'You are not controlling this robot'}), 403
+    controller = robot_info['controller']
+    if controller is None or not controller.task_manager.cancel(task_id):
+        return jsonify({'error': 'Task not found or already finished'}), 404
+    return jsonify({'success': True}), 202
 
 @app.route('/robots/<serial>/move_wheels', methods=['GET'])
 def api_move_wheels(serial):
-    robot_info = controllers.get(serial)
+    robot_info = robot_registry.get(serial)
     left_wheel = request.args.get('left')
     right_wheel = request.args.get('right')
 
@@ -443,7 +908,7 @@ def api_move_wheels(serial):
 
 @app.route('/robots/<serial>/move_lift', methods=['GET'])
 def api_move_lift(serial):
-    robot_info = controllers.get(serial)
+    robot_info = robot_registry.get(serial)
     speed = request.args.get('speed')
 
     if not robot_info:
@@ -474,7 +939,7 @@ def api_move_lift(serial):
 
 @app.route('/robots/<serial>/move_head', methods=['GET'])
 def api_move_head(serial):
-    robot_info = controllers.get(serial)
+    robot_info = robot_registry.get(serial)
     speed = request.args.get('speed')
 
     if not robot_info:
@@ -504,13 +969,165 @@ def api_move_head(serial):
     return jsonify({'success': False, 'message': f'Moving Head {speed}.'}), 200
 
 
+# Limits for /robots/<serial>/batch
+BATCH_MAX_STEPS = 100
+BATCH_MAX_DELAY = 10
+BATCH_TIMEOUT = 120
+BATCH_INTENT_QUEUE_GRACE = 10  # seconds a user_intent step may wait in the robot's queue on top of its timeout
+
+def _int_param(params, name, low, high):
+    value = params.get(name)
+    if value is None:
+        raise ValueError(f"Missing parameter '{name}'")
+    try:
+        value = int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"Parameter '{name}' must be an integer")
+    if not (low <= value <= high):
+        raise ValueError(f"Parameter '{name}' must be between {low} and {high}")
+    return value
+
+def _build_batch_step(controller, step):
+    """
+    Validates one batch step and turns it into a (name, func, args, delay) tuple for TaskManager.run_batch.
+    Raises ValueError if the step is malformed.
+    """
+    if not isinstance(step, dict):
+        raise ValueError('Step must be an object')
+
+    command = step.get('command')
+    params = step.get('params') or {}
+    if not isinstance(params, dict):
+        raise ValueError('params must be an object')
+
+    try:
+        delay = float(step.get('delay', 0))
+    except (TypeError, ValueError):
+        raise ValueError('delay must be a number')
+    if not (0 <= delay <= BATCH_MAX_DELAY):
+        raise ValueError(f'delay must be between 0 and {BATCH_MAX_DELAY} seconds')
+
+    movement = controller.movement_controller
+    if command == 'move_wheels':
+        args = (_int_param(params, 'left', -200, 200), _int_param(params, 'right', -200, 200))
+        return command, movement.control_move_wheels, args, delay
+    if command == 'move_lift':
+        return command, movement.control_move_lift, (_int_param(params, 'speed', -10, 10),), delay
+    if command == 'move_head':
+        return command, movement.control_move_head, (_int_param(params, 'speed', -10, 10),), delay
+    if command == 'stop_all':
+        return command, movement.control_stop_all, (), delay
+    if command == 'wait':
+        return command, lambda: None, (), delay
+    if command == 'user_intent':
+        intent_name = params.get('intent')
+        user_query = params.get('query')
+        if intent_name is None or user_query is None:
+            raise ValueError("Missing parameter 'intent' or 'query'")
+        intent_to_run = next((intent for intent in intent_loader.user_intents if intent.get('name') == intent_name), None)
+        if intent_to_run is None:
+            raise ValueError(f"Unknown intent '{intent_name}'")
+        if not intent_loader.is_available(intent_to_run):
+            raise ValueError(f"The intent '{intent_name}' is waiting for its requirements to install")
+        return command, _run_batch_intent, (controller, intent_to_run, user_query), delay
+
+    raise ValueError(f"Unknown command '{command}'")
+
+def _run_batch_intent(controller, intent_data, user_query):
+    """
+    Runs a batch's user_intent step through the intent executor, so it gets the robot's limit, timeout and
+    telemetry like any other intent, and waits for it to finish.
+    """
+    execution = submit_intent(controller.robot.serial, controller, intent_data, user_query)
+    deadline = time.monotonic() + execution.timeout + BATCH_INTENT_QUEUE_GRACE
+    status = execution.to_dict()
+    while status['state'] not in FINISHED_STATES:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            intent_executor.cancel(execution.id)
+            raise RuntimeError(f"Intent {status['intent']} did not finish within {execution.timeout}s")
+        status = intent_executor.wait(execution.id, status['version'], timeout=remaining)
+        if status is None:
+            raise RuntimeError(f"Intent {execution.intent_name} failed: its execution expired")
+    if status['state'] != EXECUTION_SUCCEEDED:
+        raise RuntimeError(f"Intent {status['intent']} {status['state']}: {status['error']}")
+    return status['result']
+
+@app.route('/robots/<serial>/batch', methods=['POST'])
+def api_batch(serial):
+    robot_info = robot_registry.get(serial)
+    if not robot_info:
+        return jsonify({'success': False, 'message': 'Robot not found.'}), 404
+
+    if robot_info['user_id'] != session.get('user_id'):
+        return jsonify({'success': False, 'message': 'You are not controlling this robot'}), 403
+
+    controller = robot_info['controller']
+    batch_data = request.get_json(silent=True)
+    if not batch_data or not isinstance(batch_data.get('commands'), list):
+        return jsonify({'success': False, 'message': 'Missing required parameters.'}), 400
+
+    commands = batch_data['commands']
+    if not commands or len(commands) > BATCH_MAX_STEPS:
+        return jsonify({'success': False, 'message': f'Batch must have between 1 and {BATCH_MAX_STEPS} commands.'}), 400
+
+    # Validate everything up front so a bad step never leaves the robot half way through a choreography
+    steps = []
+    for index, step in enumerate(commands):
+        try:
+            steps.append(_build_batch_step(controller, step))
+        except ValueError as e:
+            return jsonify({'success': False, 'message': f'Step {index}: {e}'}), 400
+
+    batch_start = time.perf_counter()
+    completed = []
+    task = controller.task_manager.run_batch(steps, stop_on_error=batch_data.get('stop_on_error', True), results=completed)
+    try:
+        results = task.future.result(timeout=BATCH_TIMEOUT)
+    except TimeoutError:
+        task.future.cancel()
+        return jsonify({'success': False, 'message': 'Batch timed out.', 'results': list(completed)}), 504
+    except concurrent.futures.CancelledError:
+        reason = 'preempted' if task.preempted_by else 'cancelled'
+        return jsonify({
+            'success': False,
+            'message': f'Batch was {reason}.',
+            'reason': reason,
+            'preempted_by': task.preempted_by,
+            'duration_ms': round((time.perf_counter() - batch_start) * 1000, 2),
+            'results': list(completed)
+        }), 409
+    except Exception as e:
+        logger.error(f"[{serial}] Batch failed: {e}")
+        return jsonify({'success': False, 'message': f'Batch failed: {e}', 'results': list(completed)}), 500
+
+    return jsonify({
+        'success': all(result['success'] for result in results) and len(results) == len(steps),
+        'duration_ms': round((time.perf_counter() - batch_start) * 1000, 2),
+        'results': results
+    }), 200
+
+
 def main():
     global shutdown
 
+    register_route_metrics()
+    if shared_runtime is not None:
+        shared_runtime.start()
     initialize_robots()
 
-    threading.Thread(target=heartbeat_monitor, daemon=True).start()
-    threading.Thread(target=robot_reconnector, daemon=True).start()
+    lease_manager.start()
+    intent_executor.start()
+    if intent_sandbox is not None:
+        intent_sandbox.start()
+    intent_socket_server = None
+    if intent_socket_path:
+        intent_socket_server = IntentSocketServer(os.path.join(root_path, intent_socket_path), handle_external_intent)
+        intent_socket_server.start()
+
+    intent_watch_interval = config_data.get("intent_watch_interval", 2)
+    if intent_watch_interval:
+        intent_loader.start_watching(intent_watch_interval)
 
     try:
         # Run the Flask app
@@ -519,11 +1136,30 @@ def main():
         shutdown = True
         pass
     finally:
+        lease_manager.stop()
+        reconnect_scheduler.stop()
+        intent_loader.stop_watching()
+        if intent_socket_server is not None:
+            intent_socket_server.stop()
+        intent_executor.stop()
+        intent_cache.flush_all()
+        if intent_sandbox is not None:
+            intent_sandbox.stop()
+
         # Stop all robots gracefully
-        for controller in controllers.values():
-            robot_controller = controller["controller"]
+        stop_threads = []
+        for robot_info in robot_registry.snapshot().values():
+            robot_controller = robot_info["controller"]
             if robot_controller:
-                threading.Thread(target=robot_controller.stop).start()
+                stop_thread = threading.Thread(target=robot_controller.stop)
+                stop_thread.start()
+                stop_threads.append(stop_thread)
+
+        if shared_runtime is not None:
+            # The controllers' jobs run on the runtime, so it goes last
+            for stop_thread in stop_threads:
+                stop_thread.join()
+            shared_runtime.stop()
 
 if __name__ == '__main__':
     main()
\ No newline at end of file